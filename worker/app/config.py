@@ -32,6 +32,7 @@ class Settings(BaseSettings):
     R2_SECRET_ACCESS_KEY: Optional[str] = None
     R2_BUCKET_NAME: str = "viralklip-videos"
     R2_PUBLIC_URL: Optional[str] = None
+    R2_ENDPOINT_URL: Optional[str] = None  # Override, e.g. a local S3-compatible server for tests
     
     @property
     def r2_configured(self) -> bool:
@@ -43,9 +44,111 @@ class Settings(BaseSettings):
     MAX_CLIP_DURATION: int = 60  # 1 minute
     DEFAULT_CLIP_COUNT: int = 10
     
+    # Rendering
+    RENDER_WORKERS: int = 0  # Concurrent encodes, 0 = size to available cores
+    RENDER_THREADS_PER_ENCODE: int = 2  # FFmpeg -threads cap per encode
+    RENDER_DECODE_ONCE: bool = True  # Decode each moment once for all aspect ratios
+    SMART_RENDER: bool = False  # Stream-copy between keyframes when no crop is needed
+    RENDER_NO_UPSCALE: bool = True  # Cap output size at the source's resolution
+    RENDER_SHARED_SPANS: bool = True  # Encode overlapping moments once, cut clips by stream copy
+    ENCODING_PROFILE: str = "auto"  # auto = pick by load and priority, or draft/standard/archival
+    ENCODING_BUSY_DEPTH: int = 3  # Other active jobs at which normal priority jobs render drafts
+    ENCODING_STALE_SECONDS: int = 3600  # Unfinished jobs idle longer than this (e.g. a dead worker's) are not load and can be resumed
+    THUMBNAIL_CANDIDATES: int = 5  # Frames sampled per moment, sharpest one wins
+    THUMBNAIL_SAMPLE_WIDTH: int = 320  # Width of the grayscale frames scored for sharpness
+    THUMBNAIL_WIDTH: int = 480
+    
+    # Scene detection
+    SCENE_DETECTION: bool = True  # Index shot cuts per source and snap clip edges to them
+    SCENE_SAMPLE_FPS: int = 10  # Frames per second compared (cut precision 1/fps)
+    SCENE_SAMPLE_WIDTH: int = 64  # Width of the grayscale frames compared
+    SCENE_THRESHOLD: float = 6.0  # Median absolute deviations above the local median
+    SCENE_MIN_DIFF: float = 12.0  # Minimum mean pixel change (0-255) for a cut
+    SCENE_MIN_LENGTH: float = 1.0  # Seconds between cuts
+    SCENE_SNAP_TOLERANCE: float = 1.0  # Max seconds a clip edge moves to reach a cut
+    
+    # External processes (ffmpeg/ffprobe)
+    MAX_CONCURRENT_PROCESSES: int = 0  # Global limit, 0 = number of cores
+    FFMPEG_TIMEOUT: int = 1800  # Seconds before a single process is killed
+    PROCESS_STDERR_LINES: int = 50  # Stderr lines kept for error reports
+    
+    # Uploads (R2)
+    UPLOAD_CONCURRENCY: int = 8  # Objects uploaded in parallel
+    UPLOAD_PART_CONCURRENCY: int = 4  # Parts in flight per multipart upload
+    UPLOAD_MULTIPART_THRESHOLD: int = 16 * 1024 ** 2  # Larger files use multipart
+    UPLOAD_MULTIPART_CHUNKSIZE: int = 8 * 1024 ** 2
+    UPLOAD_MAX_ATTEMPTS: int = 4  # Per object, with exponential backoff
+    UPLOAD_RETRY_DELAY: float = 1.0  # First backoff delay in seconds
+    UPLOAD_QUEUE_SIZE: int = 8  # Rendered clips waiting for upload before rendering pauses
+    UPLOAD_CLIP_WORKERS: int = 3  # Clips uploaded at once from the render queue (3 objects each)
+    
+    # Source downloads
+    DOWNLOAD_CONNECTIONS: int = 4  # Parallel Range requests per file
+    DOWNLOAD_SEGMENT_BYTES: int = 8 * 1024 ** 2  # Range request size
+    DOWNLOAD_BUFFER_BYTES: int = 1024 ** 2  # Bytes buffered per disk write
+    DOWNLOAD_MAX_RETRIES: int = 3  # Per segment, resuming from the last byte written
+    PARTIAL_SOURCE_FETCH: bool = False  # Download audio only, clip from the remote video URL
+    
+    # Audio preparation for transcription
+    AUDIO_FORMAT: str = "lean"  # lean (copy or 16 kHz mono speech) or mp3 (stereo V2, as before)
+    AUDIO_COPY_CODECS: str = "aac,opus"  # Source codecs kept as-is
+    AUDIO_COPY_MAX_BITRATE: int = 96000  # Re-encode copyable audio above this
+    AUDIO_SAMPLE_RATE: int = 16000
+    AUDIO_BITRATE: str = "32k"
+    
+    # Invidious (YouTube downloads)
+    INVIDIOUS_INSTANCES: str = ""  # Comma-separated URLs, empty = built-in list
+    INVIDIOUS_RACE_WIDTH: int = 3  # Instances asked for metadata at once
+    INVIDIOUS_METADATA_TIMEOUT: float = 10.0  # Seconds per metadata request
+    INVIDIOUS_BREAKER_THRESHOLD: int = 3  # Consecutive failures that open the circuit
+    INVIDIOUS_BREAKER_COOLDOWN: int = 300  # Seconds an open circuit skips the instance
+    INVIDIOUS_STATE_PATH: str = "/tmp/viralklip/invidious.json"  # Persisted health scores
+    
     # Paths
     TEMP_DIR: str = "/tmp/viralklip"
     
+    # Job store
+    JOB_STORE_BACKEND: str = "sqlite"  # sqlite (shared across processes) or memory
+    JOB_STORE_PATH: str = "/tmp/viralklip/jobs.db"
+    JOB_TTL_SECONDS: int = 86400  # Finished jobs expire after 1 day
+    
+    # Source cache (downloaded videos shared between jobs)
+    SOURCE_CACHE_ENABLED: bool = True
+    SOURCE_CACHE_DIR: str = "/tmp/viralklip/cache/sources"
+    SOURCE_CACHE_MAX_BYTES: int = 10 * 1024 ** 3  # 10 GB, LRU-evicted beyond this
+    
+    # Transcription
+    TRANSCRIPTION_MODEL: str = "whisper-large-v3"
+    TRANSCRIPTION_LANGUAGE: str = "id"  # Indonesian, change as needed
+    TRANSCRIPTION_CHUNK_SECONDS: int = 600  # Longer audio is split at silences
+    TRANSCRIPTION_CHUNK_MAX_BYTES: int = 20 * 1024 ** 2  # Stay under the API upload limit
+    TRANSCRIPTION_CHUNK_OVERLAP: float = 2.0  # Seconds of padding on each side of a cut
+    TRANSCRIPTION_CONCURRENCY: int = 4  # Chunks transcribed in parallel
+    TRANSCRIPTION_SILENCE_DB: int = -35  # silencedetect noise floor
+    
+    # Viral moment analysis
+    GROQ_MODEL: str = "llama-3.3-70b-versatile"
+    GEMINI_MODEL: str = "gemini-2.0-flash"
+    LLM_GROQ_TIMEOUT: float = 60.0  # Seconds per Groq request
+    LLM_GEMINI_TIMEOUT: float = 90.0  # Seconds per Gemini request
+    LLM_GROQ_CONCURRENCY: int = 4  # Groq requests in flight per process
+    LLM_GEMINI_CONCURRENCY: int = 2  # Gemini requests in flight per process
+    LLM_HEDGE_ENABLED: bool = False  # Race Gemini against a slow Groq call
+    LLM_HEDGE_DELAY: float = 10.0  # Seconds before the hedge request fires
+    ANALYSIS_WINDOW_SECONDS: int = 600  # Transcript window scored per LLM call
+    ANALYSIS_WINDOW_OVERLAP: int = 60  # Seconds shared by neighbouring windows
+    ANALYSIS_CONCURRENCY: int = 3  # LLM calls in flight per job
+    ANALYSIS_DEDUP_OVERLAP: float = 0.5  # Overlap fraction that marks a duplicate moment
+    ANALYSIS_PROMPT_ENCODING: str = "compact"  # compact (id|start-end|text lines) or json
+    ANALYSIS_PROMPT_TOKEN_BUDGET: int = 6000  # Larger windows are split to fit
+    PRESCORE_ENABLED: bool = True  # Shortlist windows locally before the LLM
+    PRESCORE_WINDOW_SECONDS: int = 45  # Candidate window length
+    PRESCORE_STRIDE_SECONDS: int = 5  # Step between candidate windows
+    PRESCORE_SHORTLIST_FACTOR: int = 3  # Windows sent to the LLM per requested clip
+    TRANSCRIPT_CACHE_ENABLED: bool = True
+    TRANSCRIPT_CACHE_DIR: str = "/tmp/viralklip/cache/transcripts"
+    TRANSCRIPT_CACHE_MAX_BYTES: int = 512 * 1024 ** 2  # 512 MB
+    
     class Config:
         env_file = ".env"
         case_sensitive = True
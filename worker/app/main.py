@@ -1,7 +1,9 @@
 from fastapi import FastAPI, HTTPException, BackgroundTasks, Header
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional, Tuple
+from datetime import datetime, timezone
+import asyncio
 import uuid
 import os
 
@@ -10,9 +12,16 @@ from app.services.youtube import download_video
 from app.services.transcription import transcribe_audio
 from app.services.analysis import analyze_moments
 from app.services.video import generate_clips
-from app.services.storage import upload_to_r2
+from app.services.storage import upload_to_r2, upload_from_queue, get_upload_workers
+from app.services.jobs import create_job_store, FINISHED_STATUSES
+from app.services.checkpoint import JobManifest
+from app.services.cache import source_cache, transcript_cache
+from app.services.invidious import invidious_pool
+from app.services.encoding import encoding_scheduler
+from app.services.scenes import load_scene_index
+from app.services.probe import is_remote
 from app.utils.logger import logger
-from app.models import ProcessRequest, JobStatus, JobResponse
+from app.models import ProcessRequest, JobStatus, JobResponse, ViralMoment, ClipResult
 
 app = FastAPI(
     title="ViralKlip Worker API",
@@ -29,8 +38,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# In-memory job storage (use Redis in production)
-jobs = {}
+# Job state shared by every worker process (see JOB_STORE_BACKEND)
+job_store = create_job_store()
 
 
 def verify_api_key(x_api_key: str = Header(...)):
@@ -40,58 +49,323 @@ def verify_api_key(x_api_key: str = Header(...)):
     return x_api_key
 
 
-async def process_video_job(job_id: str, request: ProcessRequest):
-    """Background task to process video"""
+async def process_video_job(job_id: str, request: ProcessRequest, resume: bool = False):
+    """
+    Background task to process video
+    
+    Every finished stage is checkpointed in the job's manifest. With
+    resume=True, stages whose artifacts are still intact are loaded from
+    the manifest and processing restarts at the first incomplete stage.
+    
+    The audio is checkpointed as a partial download as soon as it is on
+    disk, so transcription and analysis checkpoints survive a failed video
+    download; a failure in those stages still lets the download finish
+    and checkpoints it.
+    
+    With request.draft_preview, clips are first rendered and delivered at
+    draft quality, then re-rendered at the scheduled encoding and swapped
+    into the completed job (see upgrade_clips).
+    """
+    manifest = JobManifest(job_id)
+    
+    def reuse(stage: str):
+        """Checkpointed outputs for stage, if resuming and still valid"""
+        if not resume:
+            return None
+        outputs = manifest.load(stage)
+        if outputs is not None:
+            logger.info(f"Job {job_id}: Reusing checkpointed {stage} stage")
+        return outputs
+    
+    def checkpoint_download(video_path: Optional[str], audio_path: str):
+        """Record the download; video_path None records the audio alone"""
+        manifest.complete(
+            "download",
+            {"video_path": video_path, "audio_path": audio_path},
+            # A remote video (partial fetch) has no local file to check
+            files=[path for path in (video_path, audio_path) if path and not is_remote(path)],
+            # Transcript and moments were produced from this same audio
+            invalidate_later=False
+        )
+    
+    download_task = None
+    download_metrics = {}
     try:
-        jobs[job_id]["status"] = "downloading"
-        logger.info(f"Job {job_id}: Starting download from {request.video_url}")
-        
-        # Step 1: Download video
-        video_path, audio_path = await download_video(request.video_url, job_id)
-        jobs[job_id]["progress"] = 20
+        # Step 1: Download video. Transcription and analysis start as soon
+        # as the audio is on disk; only the clip stage waits for the video.
+        checkpoint = reuse("download")
+        if checkpoint and checkpoint["video_path"]:
+            video_path, audio_path = checkpoint["video_path"], checkpoint["audio_path"]
+        else:
+            job_store.update(job_id, status="downloading")
+            logger.info(f"Job {job_id}: Starting download from {request.video_url}")
+            audio_ready = asyncio.get_running_loop().create_future()
+            download_task = asyncio.create_task(
+                download_video(request.video_url, job_id, audio_ready, download_metrics)
+            )
+            await asyncio.wait({audio_ready, download_task}, return_when=asyncio.FIRST_COMPLETED)
+            if audio_ready.done():
+                audio_path = audio_ready.result()
+                checkpoint_download(None, audio_path)
+            else:
+                # Download finished (or failed) without publishing audio
+                video_path, audio_path = download_task.result()
+        job_store.update(job_id, progress=20)
         
         # Step 2: Transcribe audio
-        jobs[job_id]["status"] = "transcribing"
-        logger.info(f"Job {job_id}: Transcribing audio")
-        transcript = await transcribe_audio(audio_path)
-        jobs[job_id]["progress"] = 40
+        transcript = reuse("transcribe")
+        if transcript is None:
+            job_store.update(job_id, status="transcribing")
+            logger.info(f"Job {job_id}: Transcribing audio")
+            transcript = await transcribe_audio(audio_path)
+            manifest.complete("transcribe", transcript)
+        job_store.update(job_id, progress=40)
         
         # Step 3: Analyze viral moments
-        jobs[job_id]["status"] = "analyzing"
-        logger.info(f"Job {job_id}: Analyzing viral moments")
-        moments = await analyze_moments(transcript, request.target_count or 10)
-        jobs[job_id]["progress"] = 60
+        checkpoint = reuse("analyze")
+        if checkpoint is not None:
+            moments = [ViralMoment(**moment) for moment in checkpoint]
+        else:
+            job_store.update(job_id, status="analyzing")
+            logger.info(f"Job {job_id}: Analyzing viral moments")
+            moments = await analyze_moments(
+                transcript,
+                request.target_count or 10,
+                audio_path,
+                job_id=job_id,
+                # Present for cached or resumed sources; otherwise clips snap later
+                scene_index=load_scene_index(os.path.join(settings.TEMP_DIR, job_id))
+            )
+            manifest.complete("analyze", [moment.model_dump() for moment in moments])
+        job_store.update(job_id, progress=60)
         
-        # Step 4: Generate clips
-        jobs[job_id]["status"] = "clipping"
-        logger.info(f"Job {job_id}: Generating clips")
-        clips = await generate_clips(
-            video_path,
-            moments,
-            request.aspect_ratios or ["9:16", "16:9", "1:1"]
-        )
-        jobs[job_id]["progress"] = 80
+        if download_task is not None:
+            if not download_task.done():
+                logger.info(f"Job {job_id}: Waiting for video download")
+            video_path, audio_path = await download_task
+            if download_metrics:
+                job_store.update(job_id, metrics=download_metrics)
+            checkpoint_download(video_path, audio_path)
+            download_task = None
         
-        # Step 5: Upload to R2
-        jobs[job_id]["status"] = "uploading"
-        logger.info(f"Job {job_id}: Uploading to R2")
-        uploaded_clips = await upload_to_r2(clips, job_id)
-        jobs[job_id]["progress"] = 100
+        # Steps 4-5: Generate clips and upload them as they finish
+        aspect_ratios = request.aspect_ratios or ["9:16", "16:9", "1:1"]
+        # Chosen only when clips are rendered, so resumed uploads don't count
+        encoding = None
+        uploaded_clips = reuse("upload")
+        if uploaded_clips is not None:
+            uploaded_clips = [ClipResult(**clip) for clip in uploaded_clips]
+        else:
+            checkpoint = reuse("clip")
+            if checkpoint is not None:
+                clips = [{**clip, "moment": ViralMoment(**clip["moment"])} for clip in checkpoint]
+                # Clips uploaded before the failure are not uploaded again
+                done = manifest.load_partial("upload")
+                pending = [clip for clip in clips if clip["video_path"] not in done]
+                job_store.update(job_id, status="uploading", progress=80)
+                logger.info(f"Job {job_id}: Uploading {len(pending)}/{len(clips)} clips to R2")
+                results = await upload_to_r2(
+                    pending,
+                    job_id,
+                    lambda clip, result: manifest.record("upload", clip["video_path"], result.model_dump())
+                )
+                results = dict(zip((clip["video_path"] for clip in pending), results))
+                uploaded_clips = [
+                    results.get(clip["video_path"]) or ClipResult(**done[clip["video_path"]])
+                    for clip in clips
+                ]
+            else:
+                job_store.update(job_id, status="clipping")
+                logger.info(f"Job {job_id}: Generating and uploading clips")
+                manifest.invalidate("clip")
+                encoding = choose_encoding(request)
+                clips, uploaded_clips = await clip_and_upload(
+                    job_id,
+                    video_path,
+                    moments,
+                    aspect_ratios,
+                    "draft" if request.draft_preview else encoding,
+                    manifest=manifest
+                )
+            manifest.complete("upload", [clip.model_dump() for clip in uploaded_clips])
         
         # Update job status
-        jobs[job_id]["status"] = "completed"
-        jobs[job_id]["result"] = {
-            "transcript": transcript,
-            "clips": uploaded_clips,
-            "total_clips": len(uploaded_clips)
-        }
+        job_store.update(
+            job_id,
+            status="completed",
+            progress=100,
+            result={
+                "transcript": transcript,
+                "clips": uploaded_clips,
+                "total_clips": len(uploaded_clips)
+            }
+        )
         
         logger.info(f"Job {job_id}: Completed successfully")
         
+        if request.draft_preview and any(clip.encoding == "draft" for clip in uploaded_clips):
+            encoding = encoding or choose_encoding(request)
+            if encoding != "draft":
+                await upgrade_clips(job_id, video_path, moments, aspect_ratios, encoding, transcript)
+        
     except Exception as e:
+        if download_task is not None and not download_task.done():
+            # Keep the download for /resume instead of throwing it away
+            logger.info(f"Job {job_id}: Finishing video download before failing")
+            try:
+                checkpoint_download(*await download_task)
+            except Exception as download_error:
+                logger.warning(f"Job {job_id}: Download failed too: {download_error}")
         logger.error(f"Job {job_id}: Failed with error: {str(e)}")
-        jobs[job_id]["status"] = "failed"
-        jobs[job_id]["error"] = str(e)
+        job_store.update(job_id, status="failed", error=str(e))
+
+
+def choose_encoding(request: ProcessRequest) -> str:
+    """Encoding profile for a job about to render, from its priority and the worker's load"""
+    return encoding_scheduler.choose(
+        request.priority,
+        job_store.count_unfinished(settings.ENCODING_STALE_SECONDS)
+    )
+
+
+async def clip_and_upload(
+    job_id: str,
+    video_path: str,
+    moments: List[ViralMoment],
+    aspect_ratios: List[str],
+    encoding: str,
+    track_progress: bool = True,
+    manifest: Optional[JobManifest] = None
+) -> Tuple[List[dict], List[ClipResult]]:
+    """
+    Render clips and upload each one as soon as it is finished
+    
+    Rendering feeds a bounded queue (UPLOAD_QUEUE_SIZE) that the upload
+    consumers drain, so encoding and network transfer overlap. With
+    track_progress, progress moves from 60 to 95 as clips are uploaded.
+    
+    With a manifest, the clip stage is checkpointed as soon as rendering
+    finishes and every upload is recorded as it finishes. If an upload
+    fails, rendering still runs to the end (the queue is drained) so a
+    resumed job only uploads what is missing.
+    
+    Returns:
+        tuple: (rendered clips, uploaded ClipResults), both in
+        moment/aspect ratio order
+    """
+    queue = asyncio.Queue(maxsize=max(1, settings.UPLOAD_QUEUE_SIZE))
+    total = len(moments) * len(aspect_ratios)
+    uploaded = 0
+    
+    def on_uploaded(clip: dict, result: ClipResult):
+        nonlocal uploaded
+        uploaded += 1
+        if manifest is not None:
+            manifest.record("upload", clip["video_path"], result.model_dump())
+        if track_progress:
+            job_store.update(job_id, progress=60 + int(35 * uploaded / max(total, 1)))
+    
+    async def render():
+        clips = await generate_clips(
+            video_path,
+            moments,
+            aspect_ratios,
+            queue=queue,
+            work_dir=os.path.join(settings.TEMP_DIR, job_id),
+            encoding=encoding
+        )
+        if manifest is not None:
+            # Uploads recorded so far belong to these clips, keep them
+            manifest.complete(
+                "clip",
+                [{**clip, "moment": clip["moment"].model_dump()} for clip in clips],
+                files=[
+                    clip[key] for clip in clips
+                    for key in ("video_path", "thumbnail_path", "subtitle_path")
+                ],
+                invalidate_later=False
+            )
+        # Uploaders finish what is queued, then each takes a sentinel and stops
+        for _ in range(get_upload_workers()):
+            await queue.put(None)
+        if track_progress:
+            job_store.update(job_id, status="uploading")
+        return clips
+    
+    async def drain():
+        while True:
+            await queue.get()
+    
+    render_task = asyncio.create_task(render())
+    upload_task = asyncio.create_task(upload_from_queue(queue, job_id, on_uploaded))
+    try:
+        await asyncio.wait({render_task, upload_task}, return_when=asyncio.FIRST_EXCEPTION)
+        if render_task.done() and render_task.exception() is not None:
+            upload_task.cancel()
+            raise render_task.exception()
+        if upload_task.done() and upload_task.exception() is not None:
+            if manifest is not None:
+                logger.warning(f"Job {job_id}: Upload failed, finishing renders for the checkpoint")
+                drain_task = asyncio.create_task(drain())
+                try:
+                    await render_task
+                finally:
+                    drain_task.cancel()
+            raise upload_task.exception()
+        clips, uploaded_clips = render_task.result(), upload_task.result()
+    except BaseException:
+        render_task.cancel()
+        upload_task.cancel()
+        raise
+    
+    order = {ratio: n for n, ratio in enumerate(aspect_ratios)}
+    uploaded_clips.sort(key=lambda clip: (clip.clip_number, order[clip.aspect_ratio]))
+    return clips, uploaded_clips
+
+
+async def upgrade_clips(
+    job_id: str,
+    video_path: str,
+    moments: List[ViralMoment],
+    aspect_ratios: List[str],
+    encoding: str,
+    transcript: dict
+):
+    """
+    Re-render a job's draft clips at encoding and swap in the new URLs
+    
+    The job stays completed with its draft clips until every upgraded
+    clip is uploaded. If the upgrade fails, the drafts are kept.
+    """
+    try:
+        logger.info(f"Job {job_id}: Upgrading draft clips to {encoding}")
+        clips, uploaded_clips = await clip_and_upload(
+            job_id, video_path, moments, aspect_ratios, encoding, track_progress=False
+        )
+    except Exception as e:
+        logger.warning(f"Job {job_id}: Draft upgrade failed, keeping draft clips: {e}")
+        return
+    
+    manifest = JobManifest(job_id)
+    manifest.complete(
+        "clip",
+        [{**clip, "moment": clip["moment"].model_dump()} for clip in clips],
+        files=[
+            clip[key] for clip in clips
+            for key in ("video_path", "thumbnail_path", "subtitle_path")
+        ]
+    )
+    manifest.complete("upload", [clip.model_dump() for clip in uploaded_clips])
+    
+    job_store.update(
+        job_id,
+        result={
+            "transcript": transcript,
+            "clips": uploaded_clips,
+            "total_clips": len(uploaded_clips)
+        }
+    )
+    logger.info(f"Job {job_id}: Swapped in {len(uploaded_clips)} {encoding} clips")
 
 
 @app.get("/")
@@ -110,6 +384,22 @@ async def health_check():
     return {"status": "healthy"}
 
 
+@app.get("/metrics")
+async def metrics(api_key: str = Header(..., alias="X-API-Key")):
+    """Cache counters, Invidious instance health and encoding load"""
+    verify_api_key(api_key)
+    
+    return {
+        "source_cache": source_cache.stats(),
+        "transcript_cache": transcript_cache.stats(),
+        "invidious": invidious_pool.stats(),
+        "encoding": {
+            **encoding_scheduler.stats(),
+            "unfinished_jobs": job_store.count_unfinished(settings.ENCODING_STALE_SECONDS)
+        }
+    }
+
+
 @app.post("/process", response_model=JobResponse)
 async def process_video(
     request: ProcessRequest,
@@ -124,22 +414,28 @@ async def process_video(
     - **user_id**: User ID for tracking
     - **target_count**: Number of clips to generate (default: 10)
     - **aspect_ratios**: List of aspect ratios (default: ["9:16", "16:9", "1:1"])
+    - **priority**: low, normal or high; picks the encoding profile with the worker's load
+    - **draft_preview**: Deliver draft clips first and upgrade them in the background
     """
     verify_api_key(api_key)
     
     job_id = str(uuid.uuid4())
     
+    # Drop finished jobs past their TTL before adding new ones
+    job_store.purge_expired()
+    
     # Initialize job
-    jobs[job_id] = {
+    job_store.create({
         "id": job_id,
         "status": "pending",
         "progress": 0,
         "project_id": request.project_id,
         "user_id": request.user_id,
-        "created_at": None,
+        "created_at": datetime.now(timezone.utc),
         "result": None,
-        "error": None
-    }
+        "error": None,
+        "request": request.model_dump()
+    })
     
     # Start background processing
     background_tasks.add_task(process_video_job, job_id, request)
@@ -153,6 +449,54 @@ async def process_video(
     )
 
 
+@app.post("/resume/{job_id}", response_model=JobResponse)
+async def resume_job(
+    job_id: str,
+    background_tasks: BackgroundTasks,
+    api_key: str = Header(..., alias="X-API-Key")
+):
+    """
+    Resume a failed job from its first incomplete stage
+    
+    Stages whose checkpointed artifacts are still present in the job
+    workspace (download, transcript, analysis, clips, uploads) are not
+    repeated. An unfinished job that has not been updated for
+    ENCODING_STALE_SECONDS (its worker crashed or was redeployed) can be
+    resumed as well.
+    """
+    verify_api_key(api_key)
+    
+    job = job_store.get(job_id)
+    if job is None or not job.get("request"):
+        raise HTTPException(status_code=404, detail="Job not found")
+    stalled = job["status"] not in FINISHED_STATUSES and (
+        (job_store.idle_seconds(job_id) or 0) > settings.ENCODING_STALE_SECONDS
+    )
+    if job["status"] != "failed" and not stalled:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Job is {job['status']}, only failed or stalled jobs can be resumed"
+        )
+    
+    request = ProcessRequest(**job["request"])
+    manifest = JobManifest(job_id)
+    stage = manifest.first_incomplete() or "upload"
+    if stage != "download" and not (manifest.load("download") or {}).get("video_path"):
+        # Only the audio was checkpointed, the video download runs again
+        stage = "download"
+    
+    job_store.update(job_id, status="pending", error=None)
+    background_tasks.add_task(process_video_job, job_id, request, True)
+    
+    logger.info(f"Resuming job {job_id} from {stage} stage")
+    
+    return JobResponse(
+        job_id=job_id,
+        status="pending",
+        message=f"Job resumed from {stage} stage"
+    )
+
+
 @app.get("/status/{job_id}", response_model=JobStatus)
 async def get_job_status(
     job_id: str,
@@ -161,10 +505,32 @@ async def get_job_status(
     """Get job status and progress"""
     verify_api_key(api_key)
     
-    if job_id not in jobs:
+    job = job_store.get(job_id)
+    if job is None:
         raise HTTPException(status_code=404, detail="Job not found")
     
-    return JobStatus(**jobs[job_id])
+    return JobStatus(**job)
+
+
+@app.get("/jobs", response_model=List[JobStatus])
+async def list_jobs(
+    project_id: Optional[str] = None,
+    user_id: Optional[str] = None,
+    api_key: str = Header(..., alias="X-API-Key")
+):
+    """List jobs for a project or user (one of the two is required)"""
+    verify_api_key(api_key)
+    
+    if project_id:
+        found = job_store.list_by_project(project_id)
+        if user_id:
+            found = [job for job in found if job["user_id"] == user_id]
+    elif user_id:
+        found = job_store.list_by_user(user_id)
+    else:
+        raise HTTPException(status_code=400, detail="project_id or user_id is required")
+    
+    return [JobStatus(**job) for job in found]
 
 
 @app.post("/webhook/supabase")
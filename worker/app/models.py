@@ -10,6 +10,8 @@ class ProcessRequest(BaseModel):
     user_id: str
     target_count: Optional[int] = 10
     aspect_ratios: Optional[List[str]] = ["9:16", "16:9", "1:1"]
+    priority: Optional[str] = "normal"  # low, normal, high (see EncodingScheduler)
+    draft_preview: Optional[bool] = False  # Deliver draft clips first, then upgrade them
 
 
 class JobResponse(BaseModel):
@@ -35,6 +37,7 @@ class ClipResult(BaseModel):
     subtitle_file_url: Optional[str] = None
     caption_text: Optional[str] = None
     view_prediction: Optional[int] = None
+    encoding: Optional[str] = None  # draft, standard or archival
 
 
 class JobStatus(BaseModel):
@@ -47,6 +50,7 @@ class JobStatus(BaseModel):
     created_at: Optional[datetime] = None
     result: Optional[Dict[str, Any]] = None
     error: Optional[str] = None
+    metrics: Optional[Dict[str, Any]] = None  # Per-stage measurements, e.g. audio preparation
 
 
 class ViralMoment(BaseModel):
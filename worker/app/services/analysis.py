@@ -1,25 +1,66 @@
-from groq import Groq
-import google.generativeai as genai
-from typing import List
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import math
+import time
+import numpy as np
 from app.config import settings
 from app.models import ViralMoment
+from app.services.llm import LLMProvider, get_providers, complete_with_fallback
+from app.services.prescore import score_windows, shortlist, segments_in_windows, moments_from_shortlist
+from app.services.scenes import snap_moments
 from app.utils.logger import logger
 import json
 
 
-def get_analysis_prompt(transcript: dict, target_count: int) -> str:
-    """Generate the prompt for viral moment analysis"""
-    return f"""Analyze this video transcript and identify the TOP {target_count} most viral moments for TikTok/Reels.
+def encode_segments(segments: List[dict], encoding: str) -> str:
+    """
+    Serialize transcript segments for the prompt
+    
+    "compact" writes one "id|start-end|text" line per segment with times
+    rounded to 0.1 s; "json" is the original indented JSON dump.
+    """
+    if encoding == "json":
+        return json.dumps([
+            {'start': s['start'], 'end': s['end'], 'text': s['text']} for s in segments
+        ], indent=2)
+    
+    return '\n'.join(
+        f"{segment['id']}|{segment['start']:.1f}-{segment['end']:.1f}|{segment['text'].strip()}"
+        for segment in segments
+    )
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for LLaMA/Gemini tokenizers)"""
+    return math.ceil(len(text) / 4)
+
 
-TRANSCRIPT:
+def get_analysis_prompt(transcript: dict, target_count: int, encoding: Optional[str] = None) -> str:
+    """Generate the prompt for viral moment analysis"""
+    encoding = encoding or settings.ANALYSIS_PROMPT_ENCODING
+    
+    if encoding == "json":
+        transcript_block = f"""TRANSCRIPT:
 {transcript['text']}
 
 TRANSCRIPT SEGMENTS (with timestamps):
-{json.dumps(transcript['segments'][:50], indent=2)}
+{encode_segments(transcript['segments'], encoding)}"""
+        timing_fields = """1. start_time (in seconds)
+2. end_time (in seconds) - max 60 seconds duration"""
+        example = '"start_time": 10.5, "end_time": 45.2'
+    else:
+        transcript_block = f"""TRANSCRIPT SEGMENTS (one per line: id|start-end in seconds|text):
+{encode_segments(transcript['segments'], encoding)}"""
+        timing_fields = """1. start_id (id of the segment where the moment starts)
+2. end_id (id of the segment where the moment ends) - max 60 seconds duration"""
+        example = '"start_id": 12, "end_id": 19'
+    
+    return f"""Analyze this video transcript and identify the TOP {target_count} most viral moments for TikTok/Reels.
+
+{transcript_block}
 
 For each viral moment, provide:
-1. start_time (in seconds)
-2. end_time (in seconds) - max 60 seconds duration
+{timing_fields}
 3. transcript (exact text from that moment)
 4. viral_score (0-10, how viral this moment is)
 5. reason (why this moment is viral)
@@ -36,37 +77,22 @@ CRITERIA FOR VIRAL MOMENTS:
 - Quotable one-liners
 
 Return ONLY a JSON array of {target_count} moments, ordered by viral_score (highest first).
-Format: [{{"start_time": 10.5, "end_time": 45.2, "transcript": "...", "viral_score": 9.5, "reason": "...", "keywords": ["...", "..."], "hook_type": "...", "view_prediction": 50000}}, ...]"""
-
-
-async def analyze_with_groq(prompt: str) -> str:
-    """Use Groq LLaMA for analysis - faster and no rate limits"""
-    logger.info("Using Groq LLaMA for viral moment analysis")
-    
-    client = Groq(api_key=settings.GROQ_API_KEY)
-    
-    response = client.chat.completions.create(
-        model="llama-3.3-70b-versatile",
-        messages=[
-            {"role": "system", "content": "You are an expert at identifying viral TikTok/Reels moments. Always respond with valid JSON only."},
-            {"role": "user", "content": prompt}
-        ],
-        temperature=0.7,
-        max_tokens=4096,
-    )
-    
-    return response.choices[0].message.content
+Format: [{{{example}, "transcript": "...", "viral_score": 9.5, "reason": "...", "keywords": ["...", "..."], "hook_type": "...", "view_prediction": 50000}}, ...]"""
 
 
-async def analyze_with_gemini(prompt: str) -> str:
-    """Use Gemini for analysis - fallback option"""
-    logger.info("Using Gemini for viral moment analysis")
+def fit_to_budget(window: List[dict], target_count: int, budget: int) -> List[List[dict]]:
+    """
+    Split a window in halves until each part's prompt fits the token budget
     
-    genai.configure(api_key=settings.GEMINI_API_KEY)
-    model = genai.GenerativeModel('gemini-2.0-flash')
+    A single segment that is still too large is sent as is.
+    """
+    prompt = get_analysis_prompt({'text': '', 'segments': window}, target_count)
+    if len(window) <= 1 or estimate_tokens(prompt) <= budget:
+        return [window]
     
-    response = model.generate_content(prompt)
-    return response.text
+    middle = len(window) // 2
+    return fit_to_budget(window[:middle], target_count, budget) + \
+        fit_to_budget(window[middle:], target_count, budget)
 
 
 def parse_response(response_text: str) -> list:
@@ -82,61 +108,264 @@ def parse_response(response_text: str) -> list:
     return json.loads(response_text)
 
 
-async def analyze_moments(transcript: dict, target_count: int = 10) -> List[ViralMoment]:
+async def analyze_prompt(
+    prompt: str,
+    providers: Optional[Tuple[LLMProvider, LLMProvider]] = None
+) -> list:
     """
-    Analyze transcript to find viral moments
+    Run one analysis prompt and parse the returned moments
     Uses Groq LLaMA as primary (faster, no rate limits)
-    Falls back to Gemini if Groq fails
+    Falls back to Gemini if Groq fails, or races it against a slow Groq
+    call when LLM_HEDGE_ENABLED is set
+    """
+    primary, fallback = providers or get_providers()
+    hedge_delay = settings.LLM_HEDGE_DELAY if settings.LLM_HEDGE_ENABLED else None
+    
+    moments_data, _ = await complete_with_fallback(
+        prompt,
+        parse_response,
+        primary,
+        fallback,
+        hedge_delay=hedge_delay
+    )
+    return moments_data
+
+
+def split_windows(segments: List[dict], window_seconds: float, overlap_seconds: float) -> List[List[dict]]:
+    """
+    Split transcript segments into overlapping time windows
+    
+    Windows start every (window_seconds - overlap_seconds), so a moment
+    straddling a window edge is fully inside at least one window when it
+    is shorter than the overlap.
+    """
+    if not segments:
+        return []
+    
+    step = max(1.0, window_seconds - overlap_seconds)
+    end_time = max(segment['end'] for segment in segments)
+    
+    windows = []
+    window_start = 0.0
+    while True:
+        window_end = window_start + window_seconds
+        window = [
+            segment for segment in segments
+            if segment['end'] > window_start and segment['start'] < window_end
+        ]
+        if window:
+            windows.append(window)
+        if window_end >= end_time:
+            break
+        window_start += step
+    
+    return windows
+
+
+def to_viral_moment(moment: dict, segments_by_id: Optional[Dict[int, dict]] = None) -> ViralMoment:
+    """
+    Build a ViralMoment from one parsed LLM item, capping clip length
+    
+    With segments_by_id (compact prompt encoding) the times come from the
+    start_id/end_id segments, which must both be known; otherwise from
+    raw start_time/end_time.
+    
+    Raises:
+        ValueError: unknown or garbled segment ids, or end not after start
+    """
+    if segments_by_id:
+        start_segment = segments_by_id.get(_as_int(moment.get('start_id')))
+        end_segment = segments_by_id.get(_as_int(moment.get('end_id')))
+        if start_segment is None or end_segment is None:
+            raise ValueError(
+                f"unknown segment ids {moment.get('start_id')!r}-{moment.get('end_id')!r}"
+            )
+        start_time = float(start_segment['start'])
+        end_time = float(end_segment['end'])
+    else:
+        start_time = float(moment.get('start_time', 0))
+        end_time = float(moment.get('end_time', 60))
+    
+    if end_time <= start_time:
+        raise ValueError(f"end {end_time:.1f}s is not after start {start_time:.1f}s")
+    
+    return ViralMoment(
+        start_time=start_time,
+        end_time=min(end_time, start_time + settings.MAX_CLIP_DURATION),
+        transcript=moment.get('transcript', ''),
+        viral_score=float(moment.get('viral_score', 5)),
+        reason=moment.get('reason', ''),
+        keywords=moment.get('keywords', []),
+        hook_type=moment.get('hook_type', 'story'),
+        view_prediction=int(moment.get('view_prediction', 10000))
+    )
+
+
+def _as_int(value) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def merge_moments(moments: List[ViralMoment], target_count: int) -> List[ViralMoment]:
+    """
+    Rank moments globally and drop near-duplicates
+    
+    A moment is dropped when it overlaps an already selected, higher
+    scoring moment by more than ANALYSIS_DEDUP_OVERLAP of the shorter
+    of the two (windows overlap, so the same moment is often found twice).
+    """
+    selected = []
+    for moment in sorted(moments, key=lambda m: m.viral_score, reverse=True):
+        duplicate = False
+        for kept in selected:
+            overlap = min(moment.end_time, kept.end_time) - max(moment.start_time, kept.start_time)
+            shorter = min(moment.end_time - moment.start_time, kept.end_time - kept.start_time)
+            if shorter > 0 and overlap / shorter > settings.ANALYSIS_DEDUP_OVERLAP:
+                duplicate = True
+                break
+        if not duplicate:
+            selected.append(moment)
+        if len(selected) >= target_count:
+            break
+    
+    return selected
+
+
+async def analyze_moments(
+    transcript: dict,
+    target_count: int = 10,
+    audio_path: Optional[str] = None,
+    providers: Optional[Tuple[LLMProvider, LLMProvider]] = None,
+    job_id: Optional[str] = None,
+    scene_index: Optional[np.ndarray] = None
+) -> List[ViralMoment]:
+    """
+    Analyze transcript to find viral moments
+    
+    The transcript is split into overlapping ANALYSIS_WINDOW_SECONDS
+    windows that are scored concurrently (at most ANALYSIS_CONCURRENCY
+    LLM calls in flight), then the candidates are merged, de-duplicated
+    and ranked globally, so the whole video is covered regardless of
+    length.
+    
+    With PRESCORE_ENABLED, a local NumPy scorer first ranks candidate
+    windows from audio loudness and transcript features, and only the
+    top PRESCORE_SHORTLIST_FACTOR x target_count windows are sent to the
+    LLM. The shortlist doubles as the result if every provider fails.
+    
+    Segments are sent in the ANALYSIS_PROMPT_ENCODING format, and any
+    window whose prompt exceeds ANALYSIS_PROMPT_TOKEN_BUDGET is split.
+    
+    With a scene index (see get_scene_index), moment edges are snapped to
+    nearby shot cuts before they are merged and ranked.
     
     Args:
         transcript: Dict with 'text' and 'segments'
         target_count: Number of clips to generate
+        audio_path: Extracted audio, used for loudness pre-scoring
+        providers: (primary, fallback) LLM providers, default Groq then Gemini
+        job_id: Job ID for logging prompt size
+        scene_index: Sorted shot cut times of the source, if already built
         
     Returns:
         List of ViralMoment objects
     """
     logger.info(f"Analyzing transcript for {target_count} viral moments")
     
-    prompt = get_analysis_prompt(transcript, target_count)
-    response_text = None
+    # Stable ids the model can reference back in the compact encoding
+    segments = [{**segment, 'id': n} for n, segment in enumerate(transcript['segments'])]
+    # JSON-encoded prompts are answered with raw start_time/end_time
+    segments_by_id = None
+    if settings.ANALYSIS_PROMPT_ENCODING != "json":
+        segments_by_id = {segment['id']: segment for segment in segments}
+    candidates_shortlist = []
+    if settings.PRESCORE_ENABLED and segments:
+        scored = await score_windows(transcript, audio_path)
+        candidates_shortlist = shortlist(scored, target_count * settings.PRESCORE_SHORTLIST_FACTOR)
+        if candidates_shortlist:
+            segments = segments_in_windows(segments, candidates_shortlist)
+            logger.info(
+                f"Pre-scoring shortlisted {len(candidates_shortlist)} windows, "
+                f"{len(segments)}/{len(transcript['segments'])} segments sent to the LLM"
+            )
     
-    # Try Groq first (no rate limits)
-    try:
-        response_text = await analyze_with_groq(prompt)
-        moments_data = parse_response(response_text)
-        logger.info("Groq analysis successful")
-        
-    except Exception as groq_error:
-        logger.warning(f"Groq failed: {str(groq_error)}, trying Gemini fallback")
-        
-        # Fallback to Gemini
-        try:
-            response_text = await analyze_with_gemini(prompt)
-            moments_data = parse_response(response_text)
-            logger.info("Gemini fallback successful")
-            
-        except Exception as gemini_error:
-            logger.error(f"Both AI providers failed. Groq: {groq_error}, Gemini: {gemini_error}")
-            raise Exception(f"AI analysis failed: {str(gemini_error)}")
+    windows = split_windows(
+        segments,
+        settings.ANALYSIS_WINDOW_SECONDS,
+        settings.ANALYSIS_WINDOW_OVERLAP
+    )
+    if not windows:
+        # No timestamps, analyze the plain text in one go
+        windows = [segments]
+    
+    windows = [
+        part for window in windows
+        for part in fit_to_budget(window, target_count, settings.ANALYSIS_PROMPT_TOKEN_BUDGET)
+    ]
+    
+    # Ask each window for more than its share so the global ranking has choice
+    per_window = min(target_count, max(3, math.ceil(2 * target_count / len(windows))))
+    semaphore = asyncio.Semaphore(max(1, settings.ANALYSIS_CONCURRENCY))
+    
+    logger.info(f"Scoring {len(windows)} transcript windows, {per_window} candidates each")
+    
+    prompts = []
+    for window in windows:
+        window_transcript = {
+            'text': ' '.join(segment['text'].strip() for segment in window) if len(windows) > 1 else transcript['text'],
+            'segments': window
+        }
+        prompts.append(get_analysis_prompt(window_transcript, per_window))
+    
+    # Log prompt size per job so the encoding's effect is visible in production
+    prompt_tokens = sum(estimate_tokens(prompt) for prompt in prompts)
+    baseline_tokens = estimate_tokens(transcript['text']) + estimate_tokens(
+        encode_segments(transcript['segments'], "json")
+    )
+    logger.info(
+        f"{f'Job {job_id}: ' if job_id else ''}Prompt encoding {settings.ANALYSIS_PROMPT_ENCODING}: "
+        f"{len(prompts)} prompts, ~{prompt_tokens} tokens "
+        f"(full transcript as indented JSON: ~{baseline_tokens} tokens)"
+    )
+    
+    async def analyze_window(prompt: str) -> list:
+        async with semaphore:
+            return await analyze_prompt(prompt, providers)
+    
+    started = time.monotonic()
+    results = await asyncio.gather(*[analyze_window(p) for p in prompts], return_exceptions=True)
+    logger.info(f"{f'Job {job_id}: ' if job_id else ''}LLM analysis took {time.monotonic() - started:.1f}s")
+    
+    # A window task cancelled on its own comes back as CancelledError, which
+    # is a BaseException; it is a failed window like any other
+    errors = [result for result in results if isinstance(result, BaseException)]
+    if len(errors) == len(results):
+        if candidates_shortlist:
+            logger.warning(f"AI analysis failed ({errors[0]}), using local pre-score shortlist")
+            return snap_moments(
+                moments_from_shortlist(transcript, candidates_shortlist, target_count),
+                scene_index
+            )
+        raise errors[0]
+    if errors:
+        logger.warning(f"{len(errors)}/{len(results)} transcript windows failed analysis: {errors[0]}")
     
     # Convert to ViralMoment objects
-    moments = []
-    for moment in moments_data[:target_count]:
-        try:
-            moments.append(ViralMoment(
-                start_time=float(moment.get('start_time', 0)),
-                end_time=min(float(moment.get('end_time', 60)), float(moment.get('start_time', 0)) + settings.MAX_CLIP_DURATION),
-                transcript=moment.get('transcript', ''),
-                viral_score=float(moment.get('viral_score', 5)),
-                reason=moment.get('reason', ''),
-                keywords=moment.get('keywords', []),
-                hook_type=moment.get('hook_type', 'story'),
-                view_prediction=int(moment.get('view_prediction', 10000))
-            ))
-        except Exception as e:
-            logger.warning(f"Skipping malformed moment: {e}")
+    candidates = []
+    for moments_data in results:
+        if isinstance(moments_data, BaseException):
             continue
+        for moment in moments_data[:per_window]:
+            try:
+                candidates.append(to_viral_moment(moment, segments_by_id))
+            except Exception as e:
+                logger.warning(f"Skipping malformed moment: {e}")
+                continue
+    
+    moments = merge_moments(snap_moments(candidates, scene_index), target_count)
     
-    logger.info(f"Identified {len(moments)} viral moments")
+    logger.info(f"Identified {len(moments)} viral moments from {len(candidates)} candidates")
     
     return moments
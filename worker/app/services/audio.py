@@ -0,0 +1,103 @@
+import os
+import time
+from typing import List, Tuple
+from app.config import settings
+from app.services.probe import probe_audio
+from app.utils.logger import logger
+from app.utils.process import run_process
+
+
+# Container for each codec that can be stream-copied for Whisper
+COPY_CONTAINERS = {
+    "aac": ".m4a",
+    "opus": ".ogg",
+    "vorbis": ".ogg",
+    "mp3": ".mp3",
+    "flac": ".flac",
+}
+
+# Average bit rate of the previous libmp3lame -q:a 2 output, for reporting savings
+MP3_V2_BIT_RATE = 190_000
+
+
+def choose_audio_format(codec: str, bit_rate: int) -> Tuple[str, str, List[str]]:
+    """
+    Pick how to prepare a source's audio track for transcription
+
+    Returns:
+        tuple: (mode, file extension, FFmpeg codec arguments) where mode
+        is "copy", "speech" (16 kHz mono AAC) or "mp3" (AUDIO_FORMAT=mp3)
+    """
+    if settings.AUDIO_FORMAT == "mp3":
+        return "mp3", ".mp3", ['-c:a', 'libmp3lame', '-q:a', '2']
+
+    copy_codecs = {name.strip() for name in settings.AUDIO_COPY_CODECS.split(',') if name.strip()}
+    if codec in copy_codecs and codec in COPY_CONTAINERS \
+            and (bit_rate == 0 or bit_rate <= settings.AUDIO_COPY_MAX_BITRATE):
+        return "copy", COPY_CONTAINERS[codec], ['-c:a', 'copy']
+
+    return "speech", ".m4a", [
+        '-ac', '1',
+        '-ar', str(settings.AUDIO_SAMPLE_RATE),
+        '-c:a', 'aac',
+        '-b:a', settings.AUDIO_BITRATE,
+    ]
+
+
+async def prepare_audio(input_path: str, audio_stem: str, validate_video: bool = False) -> dict:
+    """
+    Produce the audio file sent to transcription
+
+    The first audio stream is stream-copied when its codec is in
+    AUDIO_COPY_CODECS and its bit rate is at most AUDIO_COPY_MAX_BITRATE,
+    otherwise encoded as low-bitrate 16 kHz mono speech audio. With
+    validate_video, the same FFmpeg pass also demuxes the whole video
+    stream (copied to a null output, no decoding), so a truncated or
+    corrupt download fails here instead of at the clip stage.
+
+    Args:
+        input_path: Downloaded video or audio file
+        audio_stem: Output path without extension (chosen per format)
+        validate_video: Also check the video stream in the same pass
+
+    Returns:
+        dict: path, mode, codec, bytes, seconds, and mp3_bytes - the
+        estimated size of the previous MP3 output, for comparison
+    """
+    started = time.monotonic()
+    source = await probe_audio(input_path)
+    if not source:
+        raise Exception(f"No audio stream in {os.path.basename(input_path)}")
+
+    mode, extension, codec_args = choose_audio_format(source['codec'], source['bit_rate'])
+    audio_path = f"{audio_stem}{extension}"
+
+    cmd = [
+        'ffmpeg',
+        '-v', 'error',
+        '-i', input_path,
+        '-map', '0:a:0',
+        '-vn',
+        *codec_args,
+        '-y',
+        audio_path
+    ]
+    if validate_video:
+        cmd += ['-map', '0:v:0', '-c', 'copy', '-f', 'null', '-']
+    await run_process(cmd)
+
+    size = os.path.getsize(audio_path)
+    elapsed = time.monotonic() - started
+    mp3_bytes = int(source['duration'] * MP3_V2_BIT_RATE / 8)
+    logger.info(
+        f"Prepared audio ({mode}, source {source['codec']}): {size / 1024 ** 2:.1f} MB in {elapsed:.1f}s, "
+        f"~{max(0, mp3_bytes - size) / 1024 ** 2:.1f} MB smaller than MP3 V2"
+    )
+    return {
+        'path': audio_path,
+        'mode': mode,
+        'codec': source['codec'],
+        'bytes': size,
+        'seconds': round(elapsed, 2),
+        'mp3_bytes': mp3_bytes,
+    }
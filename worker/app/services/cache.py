@@ -0,0 +1,314 @@
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import stat
+import threading
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+from app.config import settings
+from app.utils.logger import logger
+
+
+# Touched on every hit; its mtime orders entries for LRU eviction
+LAST_USED_FILE = ".last_used"
+
+
+class SourceCache:
+    """
+    Content-addressed cache of downloaded source files
+
+    Each entry is a directory named by its key (YouTube video ID or a
+    hash of a normalized direct URL plus its ETag) holding video.mp4, the
+    extracted audio, the probe.json profile and the scenes.npy shot
+    index. Cached files are read-only and handed to jobs as hardlinks
+    (symlinks across filesystems), so a job never copies data and
+    evicting an entry never breaks a job that already linked it. Entries
+    are evicted least-recently-used first once the total size exceeds the
+    disk budget.
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def fetch(self, key: str, dest_dir: str) -> Optional[Dict[str, str]]:
+        """
+        Link a cached entry's files into dest_dir
+
+        Returns:
+            Mapping of file name to linked path, or None on a miss
+        """
+        entry = self.root / key
+        if not (entry / LAST_USED_FILE).exists():
+            self.misses += 1
+            return None
+
+        linked = {}
+        try:
+            for cached in entry.iterdir():
+                if cached.name == LAST_USED_FILE:
+                    continue
+                target = Path(dest_dir) / cached.name
+                _link(cached, target)
+                linked[cached.name] = str(target)
+            (entry / LAST_USED_FILE).touch()
+        except FileNotFoundError:
+            # Evicted by another process while linking
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        logger.info(f"Source cache hit for {key}")
+        return linked
+
+    def store(self, key: str, files: List[str]):
+        """
+        Add a job's downloaded files to the cache under key
+
+        Best effort: a failure is logged and never fails the job, whose
+        files are already in place.
+        """
+        entry = self.root / key
+        if entry.exists():
+            return
+
+        staging = self.root / f".{key}.{uuid.uuid4().hex}"
+        try:
+            staging.mkdir()
+            for path in files:
+                cached = staging / Path(path).name
+                _link(Path(path), cached, allow_symlink=False)
+                os.chmod(cached, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+            (staging / LAST_USED_FILE).touch()
+            # Publish atomically; a concurrent store of the same key wins
+            os.rename(staging, entry)
+            logger.info(f"Cached source {key}")
+        except OSError as e:
+            logger.warning(f"Could not cache source {key}: {e}")
+            shutil.rmtree(staging, ignore_errors=True)
+            return
+
+        try:
+            self.evict(keep=key)
+        except OSError as e:
+            logger.warning(f"Source cache eviction failed: {e}")
+
+    def evict(self, keep: Optional[str] = None) -> int:
+        """
+        Remove least-recently-used entries until under the disk budget
+
+        Entries another process removes meanwhile are skipped.
+        """
+        with self.lock:
+            entries = []
+            total = 0
+            for entry in self.root.iterdir():
+                usage = None if entry.name.startswith('.') else _entry_usage(entry)
+                if usage is None:
+                    continue
+                last_used, size = usage
+                entries.append((last_used, size, entry))
+                total += size
+
+            removed = 0
+            for _, size, entry in sorted(entries, key=lambda item: item[0]):
+                if total <= self.max_bytes:
+                    break
+                if entry.name == keep:
+                    continue
+                shutil.rmtree(entry, ignore_errors=True)
+                total -= size
+                removed += 1
+                logger.info(f"Evicted cached source {entry.name} ({size} bytes)")
+
+            self.evictions += removed
+            return removed
+
+    def stats(self) -> dict:
+        """Hit/miss counters for this process and current cache size"""
+        usages = [
+            usage for usage in (
+                _entry_usage(entry) for entry in self.root.iterdir() if not entry.name.startswith('.')
+            )
+            if usage is not None
+        ]
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            'evictions': self.evictions,
+            'entries': len(usages),
+            'size_bytes': sum(size for _, size in usages),
+            'max_bytes': self.max_bytes,
+        }
+
+
+class TranscriptCache:
+    """
+    Persistent cache of transcription results
+
+    Keyed by a SHA-256 of the audio content plus the model and language,
+    so the same audio transcribed with the same parameters is never sent
+    to the API twice, whatever job or file name it arrives under. Results
+    are stored as gzip-compressed compact JSON, one file per entry, and
+    evicted least-recently-used first beyond the size budget.
+    """
+
+    def __init__(self, root: str, max_bytes: int):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key_for(audio_path: str, model: str, language: str) -> str:
+        """Fingerprint audio content and transcription parameters"""
+        digest = hashlib.sha256()
+        with open(audio_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        digest.update(f"\n{model}\n{language}".encode())
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[dict]:
+        path = self.root / f"{key}.json.gz"
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                transcript = json.load(f)
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Dropping unreadable cached transcript {key}: {e}")
+            path.unlink(missing_ok=True)
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        logger.info(f"Transcript cache hit for {key[:12]}")
+        return transcript
+
+    def put(self, key: str, transcript: dict):
+        path = self.root / f"{key}.json.gz"
+        tmp_path = self.root / f".{key}.{uuid.uuid4().hex}"
+        try:
+            with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+                json.dump(transcript, f, separators=(',', ':'), ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not cache transcript {key}: {e}")
+            tmp_path.unlink(missing_ok=True)
+            return
+
+        self.evict()
+
+    def evict(self) -> int:
+        """Remove least-recently-used transcripts until under the size budget"""
+        with self.lock:
+            entries = [
+                (info.st_mtime, info.st_size, path)
+                for path, info in _stat_all(self.root.glob('*.json.gz'))
+            ]
+            total = sum(size for _, size, _ in entries)
+
+            removed = 0
+            for _, size, path in sorted(entries, key=lambda item: item[0]):
+                if total <= self.max_bytes:
+                    break
+                path.unlink(missing_ok=True)
+                total -= size
+                removed += 1
+
+            self.evictions += removed
+            return removed
+
+    def stats(self) -> dict:
+        """Hit/miss counters for this process and current cache size"""
+        files = _stat_all(self.root.glob('*.json.gz'))
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else 0.0,
+            'evictions': self.evictions,
+            'entries': len(files),
+            'size_bytes': sum(info.st_size for _, info in files),
+            'max_bytes': self.max_bytes,
+        }
+
+
+def _entry_usage(entry: Path) -> Optional[Tuple[float, int]]:
+    """(last used time, total bytes) of a source cache entry, None if it is gone or unpublished"""
+    try:
+        last_used = (entry / LAST_USED_FILE).stat().st_mtime
+        return last_used, sum(f.stat().st_size for f in entry.iterdir())
+    except OSError:
+        # Being removed (or never completed) by another process
+        return None
+
+
+def _stat_all(paths) -> List[Tuple[Path, os.stat_result]]:
+    """stat() each path, skipping files removed meanwhile"""
+    stats = []
+    for path in paths:
+        try:
+            stats.append((path, path.stat()))
+        except OSError:
+            continue
+    return stats
+
+
+def _link(source: Path, target: Path, allow_symlink: bool = True):
+    """Hardlink source to target, falling back to a symlink across devices"""
+    if target.exists() or target.is_symlink():
+        target.unlink()
+    try:
+        os.link(source, target)
+    except OSError:
+        if not allow_symlink:
+            shutil.copy2(source, target)
+        else:
+            os.symlink(source.resolve(), target)
+
+
+def normalize_url(url: str) -> str:
+    """Normalize a direct URL so equivalent spellings share a cache key"""
+    parts = urlsplit(url.strip())
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values=True)))
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path or '/', query, ''))
+
+
+def direct_url_key(url: str, validator: Optional[str]) -> Optional[str]:
+    """
+    Cache key for a direct URL, None if the server gives no validator
+
+    validator is the response ETag (or Last-Modified), so a changed file
+    at the same URL gets a new key.
+    """
+    if not validator:
+        return None
+    digest = hashlib.sha256(f"{normalize_url(url)}\n{validator}".encode()).hexdigest()
+    return f"url-{digest[:32]}"
+
+
+def youtube_key(video_id: str) -> str:
+    """Cache key for a YouTube video"""
+    return f"yt-{video_id}"
+
+
+source_cache = SourceCache(settings.SOURCE_CACHE_DIR, settings.SOURCE_CACHE_MAX_BYTES)
+transcript_cache = TranscriptCache(settings.TRANSCRIPT_CACHE_DIR, settings.TRANSCRIPT_CACHE_MAX_BYTES)
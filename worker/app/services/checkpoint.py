@@ -0,0 +1,123 @@
+import json
+import os
+import time
+from pathlib import Path
+from typing import List, Optional, Tuple
+from app.config import settings
+from app.utils.logger import logger
+
+
+# Pipeline stages in execution order
+STAGES = ["download", "transcribe", "analyze", "clip", "upload"]
+
+
+class JobManifest:
+    """
+    Per-job record of finished pipeline stages
+
+    Stored as manifest.json in the job's TEMP_DIR workspace. Each stage
+    entry holds the stage's JSON-serializable outputs plus the size of
+    every file it produced, so a resumed job can tell whether those
+    artifacts are still intact before skipping the stage.
+
+    A stage that produces several independent items (e.g. one upload per
+    clip) can also record each item as it finishes; a resumed job then
+    only redoes the missing ones.
+    """
+
+    def __init__(self, job_id: str):
+        self.workspace = Path(settings.TEMP_DIR) / job_id
+        self.path = self.workspace / "manifest.json"
+        self.stages, self.partial = self._read()
+
+    def _read(self) -> Tuple[dict, dict]:
+        if not self.path.exists():
+            return {}, {}
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+            return data.get('stages', {}), data.get('partial', {})
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable manifest {self.path}: {e}")
+            return {}, {}
+
+    def _write(self):
+        self.workspace.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'stages': self.stages, 'partial': self.partial}, f)
+        os.replace(tmp_path, self.path)
+
+    def complete(
+        self,
+        stage: str,
+        outputs,
+        files: Optional[List[str]] = None,
+        invalidate_later: bool = True
+    ):
+        """
+        Record a finished stage
+
+        Later stages are invalidated, unless invalidate_later is False
+        because they ran concurrently on this stage's partial outputs.
+        """
+        if invalidate_later:
+            for later in STAGES[STAGES.index(stage) + 1:]:
+                self.stages.pop(later, None)
+                self.partial.pop(later, None)
+
+        self.partial.pop(stage, None)
+        self.stages[stage] = {
+            'outputs': outputs,
+            'files': {path: os.path.getsize(path) for path in files or []},
+            'completed_at': time.time(),
+        }
+        self._write()
+
+    def invalidate(self, stage: str):
+        """Forget stage and every later one, before stage runs again"""
+        for name in STAGES[STAGES.index(stage):]:
+            self.stages.pop(name, None)
+            self.partial.pop(name, None)
+        self._write()
+
+    def record(self, stage: str, key: str, outputs):
+        """Record one finished item of a stage that is still running"""
+        self.partial.setdefault(stage, {})[key] = outputs
+        self._write()
+
+    def load_partial(self, stage: str) -> dict:
+        """
+        Items recorded for an unfinished stage, keyed as recorded
+
+        Empty unless every earlier stage is still reusable, since the
+        items were produced from those stages' outputs.
+        """
+        index = STAGES.index(stage)
+        if index and self.load(STAGES[index - 1]) is None:
+            return {}
+        return dict(self.partial.get(stage, {}))
+
+    def load(self, stage: str):
+        """
+        Outputs of a finished stage, or None if the stage must run again
+
+        A stage is only reusable if every earlier stage is too and all of
+        its files still exist with their recorded sizes.
+        """
+        for name in STAGES[:STAGES.index(stage) + 1]:
+            entry = self.stages.get(name)
+            if entry is None:
+                return None
+            for path, size in entry['files'].items():
+                if not os.path.exists(path) or os.path.getsize(path) != size:
+                    logger.warning(f"Checkpoint for {name} is stale: {path} missing or changed")
+                    return None
+        return self.stages[stage]['outputs']
+
+    def first_incomplete(self) -> Optional[str]:
+        """First stage that would run on resume, None if all are done"""
+        for stage in STAGES:
+            if self.load(stage) is None:
+                return stage
+        return None
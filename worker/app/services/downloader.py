@@ -0,0 +1,258 @@
+import asyncio
+import json
+import os
+import time
+from typing import List, Optional, Tuple
+import httpx
+from app.config import settings
+from app.utils.logger import logger
+
+
+# Browser-like headers
+DOWNLOAD_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36",
+    "Accept": "*/*",
+    "Accept-Language": "en-US,en;q=0.9",
+    "Referer": "https://www.youtube.com/",
+}
+
+
+class DownloadError(Exception):
+    pass
+
+
+async def download_file(
+    client: httpx.AsyncClient,
+    url: str,
+    dest_path: str,
+    headers: Optional[dict] = None
+) -> dict:
+    """
+    Download url to dest_path over several ranged connections
+
+    The request starts with a one-byte Range probe. If the server supports
+    ranges, the file is preallocated as <dest>.part and split into
+    DOWNLOAD_SEGMENT_BYTES segments fetched by DOWNLOAD_CONNECTIONS
+    parallel requests, each writing DOWNLOAD_BUFFER_BYTES blocks straight
+    to their offset. Finished segments are recorded in <dest>.part.json,
+    so a retry after a failure only fetches what is missing. Otherwise
+    the probe's full response is streamed over its one connection; a 206
+    probe without a total size (Content-Range "bytes 0-0/*") is followed
+    by a plain GET of the whole file. The bytes written are checked
+    against Content-Length (or Content-Range) before <dest>.part is
+    renamed.
+
+    Args:
+        client: Shared HTTP client (its default headers are used)
+        url: Source URL
+        dest_path: Final file path
+        headers: Extra request headers
+
+    Returns:
+        dict: bytes, seconds, mb_per_second, connections, resumed_bytes
+    """
+    headers = headers or {}
+    started = time.monotonic()
+
+    async with client.stream(
+        'GET', url, headers={**headers, 'Range': 'bytes=0-0'}, follow_redirects=True
+    ) as probe:
+        if probe.status_code not in (200, 206):
+            raise DownloadError(f"Download failed: {probe.status_code}")
+        total = _total_size(probe)
+        ranged = probe.status_code == 206 and total is not None
+        if probe.status_code == 200:
+            # Ranges not supported; the probe already is the full response
+            await _write_stream(probe, dest_path, total)
+        validator = probe.headers.get('etag') or probe.headers.get('last-modified')
+        # Use the final URL so segment requests skip the redirect chain
+        url = str(probe.url)
+
+    resumed, connections = 0, 1
+    if ranged:
+        resumed, connections = await _download_ranged(client, url, dest_path, headers, total, validator)
+    elif probe.status_code == 206:
+        # Ranges work but the size is unknown, so it can't be split
+        async with client.stream('GET', url, headers=headers, follow_redirects=True) as response:
+            if response.status_code != 200:
+                raise DownloadError(f"Download failed: {response.status_code}")
+            await _write_stream(response, dest_path, _total_size(response))
+
+    size = os.path.getsize(dest_path)
+    elapsed = time.monotonic() - started
+    stats = {
+        'bytes': size,
+        'seconds': round(elapsed, 2),
+        'mb_per_second': round((size - resumed) / 1024 ** 2 / max(elapsed, 0.001), 2),
+        'connections': connections,
+        'resumed_bytes': resumed,
+    }
+    logger.info(
+        f"Downloaded {os.path.basename(dest_path)}: {size / 1024 ** 2:.1f} MB in {elapsed:.1f}s "
+        f"({stats['mb_per_second']} MB/s over {connections} connection{'s' if connections > 1 else ''}"
+        f"{f', {resumed / 1024 ** 2:.1f} MB resumed' if resumed else ''})"
+    )
+    return stats
+
+
+def _total_size(response) -> Optional[int]:
+    """Full resource size from Content-Range (206) or Content-Length (200)"""
+    content_range = response.headers.get('content-range', '')
+    if '/' in content_range:
+        total = content_range.rsplit('/', 1)[1]
+        return int(total) if total.isdigit() else None
+    length = response.headers.get('content-length')
+    return int(length) if length and length.isdigit() and response.status_code == 200 else None
+
+
+def _plan_segments(total: int) -> List[Tuple[int, int]]:
+    """Inclusive (start, end) byte ranges covering the file"""
+    size = max(1, settings.DOWNLOAD_SEGMENT_BYTES)
+    return [(start, min(start + size, total) - 1) for start in range(0, total, size)]
+
+
+def _load_state(state_path: str, total: int, validator: Optional[str]) -> set:
+    """Segments already on disk from an earlier attempt at the same file"""
+    try:
+        with open(state_path, encoding='utf-8') as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return set()
+    if state.get('total') != total or state.get('validator') != validator:
+        return set()
+    return {tuple(segment) for segment in state.get('done', [])}
+
+
+def _save_state(state_path: str, total: int, validator: Optional[str], done: set):
+    tmp_path = f"{state_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'total': total, 'validator': validator, 'done': sorted(done)}, f)
+    os.replace(tmp_path, state_path)
+
+
+async def _download_ranged(
+    client: httpx.AsyncClient,
+    url: str,
+    dest_path: str,
+    headers: dict,
+    total: int,
+    validator: Optional[str]
+) -> Tuple[int, int]:
+    """Fetch missing segments in parallel; returns (resumed bytes, connections)"""
+    part_path = f"{dest_path}.part"
+    state_path = f"{part_path}.json"
+    segments = _plan_segments(total)
+
+    done = _load_state(state_path, total, validator) if os.path.exists(part_path) else set()
+    resumed = sum(end - start + 1 for start, end in done)
+    if resumed:
+        logger.info(f"Resuming {os.path.basename(dest_path)}: {len(done)}/{len(segments)} segments on disk")
+
+    fd = os.open(part_path, os.O_WRONLY | os.O_CREAT)
+    try:
+        if os.fstat(fd).st_size != total:
+            os.ftruncate(fd, total)
+            if hasattr(os, 'posix_fallocate'):
+                try:
+                    os.posix_fallocate(fd, 0, total)
+                except OSError:
+                    pass  # Filesystem without fallocate, the sparse file still works
+
+        queue = asyncio.Queue()
+        for segment in segments:
+            if segment not in done:
+                queue.put_nowait(segment)
+        connections = max(1, min(settings.DOWNLOAD_CONNECTIONS, queue.qsize()))
+
+        # Bytes actually on disk: resumed segments plus what is written now
+        written = resumed
+
+        async def worker():
+            nonlocal written
+            while not queue.empty():
+                segment = queue.get_nowait()
+                count = await _fetch_segment(client, url, headers, fd, *segment)
+                written += count
+                done.add(segment)
+                _save_state(state_path, total, validator, done)
+
+        tasks = [asyncio.create_task(worker()) for _ in range(connections)]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+    finally:
+        os.close(fd)
+
+    # The .part file is preallocated to total, so its size proves nothing
+    if len(done) != len(segments) or written != total:
+        raise DownloadError(
+            f"Incomplete download: {len(done)}/{len(segments)} segments, {written}/{total} bytes"
+        )
+
+    os.replace(part_path, dest_path)
+    os.remove(state_path)
+    return resumed, connections
+
+
+async def _fetch_segment(client: httpx.AsyncClient, url: str, headers: dict, fd: int, start: int, end: int) -> int:
+    """
+    Write bytes start..end (inclusive) at their offset in fd
+
+    A dropped connection is retried from the last written byte, up to
+    DOWNLOAD_MAX_RETRIES times with exponential backoff.
+
+    Returns:
+        Number of bytes written
+    """
+    position = start
+    attempt = 0
+    while position <= end:
+        try:
+            async with client.stream(
+                'GET', url, headers={**headers, 'Range': f'bytes={position}-{end}'}, follow_redirects=True
+            ) as response:
+                if response.status_code != 206:
+                    raise DownloadError(f"Range request returned {response.status_code}")
+                buffer = bytearray()
+                async for chunk in response.aiter_bytes(chunk_size=256 * 1024):
+                    buffer += chunk
+                    if len(buffer) >= settings.DOWNLOAD_BUFFER_BYTES:
+                        position += _write_at(fd, buffer, position, end)
+                        buffer.clear()
+                if buffer:
+                    position += _write_at(fd, buffer, position, end)
+            if position <= end:
+                raise DownloadError(f"Segment {start}-{end} ended early at {position}")
+        except (httpx.HTTPError, DownloadError) as e:
+            attempt += 1
+            if attempt > settings.DOWNLOAD_MAX_RETRIES:
+                raise DownloadError(f"Segment {start}-{end} failed: {e}")
+            logger.warning(f"Segment {start}-{end} interrupted at {position} ({e}), retrying")
+            await asyncio.sleep(2 ** (attempt - 1))
+    return position - start
+
+
+def _write_at(fd: int, data: bytearray, position: int, end: int) -> int:
+    """pwrite data at position, never past end; returns bytes written"""
+    view = memoryview(data)[:end - position + 1]
+    written = 0
+    while written < len(view):
+        written += os.pwrite(fd, view[written:], position + written)
+    return written
+
+
+async def _write_stream(response, dest_path: str, expected: Optional[int]):
+    """Save a full (non-ranged) response body with buffered writes"""
+    part_path = f"{dest_path}.part"
+    with open(part_path, 'wb', buffering=settings.DOWNLOAD_BUFFER_BYTES) as f:
+        async for chunk in response.aiter_bytes(chunk_size=256 * 1024):
+            f.write(chunk)
+
+    size = os.path.getsize(part_path)
+    if expected is not None and size != expected:
+        os.remove(part_path)
+        raise DownloadError(f"Size mismatch: got {size} bytes, expected {expected}")
+    os.replace(part_path, dest_path)
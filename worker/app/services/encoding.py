@@ -0,0 +1,92 @@
+from typing import Optional
+from app.config import settings
+from app.utils.logger import logger
+
+
+# Named x264/AAC settings for clip renders. threads=None uses
+# RENDER_THREADS_PER_ENCODE; bitrate_scale multiplies the BITRATE_LADDER cap.
+ENCODING_PROFILES = {
+    # Fast preview quality, meant to be replaced (see draft_preview)
+    "draft": {
+        "preset": "ultrafast",
+        "crf": 28,
+        "threads": 1,
+        "audio_bitrate": "96k",
+        "bitrate_scale": 0.6,
+    },
+    "standard": {
+        "preset": "medium",
+        "crf": 23,
+        "threads": None,
+        "audio_bitrate": "128k",
+        "bitrate_scale": 1.0,
+    },
+    # Best quality for an otherwise idle worker
+    "archival": {
+        "preset": "slow",
+        "crf": 18,
+        "threads": None,
+        "audio_bitrate": "192k",
+        "bitrate_scale": 1.5,
+    },
+}
+
+DEFAULT_ENCODING = "standard"
+
+
+def get_encoding(name: Optional[str]) -> dict:
+    """Settings of an encoding profile (unknown names get the standard one)"""
+    return ENCODING_PROFILES.get(name or DEFAULT_ENCODING, ENCODING_PROFILES[DEFAULT_ENCODING])
+
+
+def encode_threads(name: Optional[str]) -> int:
+    """FFmpeg threads per encode for an encoding profile"""
+    return get_encoding(name)["threads"] or settings.RENDER_THREADS_PER_ENCODE
+
+
+class EncodingScheduler:
+    """
+    Picks an encoding profile per job from load and priority
+
+    Load is the number of other unfinished jobs in the job store (see
+    JobStore.count_unfinished), so every worker process sharing the store
+    sees the same depth, queued jobs included. High priority jobs never
+    get drafts, and get archival quality when nothing else is running.
+    Normal priority jobs fall back to drafts at ENCODING_BUSY_DEPTH other
+    jobs, low priority ones as soon as any other job is running.
+    ENCODING_PROFILE other than "auto" disables the choice.
+    """
+
+    def __init__(self):
+        self.chosen = {name: 0 for name in ENCODING_PROFILES}
+
+    def choose(self, priority: Optional[str] = None, active: int = 1) -> str:
+        """
+        Encoding profile for a job
+
+        Args:
+            priority: Job priority (high, normal or low)
+            active: Unfinished jobs in the job store, this one included
+        """
+        if settings.ENCODING_PROFILE in ENCODING_PROFILES:
+            name = settings.ENCODING_PROFILE
+        else:
+            others = max(0, active - 1)
+            if priority == "high":
+                name = "archival" if others == 0 else "standard"
+            elif priority == "low":
+                name = "draft" if others > 0 else "standard"
+            else:
+                name = "draft" if others >= settings.ENCODING_BUSY_DEPTH else "standard"
+
+        self.chosen[name] += 1
+        logger.info(f"Encoding profile {name} ({priority or 'normal'} priority, {active} unfinished jobs)")
+        return name
+
+    def stats(self) -> dict:
+        return {
+            "chosen": dict(self.chosen),
+        }
+
+
+encoding_scheduler = EncodingScheduler()
@@ -0,0 +1,223 @@
+import asyncio
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+import httpx
+from app.config import settings
+from app.utils.logger import logger
+
+
+# Public Invidious instances - these proxy YouTube requests
+INVIDIOUS_INSTANCES = [
+    "https://inv.nadeko.net",
+    "https://yt.artemislena.eu",
+    "https://invidious.nerdvpn.de",
+    "https://invidious.jing.rocks",
+    "https://iv.nboez.cc",
+    "https://invidious.einfachzocken.eu",
+    "https://inv.vern.cc",
+]
+
+# Weight of the newest observation in the latency/success moving averages
+EWMA_ALPHA = 0.3
+
+# Assumed latency (seconds) of an instance we have never measured
+DEFAULT_LATENCY = 2.0
+
+
+class InvidiousPool:
+    """
+    Health-scored set of Invidious instances
+
+    Each instance keeps an exponentially weighted moving average of its
+    metadata latency and success rate. Instances are ranked by expected
+    time to a good answer (latency / success rate), and the metadata
+    request is raced against the best INVIDIOUS_RACE_WIDTH of them. After
+    INVIDIOUS_BREAKER_THRESHOLD consecutive failures an instance's circuit
+    opens and it is skipped for INVIDIOUS_BREAKER_COOLDOWN seconds, then
+    retried once (half-open). Scores are persisted to a JSON file so a
+    restarted worker doesn't rediscover dead mirrors the slow way.
+    """
+
+    def __init__(self, instances: List[str], state_path: Optional[str] = None):
+        self.instances = list(instances)
+        self.state_path = Path(state_path) if state_path else None
+        self.health: Dict[str, dict] = {instance: self._new_health() for instance in self.instances}
+        self._load()
+
+    @staticmethod
+    def _new_health() -> dict:
+        return {
+            'latency': DEFAULT_LATENCY,
+            'success': 1.0,
+            'failures': 0,
+            'open_until': 0.0,
+        }
+
+    def _load(self):
+        if not self.state_path or not self.state_path.exists():
+            return
+        try:
+            with open(self.state_path, encoding='utf-8') as f:
+                saved = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable Invidious state {self.state_path}: {e}")
+            return
+        for instance, health in saved.items():
+            if instance in self.health:
+                self.health[instance].update(health)
+
+    def _save(self):
+        if not self.state_path:
+            return
+        try:
+            self.state_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.state_path.with_suffix(f'.{os.getpid()}.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.health, f)
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            logger.warning(f"Could not save Invidious state: {e}")
+
+    def ranked(self, exclude: Iterable[str] = ()) -> List[str]:
+        """
+        Usable instances, best first
+
+        Closed circuits are ranked by expected latency; instances whose
+        cooldown has expired (half-open) come after them.
+        """
+        now = time.time()
+        excluded = set(exclude)
+        closed, half_open = [], []
+        for instance in self.instances:
+            if instance in excluded:
+                continue
+            health = self.health[instance]
+            if health['failures'] < settings.INVIDIOUS_BREAKER_THRESHOLD:
+                closed.append(instance)
+            elif health['open_until'] <= now:
+                half_open.append(instance)
+
+        def expected_latency(instance: str) -> float:
+            health = self.health[instance]
+            return health['latency'] / max(health['success'], 0.05)
+
+        return sorted(closed, key=expected_latency) + half_open
+
+    def record_success(self, instance: str, latency: float):
+        health = self.health[instance]
+        health['latency'] += EWMA_ALPHA * (latency - health['latency'])
+        health['success'] += EWMA_ALPHA * (1.0 - health['success'])
+        health['failures'] = 0
+        health['open_until'] = 0.0
+        self._save()
+
+    def record_failure(self, instance: str):
+        health = self.health[instance]
+        health['success'] -= EWMA_ALPHA * health['success']
+        health['failures'] += 1
+        if health['failures'] >= settings.INVIDIOUS_BREAKER_THRESHOLD:
+            health['open_until'] = time.time() + settings.INVIDIOUS_BREAKER_COOLDOWN
+            logger.warning(
+                f"Invidious instance {instance} failed {health['failures']} times in a row, "
+                f"skipping it for {settings.INVIDIOUS_BREAKER_COOLDOWN}s"
+            )
+        self._save()
+
+    async def fetch_video_info(
+        self,
+        client: httpx.AsyncClient,
+        video_id: str,
+        exclude: Iterable[str] = ()
+    ) -> Tuple[str, dict]:
+        """
+        Get video metadata from the fastest healthy instance
+
+        Up to INVIDIOUS_RACE_WIDTH requests are in flight at once; each
+        failure is replaced by the next ranked instance, and the first
+        usable answer cancels the rest.
+
+        Returns:
+            tuple: (instance URL, video info JSON)
+        """
+        candidates = self.ranked(exclude)
+        if not candidates:
+            raise Exception("No healthy Invidious instances available")
+
+        pending: Dict[asyncio.Task, str] = {}
+        errors = {}
+
+        def start_next():
+            if candidates:
+                instance = candidates.pop(0)
+                pending[asyncio.create_task(self._video_info(client, instance, video_id))] = instance
+
+        for _ in range(max(1, settings.INVIDIOUS_RACE_WIDTH)):
+            start_next()
+
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    instance = pending.pop(task)
+                    if task.exception() is None:
+                        return instance, task.result()
+                    errors[instance] = task.exception()
+                    logger.warning(f"{instance} failed: {task.exception()}")
+                    start_next()
+        finally:
+            for task in pending:
+                task.cancel()
+
+        details = ", ".join(f"{instance}: {error}" for instance, error in errors.items())
+        raise Exception(f"All Invidious instances failed. {details}")
+
+    async def _video_info(self, client: httpx.AsyncClient, instance: str, video_id: str) -> dict:
+        """One timed metadata request; the outcome updates the instance's health"""
+        started = time.monotonic()
+        try:
+            # local=true for stream URLs proxied through the instance
+            response = await client.get(
+                f"{instance}/api/v1/videos/{video_id}?local=true",
+                follow_redirects=True,
+                timeout=settings.INVIDIOUS_METADATA_TIMEOUT
+            )
+            if response.status_code != 200:
+                raise Exception(f"returned {response.status_code}")
+            data = response.json()
+            if not data.get('formatStreams') and not data.get('adaptiveFormats'):
+                raise Exception("no streams in response")
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.record_failure(instance)
+            raise
+
+        self.record_success(instance, time.monotonic() - started)
+        return data
+
+    def stats(self) -> dict:
+        """Current health of every instance"""
+        now = time.time()
+        return {
+            instance: {
+                'latency': round(health['latency'], 3),
+                'success': round(health['success'], 3),
+                'failures': health['failures'],
+                'circuit_open': health['failures'] >= settings.INVIDIOUS_BREAKER_THRESHOLD
+                    and health['open_until'] > now,
+            }
+            for instance, health in self.health.items()
+        }
+
+
+def get_instances() -> List[str]:
+    """Configured instance list (INVIDIOUS_INSTANCES overrides the built-in one)"""
+    if settings.INVIDIOUS_INSTANCES:
+        return [url.strip().rstrip('/') for url in settings.INVIDIOUS_INSTANCES.split(',') if url.strip()]
+    return INVIDIOUS_INSTANCES
+
+
+invidious_pool = InvidiousPool(get_instances(), settings.INVIDIOUS_STATE_PATH)
@@ -0,0 +1,305 @@
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+from app.config import settings
+from app.utils.logger import logger
+
+
+# Statuses after which a job no longer changes and can expire
+FINISHED_STATUSES = ("completed", "failed")
+
+# Job fields stored as JSON text
+JSON_FIELDS = ("result", "request", "metrics")
+
+
+class JobStore:
+    """
+    Interface for job state storage
+
+    Jobs are plain dicts shaped like app.models.JobStatus. Backends must
+    apply each update() atomically so concurrent writers (background
+    tasks, other worker processes) never see a half-written job.
+    """
+
+    def create(self, job: dict) -> None:
+        raise NotImplementedError
+
+    def get(self, job_id: str) -> Optional[dict]:
+        raise NotImplementedError
+
+    def update(self, job_id: str, **fields) -> None:
+        """
+        Set fields of a job
+
+        A finished status starts the job's TTL; any other status clears
+        it, so a resumed job cannot expire while it runs.
+
+        Raises:
+            ValueError: a field is not a job column (see SQLiteJobStore.COLUMNS)
+        """
+        raise NotImplementedError
+
+    def list_by_project(self, project_id: str) -> List[dict]:
+        raise NotImplementedError
+
+    def list_by_user(self, user_id: str) -> List[dict]:
+        raise NotImplementedError
+
+    def purge_expired(self) -> int:
+        """Delete finished jobs older than JOB_TTL_SECONDS, return count"""
+        raise NotImplementedError
+
+    def count_unfinished(self, max_idle: Optional[float] = None) -> int:
+        """Jobs not yet finished, skipping those not updated for max_idle seconds"""
+        raise NotImplementedError
+
+    def idle_seconds(self, job_id: str) -> Optional[float]:
+        """Seconds since the job was last updated, None if it doesn't exist"""
+        raise NotImplementedError
+
+
+class MemoryJobStore(JobStore):
+    """Process-local store, only suitable for a single uvicorn worker"""
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self.jobs: Dict[str, dict] = {}
+        self.lock = threading.Lock()
+
+    def create(self, job: dict) -> None:
+        now = time.time()
+        with self.lock:
+            self.jobs[job["id"]] = {**job, "updated_at": now, "finished_at": None}
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return _public(job) if job and not self._expired(job) else None
+
+    def update(self, job_id: str, **fields) -> None:
+        _check_fields(fields)
+        now = time.time()
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return
+            job.update(fields)
+            job["updated_at"] = now
+            if "status" in fields:
+                job["finished_at"] = now if fields["status"] in FINISHED_STATUSES else None
+
+    def list_by_project(self, project_id: str) -> List[dict]:
+        return self._list("project_id", project_id)
+
+    def list_by_user(self, user_id: str) -> List[dict]:
+        return self._list("user_id", user_id)
+
+    def purge_expired(self) -> int:
+        with self.lock:
+            expired = [job_id for job_id, job in self.jobs.items() if self._expired(job)]
+            for job_id in expired:
+                del self.jobs[job_id]
+        return len(expired)
+
+    def count_unfinished(self, max_idle: Optional[float] = None) -> int:
+        since = time.time() - max_idle if max_idle else 0
+        with self.lock:
+            return sum(
+                1 for job in self.jobs.values()
+                if job.get("status") not in FINISHED_STATUSES and job["updated_at"] >= since
+            )
+
+    def idle_seconds(self, job_id: str) -> Optional[float]:
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return time.time() - job["updated_at"] if job else None
+
+    def _list(self, field: str, value: str) -> List[dict]:
+        with self.lock:
+            return [
+                _public(job) for job in self.jobs.values()
+                if job.get(field) == value and not self._expired(job)
+            ]
+
+    def _expired(self, job: dict) -> bool:
+        return bool(job.get("finished_at")) and job["finished_at"] < time.time() - self.ttl
+
+
+class SQLiteJobStore(JobStore):
+    """
+    SQLite-backed store shared by every worker process on the host
+
+    Runs in WAL mode so status polls never block writers. Each update is
+    a single UPDATE statement, which SQLite applies atomically.
+    """
+
+    COLUMNS = {
+        "id": "TEXT PRIMARY KEY",
+        "status": "TEXT NOT NULL",
+        "progress": "INTEGER NOT NULL DEFAULT 0",
+        "project_id": "TEXT NOT NULL",
+        "user_id": "TEXT NOT NULL",
+        "created_at": "TEXT",
+        "result": "TEXT",
+        "error": "TEXT",
+        "request": "TEXT",
+        "metrics": "TEXT",
+        "updated_at": "REAL NOT NULL",
+        "finished_at": "REAL",
+    }
+
+    def __init__(self, path: str, ttl: int):
+        self.path = path
+        self.ttl = ttl
+        self.local = threading.local()
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._init_schema()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self.local.conn = conn
+        return conn
+
+    def _init_schema(self):
+        conn = self._connect()
+        columns = ", ".join(f"{name} {spec}" for name, spec in self.COLUMNS.items())
+        conn.execute(f"CREATE TABLE IF NOT EXISTS jobs ({columns})")
+
+        # Add columns introduced after the table was first created
+        existing = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+        for name, spec in self.COLUMNS.items():
+            if name not in existing:
+                conn.execute(f"ALTER TABLE jobs ADD COLUMN {name} {spec.replace('NOT NULL', '')}")
+
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_project ON jobs (project_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_user ON jobs (user_id)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs (finished_at)")
+
+    def create(self, job: dict) -> None:
+        row = self._encode({**job, "updated_at": time.time(), "finished_at": None})
+        names = [name for name in self.COLUMNS if name in row]
+        placeholders = ", ".join("?" for _ in names)
+        self._connect().execute(
+            f"INSERT INTO jobs ({', '.join(names)}) VALUES ({placeholders})",
+            [row[name] for name in names]
+        )
+
+    def get(self, job_id: str) -> Optional[dict]:
+        row = self._connect().execute(
+            "SELECT * FROM jobs WHERE id = ? AND NOT " + self._expired_clause(),
+            (job_id, time.time() - self.ttl)
+        ).fetchone()
+        return self._decode(row) if row else None
+
+    def update(self, job_id: str, **fields) -> None:
+        _check_fields(fields)
+
+        now = time.time()
+        row = self._encode({**fields, "updated_at": now})
+        if "status" in fields:
+            row["finished_at"] = now if fields["status"] in FINISHED_STATUSES else None
+
+        assignments = ", ".join(f"{name} = ?" for name in row)
+        self._connect().execute(
+            f"UPDATE jobs SET {assignments} WHERE id = ?",
+            [*row.values(), job_id]
+        )
+
+    def list_by_project(self, project_id: str) -> List[dict]:
+        return self._list("project_id", project_id)
+
+    def list_by_user(self, user_id: str) -> List[dict]:
+        return self._list("user_id", user_id)
+
+    def purge_expired(self) -> int:
+        cursor = self._connect().execute(
+            "DELETE FROM jobs WHERE " + self._expired_clause(),
+            (time.time() - self.ttl,)
+        )
+        return cursor.rowcount
+
+    def count_unfinished(self, max_idle: Optional[float] = None) -> int:
+        statuses = ", ".join("?" for _ in FINISHED_STATUSES)
+        row = self._connect().execute(
+            f"SELECT COUNT(*) FROM jobs WHERE status NOT IN ({statuses}) AND updated_at >= ?",
+            (*FINISHED_STATUSES, time.time() - max_idle if max_idle else 0)
+        ).fetchone()
+        return row[0]
+
+    def idle_seconds(self, job_id: str) -> Optional[float]:
+        row = self._connect().execute(
+            "SELECT updated_at FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        return time.time() - row["updated_at"] if row else None
+
+    def _list(self, field: str, value: str) -> List[dict]:
+        rows = self._connect().execute(
+            f"SELECT * FROM jobs WHERE {field} = ? AND NOT {self._expired_clause()} "
+            "ORDER BY created_at DESC",
+            (value, time.time() - self.ttl)
+        ).fetchall()
+        return [self._decode(row) for row in rows]
+
+    @staticmethod
+    def _expired_clause() -> str:
+        return "(finished_at IS NOT NULL AND finished_at < ?)"
+
+    @staticmethod
+    def _encode(job: dict) -> dict:
+        row = dict(job)
+        for name in JSON_FIELDS:
+            if row.get(name) is not None:
+                row[name] = json.dumps(row[name], default=_json_default)
+        if isinstance(row.get("created_at"), datetime):
+            row["created_at"] = row["created_at"].isoformat()
+        return row
+
+    @staticmethod
+    def _decode(row: sqlite3.Row) -> dict:
+        job = dict(row)
+        for name in JSON_FIELDS:
+            if job.get(name) is not None:
+                job[name] = json.loads(job[name])
+        return _public(job)
+
+
+def _check_fields(fields: dict):
+    """Reject fields that are not job columns, whatever the backend"""
+    unknown = set(fields) - set(SQLiteJobStore.COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown job fields: {', '.join(sorted(unknown))}")
+
+
+def _public(job: dict) -> dict:
+    """Drop store bookkeeping fields before handing a job out"""
+    return {key: value for key, value in job.items() if key not in ("updated_at", "finished_at")}
+
+
+def _json_default(value):
+    """Serialize pydantic models (e.g. ClipResult) inside job results"""
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json")
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def create_job_store() -> JobStore:
+    """Build the job store selected by JOB_STORE_BACKEND"""
+    if settings.JOB_STORE_BACKEND == "memory":
+        logger.warning("Using in-memory job store; jobs are lost on restart")
+        return MemoryJobStore(ttl=settings.JOB_TTL_SECONDS)
+
+    if settings.JOB_STORE_BACKEND == "sqlite":
+        return SQLiteJobStore(settings.JOB_STORE_PATH, ttl=settings.JOB_TTL_SECONDS)
+
+    raise ValueError(f"Unknown JOB_STORE_BACKEND: {settings.JOB_STORE_BACKEND}")
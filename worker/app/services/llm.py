@@ -0,0 +1,176 @@
+import asyncio
+import time
+from typing import Callable, List, Optional, Tuple, Union
+from app.config import settings
+from app.utils.logger import logger
+
+
+SYSTEM_PROMPT = "You are an expert at identifying viral TikTok/Reels moments. Always respond with valid JSON only."
+
+
+class LLMProvider:
+    """
+    One LLM backend with its own timeout and concurrency limit
+
+    Subclasses implement _complete() with a long-lived async client;
+    complete() adds the per-provider semaphore and timeout around it.
+    """
+
+    name = "provider"
+
+    def __init__(self, timeout: float, concurrency: int):
+        self.timeout = timeout
+        self.semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def complete(self, prompt: str) -> str:
+        async with self.semaphore:
+            try:
+                return await asyncio.wait_for(self._complete(prompt), timeout=self.timeout)
+            except asyncio.TimeoutError:
+                raise TimeoutError(f"{self.name} timed out after {self.timeout}s")
+
+    async def _complete(self, prompt: str) -> str:
+        raise NotImplementedError
+
+
+class GroqProvider(LLMProvider):
+    """Groq LLaMA - faster and no rate limits"""
+
+    name = "groq"
+
+    def __init__(self, timeout: float, concurrency: int):
+        super().__init__(timeout, concurrency)
+        from groq import AsyncGroq
+        self.client = AsyncGroq(api_key=settings.GROQ_API_KEY)
+
+    async def _complete(self, prompt: str) -> str:
+        response = await self.client.chat.completions.create(
+            model=settings.GROQ_MODEL,
+            messages=[
+                {"role": "system", "content": SYSTEM_PROMPT},
+                {"role": "user", "content": prompt}
+            ],
+            temperature=0.7,
+            max_tokens=4096,
+        )
+        return response.choices[0].message.content
+
+
+class GeminiProvider(LLMProvider):
+    """Google Gemini - fallback option"""
+
+    name = "gemini"
+
+    def __init__(self, timeout: float, concurrency: int):
+        super().__init__(timeout, concurrency)
+        import google.generativeai as genai
+        genai.configure(api_key=settings.GEMINI_API_KEY)
+        self.model = genai.GenerativeModel(settings.GEMINI_MODEL)
+
+    async def _complete(self, prompt: str) -> str:
+        response = await self.model.generate_content_async(prompt)
+        return response.text
+
+
+class FakeProvider(LLMProvider):
+    """
+    Local stand-in for tests
+
+    Returns canned responses in order (the last one repeats) after an
+    optional delay; an Exception in the list is raised instead.
+    """
+
+    def __init__(
+        self,
+        responses: List[Union[str, Exception]],
+        delay: float = 0.0,
+        name: str = "fake",
+        timeout: float = 30.0,
+        concurrency: int = 10
+    ):
+        super().__init__(timeout, concurrency)
+        self.responses = list(responses)
+        self.delay = delay
+        self.name = name
+        self.calls = 0
+
+    async def _complete(self, prompt: str) -> str:
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        response = self.responses[min(self.calls, len(self.responses)) - 1]
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+async def _attempt(provider: LLMProvider, prompt: str, parse: Callable[[str], object]):
+    """Call a provider and parse its answer; parse errors count as failures"""
+    started = time.monotonic()
+    logger.info(f"Using {provider.name} for viral moment analysis")
+    result = parse(await provider.complete(prompt))
+    logger.info(f"{provider.name} analysis successful in {time.monotonic() - started:.1f}s")
+    return result
+
+
+async def complete_with_fallback(
+    prompt: str,
+    parse: Callable[[str], object],
+    primary: LLMProvider,
+    fallback: LLMProvider,
+    hedge_delay: Optional[float] = None
+) -> Tuple[object, str]:
+    """
+    Get a parsed answer from primary, falling back on failure
+
+    Without hedge_delay the fallback is only called after the primary
+    has failed. With hedge_delay, the fallback is also started if the
+    primary hasn't produced a valid parse within that many seconds, and
+    whichever valid parse arrives first wins; the other call is cancelled.
+
+    Returns:
+        tuple: (parsed result, name of the provider that answered)
+    """
+    primary_task = asyncio.create_task(_attempt(primary, prompt, parse))
+    pending = {primary_task: primary}
+    errors = {}
+
+    try:
+        if hedge_delay is not None:
+            done, _ = await asyncio.wait({primary_task}, timeout=hedge_delay)
+            if not done:
+                logger.info(f"{primary.name} slower than {hedge_delay}s, hedging with {fallback.name}")
+                pending[asyncio.create_task(_attempt(fallback, prompt, parse))] = fallback
+
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                provider = pending.pop(task)
+                if task.exception() is None:
+                    return task.result(), provider.name
+                errors[provider.name] = task.exception()
+                logger.warning(f"{provider.name} failed: {task.exception()}")
+
+            # Primary failed without a hedge in flight; fall back now
+            if not pending and fallback.name not in errors:
+                pending[asyncio.create_task(_attempt(fallback, prompt, parse))] = fallback
+    finally:
+        for task in pending:
+            task.cancel()
+
+    details = ", ".join(f"{name}: {error}" for name, error in errors.items())
+    logger.error(f"Both AI providers failed. {details}")
+    raise Exception(f"AI analysis failed: {errors.get(fallback.name) or details}")
+
+
+_providers: Optional[Tuple[LLMProvider, LLMProvider]] = None
+
+
+def get_providers() -> Tuple[LLMProvider, LLMProvider]:
+    """Long-lived (primary, fallback) providers shared by all jobs"""
+    global _providers
+    if _providers is None:
+        _providers = (
+            GroqProvider(settings.LLM_GROQ_TIMEOUT, settings.LLM_GROQ_CONCURRENCY),
+            GeminiProvider(settings.LLM_GEMINI_TIMEOUT, settings.LLM_GEMINI_CONCURRENCY),
+        )
+    return _providers
@@ -0,0 +1,207 @@
+import re
+from typing import List, Optional
+import numpy as np
+from app.config import settings
+from app.models import ViralMoment
+from app.utils.logger import logger
+from app.utils.process import run_process
+
+
+# Sample rate for loudness analysis; speech energy needs nothing finer
+LOUDNESS_SAMPLE_RATE = 8000
+
+# Hook words that tend to open viral moments (English and Indonesian)
+HOOK_KEYWORDS = {
+    "secret", "rahasia", "why", "kenapa", "mengapa", "how", "cara", "never",
+    "jangan", "wow", "gila", "amazing", "luar", "biasa", "important", "penting",
+    "tips", "trik", "shocking", "kaget", "ternyata", "best", "terbaik", "worst",
+    "terburuk", "mistake", "salah", "money", "uang", "free", "gratis", "truth",
+    "fakta", "crazy", "viral", "stop", "berhenti", "must", "harus",
+}
+
+# Relative weight of each window feature in the combined score
+FEATURE_WEIGHTS = {
+    "loudness": 1.0,
+    "dynamics": 0.5,
+    "speech_rate": 1.0,
+    "pauses": -0.5,
+    "questions": 0.75,
+    "keywords": 1.0,
+}
+
+
+async def load_loudness(audio_path: str) -> np.ndarray:
+    """
+    RMS loudness of the audio per second
+
+    Audio is decoded by FFmpeg to 8 kHz mono 16-bit PCM and reduced with
+    NumPy in one pass; returns an empty array if decoding fails.
+    """
+    try:
+        result = await run_process([
+            'ffmpeg',
+            '-i', audio_path,
+            '-vn',
+            '-ac', '1',
+            '-ar', str(LOUDNESS_SAMPLE_RATE),
+            '-f', 's16le',
+            '-'
+        ], capture_stdout=True, text=False)
+    except Exception as e:
+        logger.warning(f"Loudness analysis failed for {audio_path}: {e}")
+        return np.zeros(0, dtype=np.float32)
+
+    samples = np.frombuffer(result.stdout, dtype=np.int16).astype(np.float32) / 32768.0
+    seconds = len(samples) // LOUDNESS_SAMPLE_RATE
+    if seconds == 0:
+        return np.zeros(0, dtype=np.float32)
+
+    frames = samples[:seconds * LOUDNESS_SAMPLE_RATE].reshape(seconds, LOUDNESS_SAMPLE_RATE)
+    return np.sqrt(np.mean(frames ** 2, axis=1))
+
+
+def per_second_features(segments: List[dict], duration: int) -> dict:
+    """
+    Spread transcript segment statistics onto a per-second timeline
+
+    Each segment's words, question marks and hook keywords are shared
+    evenly across the seconds it spans; speech coverage marks which
+    seconds contain any speech (the rest are pauses).
+    """
+    words = np.zeros(duration, dtype=np.float32)
+    questions = np.zeros(duration, dtype=np.float32)
+    keywords = np.zeros(duration, dtype=np.float32)
+    coverage = np.zeros(duration, dtype=np.float32)
+
+    for segment in segments:
+        first = int(max(0, min(duration - 1, segment['start'])))
+        last = int(max(first, min(duration - 1, segment['end'])))
+        span = last - first + 1
+
+        tokens = re.findall(r'\w+', segment['text'].lower())
+        words[first:last + 1] += len(tokens) / span
+        questions[last] += segment['text'].count('?')
+        keywords[first:last + 1] += sum(token in HOOK_KEYWORDS for token in tokens) / span
+        coverage[first:last + 1] = 1.0
+
+    return {
+        "words": words,
+        "questions": questions,
+        "keywords": keywords,
+        "coverage": coverage,
+    }
+
+
+def window_sums(values: np.ndarray, window: int, stride: int) -> np.ndarray:
+    """Sum of values over every window, via a cumulative sum"""
+    cumulative = np.concatenate(([0.0], np.cumsum(values, dtype=np.float64)))
+    starts = np.arange(0, max(1, len(values) - window + 1), stride)
+    ends = np.minimum(starts + window, len(values))
+    return cumulative[ends] - cumulative[starts]
+
+
+def zscore(values: np.ndarray) -> np.ndarray:
+    std = values.std()
+    return (values - values.mean()) / std if std > 0 else np.zeros_like(values)
+
+
+async def score_windows(transcript: dict, audio_path: Optional[str]) -> List[dict]:
+    """
+    Score every candidate window of the video locally
+
+    Windows are PRESCORE_WINDOW_SECONDS long every PRESCORE_STRIDE_SECONDS.
+    Features (mean loudness, loudness spread, words per second, pause
+    ratio, questions, hook keyword density) are z-scored across the
+    video and combined with FEATURE_WEIGHTS.
+
+    Returns:
+        List of {'start', 'end', 'score'} dicts, best first
+    """
+    segments = transcript.get('segments') or []
+    if not segments:
+        return []
+
+    loudness = await load_loudness(audio_path) if audio_path else np.zeros(0, dtype=np.float32)
+    duration = max(1, int(np.ceil(max(max(s['end'] for s in segments), len(loudness)))))
+    window = max(1, min(settings.PRESCORE_WINDOW_SECONDS, duration))
+    stride = max(1, settings.PRESCORE_STRIDE_SECONDS)
+
+    features = per_second_features(segments, duration)
+    if len(loudness) < duration:
+        loudness = np.pad(loudness, (0, duration - len(loudness)))
+
+    loudness_sum = window_sums(loudness, window, stride)
+    loudness_sq = window_sums(loudness ** 2, window, stride)
+    mean_loudness = loudness_sum / window
+    dynamics = np.sqrt(np.maximum(loudness_sq / window - mean_loudness ** 2, 0))
+
+    columns = {
+        "loudness": mean_loudness,
+        "dynamics": dynamics,
+        "speech_rate": window_sums(features["words"], window, stride) / window,
+        "pauses": 1.0 - window_sums(features["coverage"], window, stride) / window,
+        "questions": window_sums(features["questions"], window, stride),
+        "keywords": window_sums(features["keywords"], window, stride)
+            / np.maximum(window_sums(features["words"], window, stride), 1.0),
+    }
+
+    scores = sum(weight * zscore(columns[name]) for name, weight in FEATURE_WEIGHTS.items())
+    starts = np.arange(len(scores)) * stride
+
+    order = np.argsort(-scores, kind="stable")
+    return [
+        {'start': float(starts[i]), 'end': float(starts[i] + window), 'score': float(scores[i])}
+        for i in order
+    ]
+
+
+def shortlist(windows: List[dict], count: int) -> List[dict]:
+    """Best-scoring windows that don't overlap each other, best first"""
+    selected = []
+    for candidate in windows:
+        if all(candidate['end'] <= kept['start'] or candidate['start'] >= kept['end'] for kept in selected):
+            selected.append(candidate)
+        if len(selected) >= count:
+            break
+    return selected
+
+
+def segments_in_windows(segments: List[dict], windows: List[dict]) -> List[dict]:
+    """Transcript segments overlapping any shortlisted window, in time order"""
+    return [
+        segment for segment in segments
+        if any(segment['end'] > w['start'] and segment['start'] < w['end'] for w in windows)
+    ]
+
+
+def moments_from_shortlist(transcript: dict, windows: List[dict], target_count: int) -> List[ViralMoment]:
+    """
+    Build moments straight from the local shortlist
+
+    Used as a degraded result when every LLM provider fails: scores are
+    mapped onto 0-10 and the text comes from the window's segments.
+    """
+    if not windows:
+        return []
+
+    top = windows[:target_count]
+    scores = np.array([w['score'] for w in top])
+    spread = scores.max() - scores.min()
+    scaled = 5 + 4 * (scores - scores.min()) / spread if spread > 0 else np.full(len(top), 6.0)
+
+    moments = []
+    for window, score in zip(top, scaled):
+        segments = segments_in_windows(transcript['segments'], [window])
+        text = ' '.join(segment['text'].strip() for segment in segments)
+        tokens = re.findall(r'\w+', text.lower())
+        moments.append(ViralMoment(
+            start_time=window['start'],
+            end_time=min(window['end'], window['start'] + settings.MAX_CLIP_DURATION),
+            transcript=text,
+            viral_score=round(float(score), 1),
+            reason="Selected by local audio/speech scoring (AI analysis unavailable)",
+            keywords=sorted({token for token in tokens if token in HOOK_KEYWORDS})[:5],
+            hook_type="question" if '?' in text else "story",
+            view_prediction=10000
+        ))
+    return moments
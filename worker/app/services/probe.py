@@ -0,0 +1,267 @@
+import bisect
+import json
+import os
+import subprocess
+from pathlib import Path
+from typing import List, Optional
+from app.services.downloader import DOWNLOAD_HEADERS
+from app.utils.logger import logger
+from app.utils.process import run_process
+
+
+def is_remote(source: str) -> bool:
+    """Whether source is an HTTP(S) URL rather than a local file"""
+    return source.startswith(('http://', 'https://'))
+
+
+def input_args(source: str) -> List[str]:
+    """
+    FFmpeg/ffprobe arguments to open source as an input
+
+    Remote sources get browser headers and reconnect options; combined
+    with -ss before the input, FFmpeg then seeks with HTTP range requests
+    and reads only the bytes around the requested time range.
+    """
+    if not is_remote(source):
+        return ['-i', source]
+
+    headers = ''.join(f"{name}: {value}\r\n" for name, value in DOWNLOAD_HEADERS.items())
+    return [
+        '-reconnect', '1',
+        '-reconnect_on_network_error', '1',
+        '-reconnect_delay_max', '5',
+        '-headers', headers,
+        '-i', source
+    ]
+
+
+async def probe_video(video_path: str) -> dict:
+    """
+    Probe the first video stream of a source with ffprobe
+
+    Returns:
+        dict with width, height, codec, pix_fmt and duration
+    """
+    cmd = [
+        'ffprobe',
+        '-v', 'error',
+        '-select_streams', 'v:0',
+        '-show_entries', 'stream=width,height,codec_name,pix_fmt:format=duration',
+        '-of', 'json',
+        *input_args(video_path)
+    ]
+
+    result = await run_process(cmd, capture_stdout=True)
+    data = json.loads(result.stdout or '{}')
+
+    streams = data.get('streams') or [{}]
+    stream = streams[0]
+
+    return {
+        'width': int(stream.get('width') or 0),
+        'height': int(stream.get('height') or 0),
+        'codec': stream.get('codec_name', ''),
+        'pix_fmt': stream.get('pix_fmt', ''),
+        'duration': float(data.get('format', {}).get('duration') or 0),
+    }
+
+
+async def get_duration(media_path: str) -> float:
+    """Container duration in seconds (0 if unknown)"""
+    cmd = [
+        'ffprobe',
+        '-v', 'error',
+        '-show_entries', 'format=duration',
+        '-of', 'csv=p=0',
+        *input_args(media_path)
+    ]
+
+    result = await run_process(cmd, capture_stdout=True)
+    try:
+        return float(result.stdout.strip())
+    except ValueError:
+        return 0.0
+
+
+async def get_keyframes(
+    video_path: str,
+    start: float,
+    end: float,
+    index: Optional[List[float]] = None
+) -> List[float]:
+    """
+    List video keyframe timestamps between start and end (seconds)
+
+    With a keyframe index (see get_source_profile) this is a lookup;
+    otherwise only packets around the requested window are read, so it
+    is still cheap even late in a long source.
+    """
+    if index is not None:
+        return index[bisect.bisect_left(index, start):bisect.bisect_right(index, end)]
+
+    cmd = [
+        'ffprobe',
+        '-v', 'error',
+        '-select_streams', 'v:0',
+        '-read_intervals', f'{max(0.0, start - 1):.3f}%{end + 1:.3f}',
+        '-show_entries', 'packet=pts_time,flags',
+        '-of', 'csv=p=0',
+        *input_args(video_path)
+    ]
+
+    try:
+        result = await run_process(cmd, capture_stdout=True)
+    except subprocess.CalledProcessError as e:
+        logger.warning(f"Keyframe probe failed for {video_path}: {e.stderr}")
+        return []
+
+    return [pts for pts in parse_keyframes(result.stdout) if start <= pts <= end]
+
+
+def parse_keyframes(packets_csv: str) -> List[float]:
+    """Sorted keyframe times from ffprobe 'packet=pts_time,flags' CSV output"""
+    keyframes = []
+    for line in packets_csv.splitlines():
+        parts = line.strip().split(',')
+        if len(parts) < 2 or 'K' not in parts[1]:
+            continue
+        try:
+            keyframes.append(float(parts[0]))
+        except ValueError:
+            continue
+
+    return sorted(keyframes)
+
+
+async def probe_audio(media_path: str) -> dict:
+    """
+    Probe the first audio stream of a file with ffprobe
+
+    Returns:
+        dict with codec, bit_rate (0 if unknown) and duration, or an
+        empty dict if there is no audio stream
+    """
+    cmd = [
+        'ffprobe',
+        '-v', 'error',
+        '-select_streams', 'a:0',
+        '-show_entries', 'stream=codec_name,bit_rate:format=duration,bit_rate',
+        '-of', 'json',
+        *input_args(media_path)
+    ]
+
+    result = await run_process(cmd, capture_stdout=True)
+    data = json.loads(result.stdout or '{}')
+
+    streams = data.get('streams') or []
+    if not streams:
+        return {}
+    stream = streams[0]
+    container = data.get('format', {})
+
+    return {
+        'codec': stream.get('codec_name', ''),
+        # Stream bit rate is missing for some containers (e.g. WebM)
+        'bit_rate': int(stream.get('bit_rate') or container.get('bit_rate') or 0),
+        'duration': float(container.get('duration') or 0),
+    }
+
+
+# Source profile written next to the video (and kept in the source cache)
+PROFILE_FILE = 'probe.json'
+
+
+async def get_source_profile(video_path: str, work_dir: Optional[str] = None) -> dict:
+    """
+    Probe a source once and cache the result as probe.json
+
+    The profile is saved in work_dir (default: the video's folder) and
+    reused as long as the source's size (or URL, for remote sources)
+    matches, so later stages and resumed jobs skip ffprobe.
+
+    Returns:
+        dict with width, height, fps, codec, codec_profile, level, pix_fmt,
+        audio_codec, duration, bit_rate and keyframes (sorted keyframe times, or None
+        for remote sources, whose index would need the whole file)
+    """
+    remote = is_remote(video_path)
+    source_id = video_path if remote else os.path.getsize(video_path)
+    profile_path = Path(work_dir or Path(video_path).parent) / PROFILE_FILE
+
+    try:
+        with open(profile_path, encoding='utf-8') as f:
+            profile = json.load(f)
+        if profile.get('source') == source_id:
+            return profile
+    except (OSError, ValueError):
+        pass
+
+    cmd = [
+        'ffprobe',
+        '-v', 'error',
+        '-show_entries',
+        'stream=codec_type,codec_name,profile,level,width,height,pix_fmt,avg_frame_rate,r_frame_rate:format=duration,bit_rate',
+        '-of', 'json',
+        *input_args(video_path)
+    ]
+    result = await run_process(cmd, capture_stdout=True)
+    data = json.loads(result.stdout or '{}')
+
+    streams = data.get('streams') or []
+    video = next((stream for stream in streams if stream.get('codec_type') == 'video'), {})
+    audio = next((stream for stream in streams if stream.get('codec_type') == 'audio'), {})
+    container = data.get('format', {})
+
+    keyframes = None
+    if not remote:
+        # Packets are only demuxed, not decoded, so this is a quick scan
+        result = await run_process([
+            'ffprobe',
+            '-v', 'error',
+            '-select_streams', 'v:0',
+            '-show_entries', 'packet=pts_time,flags',
+            '-of', 'csv=p=0',
+            video_path
+        ], capture_stdout=True)
+        keyframes = parse_keyframes(result.stdout)
+
+    profile = {
+        'source': source_id,
+        'width': int(video.get('width') or 0),
+        'height': int(video.get('height') or 0),
+        'fps': _parse_rate(video.get('avg_frame_rate')) or _parse_rate(video.get('r_frame_rate')),
+        'codec': video.get('codec_name', ''),
+        'codec_profile': video.get('profile', ''),
+        'level': int(video.get('level') or 0),
+        'pix_fmt': video.get('pix_fmt', ''),
+        'audio_codec': audio.get('codec_name', ''),
+        'duration': float(container.get('duration') or 0),
+        'bit_rate': int(container.get('bit_rate') or 0),
+        'keyframes': keyframes,
+    }
+
+    try:
+        profile_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = profile_path.with_suffix('.json.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(profile, f)
+        # Replaces a read-only copy linked from the source cache, too
+        os.replace(tmp_path, profile_path)
+    except OSError as e:
+        logger.warning(f"Could not save source profile {profile_path}: {e}")
+
+    logger.info(
+        f"Probed source: {profile['width']}x{profile['height']} @ {profile['fps']:.2f} fps, "
+        f"{profile['codec']}/{profile['audio_codec'] or 'no audio'}, {profile['duration']:.1f}s"
+        f"{f', {len(keyframes)} keyframes' if keyframes is not None else ''}"
+    )
+    return profile
+
+
+def _parse_rate(rate: Optional[str]) -> float:
+    """Frame rate from an ffprobe fraction like '30000/1001' (0 if unknown)"""
+    try:
+        num, _, den = (rate or '').partition('/')
+        return float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return 0.0
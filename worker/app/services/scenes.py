@@ -0,0 +1,194 @@
+import os
+import time
+from pathlib import Path
+from typing import List, Optional
+import numpy as np
+from app.config import settings
+from app.models import ViralMoment
+from app.services.probe import is_remote
+from app.utils.logger import logger
+from app.utils.process import run_process
+
+
+# Scene index written next to the video (and kept in the source cache)
+SCENES_FILE = 'scenes.npy'
+
+# Frames differenced per NumPy step, bounds memory on long sources
+DIFF_CHUNK_FRAMES = 4096
+
+
+def scene_index_path(work_dir: str) -> str:
+    return str(Path(work_dir) / SCENES_FILE)
+
+
+def load_scene_index(work_dir: str) -> Optional[np.ndarray]:
+    """Cached shot boundaries for the job's source, or None if not built yet"""
+    path = scene_index_path(work_dir)
+    if not settings.SCENE_DETECTION or not os.path.exists(path):
+        return None
+    try:
+        return np.load(path)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Ignoring unreadable scene index {path}: {e}")
+        return None
+
+
+async def get_scene_index(video_path: str, work_dir: Optional[str] = None) -> Optional[np.ndarray]:
+    """
+    Shot boundaries of a source, built on first use and saved as scenes.npy
+
+    Remote sources (partial fetch) get no index: building one would read
+    the whole video.
+
+    Returns:
+        Sorted float32 array of cut times in seconds (the first sampled
+        frame of each new shot), or None if unavailable
+    """
+    work_dir = work_dir or str(Path(video_path).parent)
+    cuts = load_scene_index(work_dir)
+    if cuts is not None or not settings.SCENE_DETECTION or is_remote(video_path):
+        return cuts
+
+    try:
+        cuts = await build_scene_index(video_path)
+    except Exception as e:
+        logger.warning(f"Scene detection failed for {video_path}: {e}")
+        return None
+
+    path = scene_index_path(work_dir)
+    tmp_path = f"{path}.tmp.npy"
+    try:
+        np.save(tmp_path, cuts)
+        # Replaces a read-only copy linked from the source cache, too
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning(f"Could not save scene index {path}: {e}")
+    return cuts
+
+
+async def build_scene_index(video_path: str) -> np.ndarray:
+    """
+    Detect shot boundaries by differencing low-resolution frames
+
+    FFmpeg decodes the source once (skipping non-reference frames) and
+    emits SCENE_SAMPLE_FPS grayscale frames of SCENE_SAMPLE_WIDTH pixels;
+    see detect_cuts for the NumPy side.
+    """
+    width = settings.SCENE_SAMPLE_WIDTH
+    height = max(2, width * 9 // 16 // 2 * 2)
+    fps = settings.SCENE_SAMPLE_FPS
+
+    started = time.monotonic()
+    result = await run_process([
+        'ffmpeg',
+        '-v', 'error',
+        '-skip_frame', 'noref',
+        '-i', video_path,
+        '-map', '0:v:0',
+        '-vf', f'fps={fps},scale={width}:{height}:flags=area,format=gray',
+        '-f', 'rawvideo',
+        '-'
+    ], capture_stdout=True, text=False)
+
+    frame_size = width * height
+    count = len(result.stdout) // frame_size
+    frames = np.frombuffer(result.stdout[:count * frame_size], dtype=np.uint8).reshape(count, height, width)
+    cuts = detect_cuts(frames, fps)
+
+    elapsed = time.monotonic() - started
+    seconds = count / fps
+    logger.info(
+        f"Scene index: {len(cuts)} cuts in {seconds:.0f}s of video, built in {elapsed:.1f}s "
+        f"({seconds / max(elapsed, 0.001):.0f}x real time)"
+    )
+    return cuts
+
+
+def detect_cuts(frames: np.ndarray, fps: float) -> np.ndarray:
+    """
+    Cut times from a stack of grayscale frames sampled at fps
+
+    Each step scores the mean absolute difference between consecutive
+    frames. A step is a cut when it is a local peak, clears
+    SCENE_MIN_DIFF and exceeds its neighbourhood's median by
+    SCENE_THRESHOLD median absolute deviations, so steady camera motion
+    raises the bar instead of producing cuts. Cuts closer than
+    SCENE_MIN_LENGTH to the previous one are dropped.
+    """
+    if len(frames) < 2:
+        return np.empty(0, dtype=np.float32)
+
+    scores = np.empty(len(frames) - 1, dtype=np.float32)
+    for start in range(0, len(frames) - 1, DIFF_CHUNK_FRAMES):
+        chunk = frames[start:start + DIFF_CHUNK_FRAMES + 1].astype(np.int16)
+        scores[start:start + len(chunk) - 1] = np.abs(np.diff(chunk, axis=0)).mean(axis=(1, 2))
+
+    # Rolling median and MAD over about two seconds either side
+    half = max(1, int(2 * fps))
+    windows = np.lib.stride_tricks.sliding_window_view(np.pad(scores, half, mode='edge'), 2 * half + 1)
+    median = np.median(windows, axis=1)
+    mad = np.median(np.abs(windows - median[:, None]), axis=1)
+
+    padded = np.pad(scores, 1, mode='constant')
+    peaks = (scores >= padded[:-2]) & (scores > padded[2:])
+    candidates = np.flatnonzero(
+        peaks
+        & (scores >= settings.SCENE_MIN_DIFF)
+        & (scores > median + settings.SCENE_THRESHOLD * np.maximum(mad, 1.0))
+    )
+
+    # Frame k + 1 is the first one of the new shot
+    times = (candidates + 1) / fps
+    cuts: List[float] = []
+    for t in times:
+        if not cuts or t - cuts[-1] >= settings.SCENE_MIN_LENGTH:
+            cuts.append(t)
+    return np.asarray(cuts, dtype=np.float32)
+
+
+def nearest_cut(cuts: np.ndarray, t: float, tolerance: float) -> Optional[float]:
+    """Cut closest to t if within tolerance (binary search)"""
+    i = int(np.searchsorted(cuts, t))
+    nearby = [float(cuts[j]) for j in (i - 1, i) if 0 <= j < len(cuts)]
+    best = min(nearby, key=lambda c: abs(c - t), default=None)
+    if best is None or abs(best - t) > tolerance:
+        return None
+    return best
+
+
+def snap_moments(moments: List[ViralMoment], cuts: Optional[np.ndarray]) -> List[ViralMoment]:
+    """
+    Move moment boundaries onto nearby shot cuts
+
+    A start within SCENE_SNAP_TOLERANCE of a cut moves to the cut; an end
+    moves to one sampled frame before it, so no frame of the next shot
+    flashes at the end. A moment that would lose more than half its
+    length is left as it was. Snapping is idempotent.
+    """
+    if cuts is None or not len(cuts):
+        return moments
+
+    tolerance = settings.SCENE_SNAP_TOLERANCE
+    frame = 1 / settings.SCENE_SAMPLE_FPS
+    snapped = []
+    moved = 0
+    for moment in moments:
+        start, end = moment.start_time, moment.end_time
+        cut = nearest_cut(cuts, start, tolerance)
+        if cut is not None:
+            start = cut
+        cut = nearest_cut(cuts, end + frame, tolerance)
+        if cut is not None:
+            end = cut - frame
+
+        start, end = round(start, 3), round(end, 3)
+        if (start, end) != (moment.start_time, moment.end_time) and (
+            end - start >= (moment.end_time - moment.start_time) / 2
+        ):
+            moment = moment.model_copy(update={'start_time': start, 'end_time': end})
+            moved += 1
+        snapped.append(moment)
+
+    if moved:
+        logger.info(f"Snapped {moved}/{len(moments)} moments to shot boundaries")
+    return snapped
@@ -1,117 +1,251 @@
+import asyncio
+import os
+import random
+import threading
+import time
 import boto3
+from boto3.s3.transfer import TransferConfig
 from botocore.client import Config
 from pathlib import Path
-from typing import List
+from typing import Callable, List, Optional
 from app.config import settings
 from app.models import ClipResult
 from app.utils.logger import logger
 
 
-# Initialize R2 client (S3-compatible)
-s3_client = boto3.client(
-    's3',
-    endpoint_url=f'https://{settings.R2_ACCOUNT_ID}.r2.cloudflarestorage.com',
-    aws_access_key_id=settings.R2_ACCESS_KEY_ID,
-    aws_secret_access_key=settings.R2_SECRET_ACCESS_KEY,
-    config=Config(signature_version='s3v4'),
-    region_name='auto'
+_s3_client = None
+_client_lock = threading.Lock()
+
+# Bounds object uploads across all jobs in this process
+_upload_semaphore = asyncio.Semaphore(max(1, settings.UPLOAD_CONCURRENCY))
+
+transfer_config = TransferConfig(
+    multipart_threshold=settings.UPLOAD_MULTIPART_THRESHOLD,
+    multipart_chunksize=settings.UPLOAD_MULTIPART_CHUNKSIZE,
+    max_concurrency=max(1, settings.UPLOAD_PART_CONCURRENCY),
+    use_threads=True
 )
 
 
-async def upload_to_r2(clips: List[dict], job_id: str) -> List[ClipResult]:
+def get_s3_client():
+    """
+    Shared R2 client (S3-compatible), created on first use
+    
+    The connection pool is sized for UPLOAD_CONCURRENCY objects each
+    sending UPLOAD_PART_CONCURRENCY parts, so uploads never wait on a
+    free connection. R2_ENDPOINT_URL points it at another S3-compatible
+    server, e.g. a local stand-in for tests.
+    """
+    global _s3_client
+    with _client_lock:
+        if _s3_client is None:
+            pool_size = max(1, settings.UPLOAD_CONCURRENCY) * max(1, settings.UPLOAD_PART_CONCURRENCY)
+            _s3_client = boto3.client(
+                's3',
+                endpoint_url=settings.R2_ENDPOINT_URL or f'https://{settings.R2_ACCOUNT_ID}.r2.cloudflarestorage.com',
+                aws_access_key_id=settings.R2_ACCESS_KEY_ID,
+                aws_secret_access_key=settings.R2_SECRET_ACCESS_KEY,
+                config=Config(
+                    signature_version='s3v4',
+                    max_pool_connections=pool_size,
+                    retries={'max_attempts': 2, 'mode': 'standard'},
+                    tcp_keepalive=True
+                ),
+                region_name='auto'
+            )
+        return _s3_client
+
+
+async def upload_to_r2(
+    clips: List[dict],
+    job_id: str,
+    on_uploaded: Optional[Callable[[dict, ClipResult], None]] = None
+) -> List[ClipResult]:
     """
     Upload clips to Cloudflare R2 storage
     
+    All files of all clips are uploaded concurrently, bounded by
+    UPLOAD_CONCURRENCY; results keep the order of clips.
+    
     Args:
         clips: List of clip dictionaries with paths
         job_id: Job ID for organizing files
+        on_uploaded: Called with each clip and its ClipResult as its
+            upload finishes
         
     Returns:
         List of ClipResult objects with CDN URLs
     """
-    uploaded_clips = []
-    
     logger.info(f"Uploading {len(clips)} clips to R2")
+    started = time.monotonic()
     
-    for clip in clips:
-        try:
-            clip_number = clip['clip_number']
-            aspect_ratio = clip['aspect_ratio']
-            moment = clip['moment']
-            
-            # Upload video
-            video_key = f"{job_id}/clip_{clip_number:02d}_{aspect_ratio.replace(':', 'x')}.mp4"
-            video_url = await upload_file(clip['video_path'], video_key, 'video/mp4')
-            
-            # Upload thumbnail
-            thumb_key = f"{job_id}/clip_{clip_number:02d}_{aspect_ratio.replace(':', 'x')}_thumb.jpg"
-            thumbnail_url = await upload_file(clip['thumbnail_path'], thumb_key, 'image/jpeg')
-            
-            # Upload subtitle
-            subtitle_key = f"{job_id}/clip_{clip_number:02d}_{aspect_ratio.replace(':', 'x')}.srt"
-            subtitle_url = await upload_file(clip['subtitle_path'], subtitle_key, 'text/plain')
-            
-            # Generate caption
-            from app.services.video import generate_caption
-            caption_text = await generate_caption(moment)
-            
-            # Create ClipResult
-            clip_result = ClipResult(
-                clip_number=clip_number,
-                start_time=moment.start_time,
-                end_time=moment.end_time,
-                duration=moment.end_time - moment.start_time,
-                transcript_snippet=moment.transcript,
-                viral_score=moment.viral_score,
-                viral_reason=moment.reason,
-                keywords=moment.keywords,
-                aspect_ratio=aspect_ratio,
-                video_url=video_url,
-                thumbnail_url=thumbnail_url,
-                subtitle_file_url=subtitle_url,
-                caption_text=caption_text,
-                view_prediction=moment.view_prediction
-            )
-            
-            uploaded_clips.append(clip_result)
-            
-            logger.info(f"Uploaded clip {clip_number} ({aspect_ratio})")
-            
-        except Exception as e:
-            logger.error(f"Failed to upload clip {clip_number}: {str(e)}")
-            raise
+    async def upload(clip: dict) -> ClipResult:
+        result = await upload_clip(clip, job_id)
+        if on_uploaded:
+            on_uploaded(clip, result)
+        return result
+    
+    tasks = [asyncio.create_task(upload(clip)) for clip in clips]
+    try:
+        uploaded_clips = await asyncio.gather(*tasks)
+    except Exception:
+        for task in tasks:
+            task.cancel()
+        raise
     
-    logger.info(f"All clips uploaded successfully")
-    return uploaded_clips
+    elapsed = time.monotonic() - started
+    total_bytes = sum(
+        os.path.getsize(clip[field])
+        for clip in clips
+        for field in ('video_path', 'thumbnail_path', 'subtitle_path')
+    )
+    logger.info(
+        f"All clips uploaded successfully: {total_bytes / 1024 ** 2:.1f} MB in {elapsed:.1f}s "
+        f"({total_bytes / 1024 ** 2 / max(elapsed, 0.001):.1f} MB/s)"
+    )
+    return list(uploaded_clips)
 
 
-async def upload_file(file_path: str, key: str, content_type: str) -> str:
+async def upload_from_queue(
+    queue: asyncio.Queue,
+    job_id: str,
+    on_uploaded: Optional[Callable[[dict, ClipResult], None]] = None
+) -> List[ClipResult]:
     """
-    Upload a single file to R2
+    Upload clips as they arrive on queue, until every consumer is stopped
+    
+    UPLOAD_CLIP_WORKERS consumers each take one clip at a time off the
+    queue, so uploads overlap with whatever is still producing clips,
+    and a producer blocks on a full queue while uploads lag behind. The
+    producer ends the run by putting one None per consumer (see
+    get_upload_workers).
     
+    Args:
+        queue: Queue of clip dictionaries, ended by None sentinels
+        job_id: Job ID for organizing files
+        on_uploaded: Called with each clip and its ClipResult as its
+            upload finishes
+        
     Returns:
-        Public CDN URL
+        List of ClipResult objects in upload completion order
     """
+    results = []
+    
+    async def consume():
+        while True:
+            clip = await queue.get()
+            if clip is None:
+                return
+            result = await upload_clip(clip, job_id)
+            results.append(result)
+            if on_uploaded:
+                on_uploaded(clip, result)
+    
+    tasks = [asyncio.create_task(consume()) for _ in range(get_upload_workers())]
     try:
-        with open(file_path, 'rb') as f:
-            s3_client.upload_fileobj(
-                f,
-                settings.R2_BUCKET_NAME,
-                key,
-                ExtraArgs={
-                    'ContentType': content_type,
-                    'CacheControl': 'public, max-age=31536000',  # 1 year
-                }
-            )
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+    return results
+
+
+def get_upload_workers() -> int:
+    """Number of upload_from_queue consumers (and sentinels to stop them)"""
+    return max(1, settings.UPLOAD_CLIP_WORKERS)
+
+
+async def upload_clip(clip: dict, job_id: str) -> ClipResult:
+    """Upload one clip's video, thumbnail and subtitle concurrently"""
+    clip_number = clip['clip_number']
+    aspect_ratio = clip['aspect_ratio']
+    moment = clip['moment']
+    stem = f"{job_id}/clip_{clip_number:02d}_{aspect_ratio.replace(':', 'x')}"
+    if clip.get('encoding') == 'draft':
+        # Own keys, so the upgraded clip never collides with a cached draft
+        stem += "_draft"
+    
+    try:
+        video_url, thumbnail_url, subtitle_url = await asyncio.gather(
+            upload_file(clip['video_path'], f"{stem}.mp4", 'video/mp4'),
+            upload_file(clip['thumbnail_path'], f"{stem}_thumb.jpg", 'image/jpeg'),
+            upload_file(clip['subtitle_path'], f"{stem}.srt", 'text/plain')
+        )
+        
+        # Generate caption
+        from app.services.video import generate_caption
+        caption_text = await generate_caption(moment)
         
-        # Return public URL
-        public_url = f"{settings.R2_PUBLIC_URL}/{key}"
+        clip_result = ClipResult(
+            clip_number=clip_number,
+            start_time=moment.start_time,
+            end_time=moment.end_time,
+            duration=moment.end_time - moment.start_time,
+            transcript_snippet=moment.transcript,
+            viral_score=moment.viral_score,
+            viral_reason=moment.reason,
+            keywords=moment.keywords,
+            aspect_ratio=aspect_ratio,
+            video_url=video_url,
+            thumbnail_url=thumbnail_url,
+            subtitle_file_url=subtitle_url,
+            caption_text=caption_text,
+            view_prediction=moment.view_prediction,
+            encoding=clip.get('encoding')
+        )
         
-        return public_url
+        logger.info(f"Uploaded clip {clip_number} ({aspect_ratio})")
+        return clip_result
         
     except Exception as e:
-        logger.error(f"Upload failed for {key}: {str(e)}")
-        raise Exception(f"Failed to upload file: {str(e)}")
+        logger.error(f"Failed to upload clip {clip_number}: {str(e)}")
+        raise
+
+
+async def upload_file(file_path: str, key: str, content_type: str) -> str:
+    """
+    Upload a single file to R2
+    
+    The blocking transfer runs in a worker thread (multipart above
+    UPLOAD_MULTIPART_THRESHOLD) and is retried up to UPLOAD_MAX_ATTEMPTS
+    times with jittered exponential backoff.
+    
+    Returns:
+        Public CDN URL
+    """
+    attempts = max(1, settings.UPLOAD_MAX_ATTEMPTS)
+    for attempt in range(1, attempts + 1):
+        try:
+            async with _upload_semaphore:
+                await asyncio.to_thread(_upload_blocking, file_path, key, content_type)
+            break
+        except FileNotFoundError as e:
+            logger.error(f"Upload failed for {key}: {str(e)}")
+            raise Exception(f"Failed to upload file: {str(e)}")
+        except Exception as e:
+            if attempt == attempts:
+                logger.error(f"Upload failed for {key} after {attempts} attempts: {str(e)}")
+                raise Exception(f"Failed to upload file: {str(e)}")
+            delay = settings.UPLOAD_RETRY_DELAY * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+            logger.warning(f"Upload of {key} failed ({str(e)}), retrying in {delay:.1f}s")
+            await asyncio.sleep(delay)
+    
+    # Return public URL
+    return f"{settings.R2_PUBLIC_URL}/{key}"
+
+
+def _upload_blocking(file_path: str, key: str, content_type: str):
+    get_s3_client().upload_file(
+        file_path,
+        settings.R2_BUCKET_NAME,
+        key,
+        ExtraArgs={
+            'ContentType': content_type,
+            'CacheControl': 'public, max-age=31536000',  # 1 year
+        },
+        Config=transfer_config
+    )
 
 
 async def delete_temp_files(job_id: str):
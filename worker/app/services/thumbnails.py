@@ -0,0 +1,140 @@
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from app.config import settings
+from app.models import ViralMoment
+from app.services.probe import input_args, probe_video
+from app.utils.logger import logger
+from app.utils.process import run_process
+
+
+def candidate_times(moment: ViralMoment, count: int) -> List[float]:
+    """Evenly spaced sample times inside a moment, away from its cut points"""
+    duration = max(0.0, moment.end_time - moment.start_time)
+    return [moment.start_time + duration * (k + 1) / (count + 1) for k in range(count)]
+
+
+def sharpness(frames: np.ndarray) -> np.ndarray:
+    """
+    Variance of the Laplacian of each grayscale frame (higher is sharper)
+
+    Near-black or near-white frames (fades, flashes) score zero so they
+    never win on noise alone.
+    """
+    f = frames.astype(np.float32)
+    laplacian = (
+        f[:, :-2, 1:-1] + f[:, 2:, 1:-1] + f[:, 1:-1, :-2] + f[:, 1:-1, 2:]
+        - 4 * f[:, 1:-1, 1:-1]
+    )
+    scores = laplacian.reshape(len(f), -1).var(axis=1)
+    brightness = f.reshape(len(f), -1).mean(axis=1)
+    scores[(brightness < 16) | (brightness > 240)] = 0.0
+    return scores
+
+
+async def sample_frames(video_path: str, times: List[float], width: int, height: int) -> np.ndarray:
+    """
+    Decode one low-resolution grayscale frame at each time in one FFmpeg run
+
+    Every time is a separate input seeked with -ss (keyframe jump plus a
+    short decode); the single frames are concatenated into one rawvideo
+    stream on stdout. Frames pass through as they are: the concatenated
+    timestamps are not a constant rate, and rawvideo would otherwise
+    drop frames to make them one.
+    """
+    cmd = ['ffmpeg', '-v', 'error']
+    for t in times:
+        cmd += ['-ss', f'{t:.3f}', *input_args(video_path)]
+
+    chains = [
+        f"[{k}:v]trim=end_frame=1,scale={width}:{height},setsar=1,format=gray[f{k}]"
+        for k in range(len(times))
+    ]
+    inputs = ''.join(f"[f{k}]" for k in range(len(times)))
+    filter_complex = ';'.join(chains) + f";{inputs}concat=n={len(times)}:v=1:a=0[out]"
+
+    cmd += [
+        '-filter_complex', filter_complex,
+        '-map', '[out]',
+        '-fps_mode', 'passthrough',
+        '-f', 'rawvideo',
+        '-pix_fmt', 'gray',
+        '-'
+    ]
+    result = await run_process(cmd, capture_stdout=True, text=False)
+
+    frame_size = width * height
+    count = len(result.stdout) // frame_size
+    if count != len(times):
+        logger.warning(f"FFmpeg returned {count} frames for {len(times)} sample times of {video_path}")
+    return np.frombuffer(result.stdout[:count * frame_size], dtype=np.uint8).reshape(count, height, width)
+
+
+async def pick_thumbnail_times(
+    video_path: str,
+    moments: List[ViralMoment],
+    profile: Optional[dict] = None
+) -> List[float]:
+    """Sharpest of THUMBNAIL_CANDIDATES sampled frames for each moment"""
+    count = max(1, settings.THUMBNAIL_CANDIDATES)
+    times = [t for moment in moments for t in candidate_times(moment, count)]
+
+    profile = profile or await probe_video(video_path)
+    width = settings.THUMBNAIL_SAMPLE_WIDTH
+    height = width * 9 // 16
+    if profile['width'] and profile['height']:
+        height = max(2, round(width * profile['height'] / profile['width'] / 2) * 2)
+
+    frames = await sample_frames(video_path, times, width, height)
+    if len(frames) != len(times):
+        logger.warning(f"Thumbnail sampling returned {len(frames)}/{len(times)} frames, using middles")
+        return [candidate_times(moment, 1)[0] for moment in moments]
+
+    scores = sharpness(frames).reshape(len(moments), count)
+    best = scores.argmax(axis=1)
+    return [times[i * count + best[i]] for i in range(len(moments))]
+
+
+async def write_thumbnails(
+    video_path: str,
+    moments: List[ViralMoment],
+    outputs: Dict[Tuple[int, str], str],
+    profile: Optional[dict] = None
+):
+    """
+    Write every (moment, aspect ratio) thumbnail from the source
+
+    Frame selection samples candidates at low resolution; one more FFmpeg
+    run then decodes each chosen frame once, splits it per aspect ratio
+    and applies the same crop as the clip (see get_crop_filter).
+
+    Args:
+        video_path: Source video path or URL
+        moments: Moments in clip order (clip number = index + 1)
+        outputs: Thumbnail path for each (clip number, aspect ratio)
+        profile: Source profile (see get_source_profile), probed if not given
+    """
+    from app.services.video import get_crop_filter
+
+    times = await pick_thumbnail_times(video_path, moments, profile)
+
+    cmd = ['ffmpeg', '-v', 'error']
+    chains = []
+    maps = []
+    index = 0
+    for clip_number, moment_time in enumerate(times, 1):
+        ratios = [ratio for (number, ratio) in outputs if number == clip_number]
+        if not ratios:
+            continue
+        cmd += ['-ss', f'{moment_time:.3f}', *input_args(video_path)]
+        labels = [f"t{index}_{r}" for r in range(len(ratios))]
+        chains.append(f"[{index}:v]split={len(ratios)}" + ''.join(f"[s{label}]" for label in labels))
+        for label, ratio in zip(labels, ratios):
+            chains.append(f"[s{label}]{get_crop_filter(ratio, profile)},scale={settings.THUMBNAIL_WIDTH}:-2[{label}]")
+            maps += ['-map', f'[{label}]', '-frames:v', '1', '-y', outputs[(clip_number, ratio)]]
+        index += 1
+
+    if not maps:
+        return
+
+    await run_process([*cmd, '-filter_complex', ';'.join(chains), *maps])
+    logger.info(f"Wrote {len(outputs)} thumbnails for {len(moments)} moments")
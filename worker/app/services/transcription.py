@@ -1,35 +1,48 @@
+import asyncio
+import os
+import re
+from pathlib import Path
+from typing import List, Optional, Tuple
 from groq import Groq
 from app.config import settings
+from app.services.cache import transcript_cache
+from app.services.probe import get_duration
 from app.utils.logger import logger
+from app.utils.process import run_process
 
 
-async def transcribe_audio(audio_path: str) -> str:
+class TranscriptionBackend:
     """
-    Transcribe audio using Groq Whisper API
+    Speech-to-text service used by transcribe_audio
     
-    Args:
-        audio_path: Path to audio file
-        
-    Returns:
-        str: Full transcript with timestamps
+    transcribe() takes one audio file and returns {'text', 'segments'}
+    with segment times relative to the start of that file. Tests can pass
+    a local stub implementing the same method.
     """
-    try:
-        client = Groq(api_key=settings.GROQ_API_KEY)
-        
-        logger.info(f"Transcribing audio: {audio_path}")
-        
+    
+    async def transcribe(self, audio_path: str) -> dict:
+        raise NotImplementedError
+
+
+class GroqWhisperBackend(TranscriptionBackend):
+    """Groq-hosted Whisper; the blocking SDK call runs in a worker thread"""
+    
+    def __init__(self):
+        self.client = Groq(api_key=settings.GROQ_API_KEY)
+    
+    async def transcribe(self, audio_path: str) -> dict:
+        return await asyncio.to_thread(self._transcribe, audio_path)
+    
+    def _transcribe(self, audio_path: str) -> dict:
         with open(audio_path, "rb") as audio_file:
-            transcription = client.audio.transcriptions.create(
+            transcription = self.client.audio.transcriptions.create(
                 file=audio_file,
-                model="whisper-large-v3",
+                model=settings.TRANSCRIPTION_MODEL,
                 response_format="verbose_json",
-                language="id",  # Indonesian, change as needed
+                language=settings.TRANSCRIPTION_LANGUAGE,
                 temperature=0.0
             )
         
-        # Extract full text
-        full_text = transcription.text
-        
         # Extract segments with timestamps
         segments = []
         if hasattr(transcription, 'segments'):
@@ -40,18 +53,258 @@ async def transcribe_audio(audio_path: str) -> str:
                     'text': segment['text']
                 })
         
+        return {
+            'text': transcription.text,
+            'segments': segments
+        }
+
+
+_default_backend: Optional[TranscriptionBackend] = None
+
+
+def get_default_backend() -> TranscriptionBackend:
+    """Long-lived Groq Whisper backend shared by all jobs"""
+    global _default_backend
+    if _default_backend is None:
+        _default_backend = GroqWhisperBackend()
+    return _default_backend
+
+
+async def transcribe_audio(audio_path: str, backend: Optional[TranscriptionBackend] = None) -> dict:
+    """
+    Transcribe audio using Groq Whisper API
+    
+    Results are cached by audio content, model and language, so a repeat
+    of the same source skips the API call entirely. Audio longer than
+    TRANSCRIPTION_CHUNK_SECONDS (or larger than TRANSCRIPTION_CHUNK_MAX_BYTES)
+    is split at silences and the chunks are transcribed concurrently.
+    
+    Args:
+        audio_path: Path to audio file
+        backend: Transcription service (default: Groq Whisper)
+    
+    Returns:
+        dict: Full transcript 'text' and timestamped 'segments'
+    """
+    try:
+        cache_key = None
+        if settings.TRANSCRIPT_CACHE_ENABLED:
+            cache_key = await asyncio.to_thread(
+                transcript_cache.key_for,
+                audio_path,
+                settings.TRANSCRIPTION_MODEL,
+                settings.TRANSCRIPTION_LANGUAGE
+            )
+            cached = transcript_cache.get(cache_key)
+            if cached is not None:
+                return cached
+        
+        backend = backend or get_default_backend()
+        
+        logger.info(f"Transcribing audio: {audio_path}")
+        
+        duration = await get_duration(audio_path)
+        chunk_seconds = get_chunk_seconds(duration, os.path.getsize(audio_path))
+        
+        if duration <= chunk_seconds:
+            transcript = await backend.transcribe(audio_path)
+        else:
+            transcript = await transcribe_chunked(audio_path, duration, chunk_seconds, backend)
+        
+        full_text = transcript['text']
+        segments = transcript['segments']
+        
         logger.info(f"Transcription complete: {len(full_text)} characters, {len(segments)} segments")
         
-        return {
+        transcript = {
             'text': full_text,
             'segments': segments
         }
         
+        if cache_key:
+            transcript_cache.put(cache_key, transcript)
+        
+        return transcript
+    
     except Exception as e:
         logger.error(f"Transcription failed: {str(e)}")
         raise Exception(f"Failed to transcribe audio: {str(e)}")
 
 
+def get_chunk_seconds(duration: float, size_bytes: int) -> float:
+    """Longest chunk that respects both the time and the upload size limit"""
+    chunk_seconds = float(settings.TRANSCRIPTION_CHUNK_SECONDS)
+    if duration > 0 and size_bytes > 0:
+        bytes_per_second = size_bytes / duration
+        chunk_seconds = min(chunk_seconds, settings.TRANSCRIPTION_CHUNK_MAX_BYTES / bytes_per_second)
+    return max(30.0, chunk_seconds)
+
+
+async def transcribe_chunked(
+    audio_path: str,
+    duration: float,
+    chunk_seconds: float,
+    backend: TranscriptionBackend
+) -> dict:
+    """
+    Split audio at silences and transcribe the chunks concurrently
+    
+    Each chunk is extracted with TRANSCRIPTION_CHUNK_OVERLAP seconds of
+    padding on both sides so words at a cut are heard whole; stitching
+    then keeps each segment only in the chunk that owns its midpoint.
+    """
+    silences = await find_silences(audio_path)
+    cuts = plan_chunks(duration, silences, chunk_seconds)
+    overlap = settings.TRANSCRIPTION_CHUNK_OVERLAP
+    
+    chunk_dir = Path(audio_path).parent / "chunks"
+    chunk_dir.mkdir(exist_ok=True)
+    suffix = Path(audio_path).suffix
+    semaphore = asyncio.Semaphore(max(1, settings.TRANSCRIPTION_CONCURRENCY))
+    
+    logger.info(
+        f"Transcribing {duration:.0f}s of audio in {len(cuts)} chunks "
+        f"({settings.TRANSCRIPTION_CONCURRENCY} concurrent)"
+    )
+    
+    async def transcribe_chunk(n: int, cut_start: float, cut_end: float) -> Tuple[float, dict]:
+        window_start = max(0.0, cut_start - overlap)
+        window_end = min(duration, cut_end + overlap)
+        chunk_path = str(chunk_dir / f"chunk_{n:03d}{suffix}")
+        
+        await run_process([
+            'ffmpeg',
+            '-ss', f'{window_start:.3f}',
+            '-t', f'{window_end - window_start:.3f}',
+            '-i', audio_path,
+            '-vn',
+            '-c:a', 'copy',
+            '-y',
+            chunk_path
+        ])
+        
+        try:
+            async with semaphore:
+                result = await backend.transcribe(chunk_path)
+        finally:
+            if os.path.exists(chunk_path):
+                os.remove(chunk_path)
+        
+        logger.info(f"Transcribed chunk {n + 1}/{len(cuts)}: {cut_start:.0f}s - {cut_end:.0f}s")
+        return window_start, result
+    
+    results = await asyncio.gather(*[
+        transcribe_chunk(n, cut_start, cut_end)
+        for n, (cut_start, cut_end) in enumerate(cuts)
+    ])
+    
+    return stitch_chunks(cuts, results)
+
+
+async def find_silences(audio_path: str) -> List[Tuple[float, float]]:
+    """Silent intervals (start, end) in seconds, via FFmpeg silencedetect"""
+    cmd = [
+        'ffmpeg',
+        '-i', audio_path,
+        '-vn',
+        '-af', (
+            f"silencedetect=noise={settings.TRANSCRIPTION_SILENCE_DB}dB:d=0.4,"
+            "ametadata=mode=print:file=-"
+        ),
+        '-f', 'null',
+        '-'
+    ]
+    result = await run_process(cmd, capture_stdout=True)
+    
+    silences = []
+    silence_start = None
+    for line in result.stdout.splitlines():
+        if line.startswith('lavfi.silence_start='):
+            silence_start = float(line.split('=', 1)[1])
+        elif line.startswith('lavfi.silence_end=') and silence_start is not None:
+            silences.append((silence_start, float(line.split('=', 1)[1])))
+            silence_start = None
+    
+    return silences
+
+
+def plan_chunks(
+    duration: float,
+    silences: List[Tuple[float, float]],
+    chunk_seconds: float
+) -> List[Tuple[float, float]]:
+    """
+    Choose chunk boundaries, preferring the middle of a silence
+    
+    Each cut lands at the silence midpoint closest to (and not after)
+    chunk_seconds past the previous cut, searching back up to a quarter
+    chunk. Without a usable silence the cut is made at the hard limit.
+    """
+    midpoints = [(start + end) / 2 for start, end in silences]
+    cuts = []
+    chunk_start = 0.0
+    
+    while duration - chunk_start > chunk_seconds:
+        limit = chunk_start + chunk_seconds
+        candidates = [m for m in midpoints if limit - chunk_seconds / 4 <= m <= limit]
+        cut = max(candidates) if candidates else limit
+        cuts.append((chunk_start, cut))
+        chunk_start = cut
+    
+    cuts.append((chunk_start, duration))
+    return cuts
+
+
+def stitch_chunks(
+    cuts: List[Tuple[float, float]],
+    results: List[Tuple[float, dict]]
+) -> dict:
+    """
+    Merge per-chunk transcripts into one timeline
+    
+    Segment times are shifted by each chunk's window offset. A chunk owns
+    the segments whose midpoint falls inside its [cut_start, cut_end)
+    range (the first and last chunk also own what lies before and after
+    the audio's ends), so a segment heard by two padded chunks is kept
+    once. Segments that start before the previous kept one has ended and
+    exact text repeats across a seam are dropped as well.
+    """
+    segments = []
+    for n, ((cut_start, cut_end), (offset, result)) in enumerate(zip(cuts, results)):
+        is_first, is_last = n == 0, n == len(cuts) - 1
+        for segment in result.get('segments', []):
+            start = segment['start'] + offset
+            end = segment['end'] + offset
+            midpoint = (start + end) / 2
+            if (midpoint < cut_start and not is_first) or (midpoint >= cut_end and not is_last):
+                continue
+            
+            text = segment['text']
+            if segments:
+                previous = segments[-1]
+                if start < previous['end'] - 0.5:
+                    continue
+                if _normalize(text) == _normalize(previous['text']) \
+                        and start - previous['end'] < settings.TRANSCRIPTION_CHUNK_OVERLAP * 2:
+                    continue
+            
+            segments.append({
+                'start': round(start, 3),
+                'end': round(end, 3),
+                'text': text
+            })
+    
+    text = ' '.join(segment['text'].strip() for segment in segments)
+    return {
+        'text': text,
+        'segments': segments
+    }
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r'\W+', ' ', text).strip().lower()
+
+
 def format_timestamp(seconds: float) -> str:
     """Convert seconds to HH:MM:SS format"""
     hours = int(seconds // 3600)
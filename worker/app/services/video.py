@@ -1,124 +1,850 @@
+import asyncio
 import subprocess
 import os
+import time
+from contextlib import asynccontextmanager
 from pathlib import Path
-from typing import List
+from typing import List, Optional, Tuple
 from app.config import settings
 from app.models import ViralMoment, ClipResult
+from app.services.probe import get_source_profile, get_keyframes, input_args
+from app.services.encoding import DEFAULT_ENCODING, encode_threads, get_encoding
+from app.services.thumbnails import write_thumbnails
+from app.services.scenes import get_scene_index, snap_moments
+from app.utils.process import run_process
 from app.utils.logger import logger
 
 
+# Full-quality output size for each aspect ratio
+OUTPUT_SIZES = {
+    "9:16": (1080, 1920),
+    "16:9": (1920, 1080),
+    "1:1": (1080, 1080),
+    "4:5": (1080, 1350),
+}
+
+# (minimum short side, maximum video kbps) for CRF 23 encodes, largest first
+BITRATE_LADDER = [
+    (1080, 6000),
+    (720, 3500),
+    (540, 2200),
+    (360, 1200),
+    (0, 800),
+]
+
+# x264 profile for each H.264 profile ffprobe reports (8-bit 4:2:0 only)
+X264_PROFILES = {
+    "Constrained Baseline": "baseline",
+    "Baseline": "baseline",
+    "Main": "main",
+    "High": "high",
+}
+
+
 async def generate_clips(
     video_path: str,
     moments: List[ViralMoment],
-    aspect_ratios: List[str]
+    aspect_ratios: List[str],
+    queue: Optional[asyncio.Queue] = None,
+    work_dir: Optional[str] = None,
+    encoding: str = DEFAULT_ENCODING
 ) -> List[dict]:
     """
     Generate video clips from viral moments in multiple aspect ratios
     
+    Encodes run concurrently, bounded by encoder threads shared with every
+    other job in the process (see render_slots); the returned list keeps moment/aspect ratio order regardless of which
+    encode finishes first. With RENDER_DECODE_ONCE each moment is decoded
+    a single time and split to every aspect ratio in one FFmpeg process.
+    With RENDER_SHARED_SPANS, moments that overlap are encoded together
+    as one span and cut apart by stream copy (see render_span).
+    
+    With SCENE_DETECTION, moment edges are first snapped to nearby shot
+    cuts of the source, so clips don't start or end mid-shot; the
+    returned clips carry the snapped moments.
+    
+    With a queue, each clip is also put on it as soon as it is finished
+    (in completion order), so a consumer can upload while encoding goes
+    on; a full queue pauses further renders until it drains.
+    
+    Draft clips go to a separate drafts/ folder, so an upgrade render at
+    another encoding doesn't overwrite files that may still be uploading.
+    
     Args:
         video_path: Path to source video
         moments: List of viral moments to clip
         aspect_ratios: List of aspect ratios (e.g., ["9:16", "16:9", "1:1"])
+        queue: Optional queue receiving each finished clip
+        work_dir: Job workspace for the clips/ folder (default: the
+            source's folder; required when video_path is a URL)
+        encoding: Encoding profile name (see ENCODING_PROFILES)
         
     Returns:
         List of clip file paths with metadata
     """
-    clips = []
-    job_id = Path(video_path).parent.name
-    output_dir = Path(video_path).parent / "clips"
+    output_dir = Path(work_dir or Path(video_path).parent) / ("drafts" if encoding == "draft" else "clips")
     output_dir.mkdir(exist_ok=True)
     
-    logger.info(f"Generating {len(moments)} clips in {len(aspect_ratios)} aspect ratios")
-    
-    for i, moment in enumerate(moments, 1):
-        for ratio in aspect_ratios:
-            try:
-                clip_filename = f"clip_{i:02d}_{ratio.replace(':', 'x')}.mp4"
-                clip_path = str(output_dir / clip_filename)
-                thumbnail_path = str(output_dir / f"clip_{i:02d}_{ratio.replace(':', 'x')}_thumb.jpg")
-                subtitle_path = str(output_dir / f"clip_{i:02d}_{ratio.replace(':', 'x')}.srt")
-                
-                # Calculate crop/scale parameters
-                crop_filter = get_crop_filter(ratio)
-                
-                # FFmpeg command to extract clip with crop
-                duration = moment.end_time - moment.start_time
-                
-                ffmpeg_cmd = [
-                    'ffmpeg',
-                    '-i', video_path,
-                    '-ss', str(moment.start_time),
-                    '-t', str(duration),
-                    '-vf', crop_filter,
-                    '-c:v', 'libx264',
-                    '-preset', 'medium',
-                    '-crf', '23',
-                    '-c:a', 'aac',
-                    '-b:a', '128k',
-                    '-movflags', '+faststart',
-                    '-y',
-                    clip_path
-                ]
-                
-                logger.info(f"Creating clip {i}/{len(moments)} ({ratio}): {moment.start_time:.1f}s - {moment.end_time:.1f}s")
-                
-                # Run FFmpeg
-                result = subprocess.run(
-                    ffmpeg_cmd,
-                    capture_output=True,
-                    text=True,
-                    check=True
+    # Probed once per source; output sizes never exceed its resolution
+    try:
+        profile = await get_source_profile(video_path, str(output_dir.parent))
+    except Exception as e:
+        logger.warning(f"Source probe failed, rendering at full size: {e}")
+        profile = {}
+    
+    moments = snap_moments(moments, await get_scene_index(video_path, str(output_dir.parent)))
+    
+    sizes = {ratio: get_output_size(ratio, profile) for ratio in aspect_ratios}
+    logger.info(
+        f"Output sizes for {profile.get('width', '?')}x{profile.get('height', '?')} source: "
+        + ', '.join(f"{ratio} {w}x{h}" for ratio, (w, h) in sizes.items())
+    )
+    
+    # Ratios that match the source can be smart-rendered without a crop
+    smart_ratios = []
+    if settings.SMART_RENDER:
+        smart_ratios = get_smart_render_ratios(profile, aspect_ratios)
+        if smart_ratios:
+            logger.info(f"Smart render enabled for {', '.join(smart_ratios)}")
+    crop_ratios = [ratio for ratio in aspect_ratios if ratio not in smart_ratios]
+    
+    decode_once = settings.RENDER_DECODE_ONCE and len(crop_ratios) > 1
+    threads = encode_threads(encoding)
+    
+    logger.info(
+        f"Generating {len(moments)} clips in {len(aspect_ratios)} aspect ratios "
+        f"({'moment' if decode_once else 'clip'} renders, {threads} threads per {encoding} "
+        f"encode, {render_slots.used}/{render_slots.capacity} render threads busy)"
+    )
+    
+    # All thumbnails come from the source in one pass, alongside the encodes
+    thumbnail_task = asyncio.create_task(write_source_thumbnails(
+        video_path,
+        moments,
+        {
+            (i, ratio): get_clip_paths(output_dir, i, ratio)['thumbnail_path']
+            for i in range(1, len(moments) + 1)
+            for ratio in aspect_ratios
+        },
+        profile
+    ))
+    
+    async def render(members: List[Tuple[int, ViralMoment]], ratios: List[str]) -> List[dict]:
+        i, moment = members[0]
+        # One process runs an encoder per ratio, so it takes that many slots
+        async with render_slots.hold(threads * len(ratios)):
+            if len(members) > 1:
+                clips = await render_span(
+                    video_path, members, ratios, output_dir, len(moments), profile, encoding
+                )
+            elif ratios[0] in smart_ratios:
+                clips = [await smart_render_clip(
+                    video_path, moment, i, ratios[0], output_dir, len(moments), profile, encoding
+                )]
+            elif decode_once:
+                clips = await render_moment(
+                    video_path, moment, i, ratios, output_dir, len(moments), profile, encoding
                 )
-                
-                # Generate thumbnail
-                thumbnail_cmd = [
-                    'ffmpeg',
-                    '-i', clip_path,
-                    '-ss', '00:00:01',
-                    '-vframes', '1',
-                    '-vf', 'scale=480:-1',
-                    '-y',
-                    thumbnail_path
-                ]
-                
-                subprocess.run(thumbnail_cmd, capture_output=True, check=True)
-                
-                # Generate subtitle file (SRT format)
-                create_subtitle_file(subtitle_path, moment.transcript, duration)
-                
-                clips.append({
-                    'clip_number': i,
-                    'aspect_ratio': ratio,
-                    'video_path': clip_path,
-                    'thumbnail_path': thumbnail_path,
-                    'subtitle_path': subtitle_path,
-                    'moment': moment
-                })
-                
-                logger.info(f"Clip created: {clip_filename}")
-                
-            except subprocess.CalledProcessError as e:
-                logger.error(f"FFmpeg error for clip {i} ({ratio}): {e.stderr}")
-                raise Exception(f"Failed to create clip: {str(e)}")
-    
-    logger.info(f"Generated {len(clips)} total clips")
+            else:
+                clips = [await render_clip(
+                    video_path, moment, i, ratios[0], output_dir, len(moments), profile, encoding
+                )]
+        
+        for clip in clips:
+            clip['encoding'] = encoding
+        
+        if not await thumbnail_task:
+            for clip in clips:
+                await extract_clip_thumbnail(clip['thumbnail_path'], clip['video_path'])
+        
+        if queue is not None:
+            for clip in clips:
+                await queue.put(clip)
+        return clips
+    
+    # Overlapping moments are encoded once as a shared span (see render_span)
+    if settings.RENDER_SHARED_SPANS:
+        spans = plan_spans(moments)
+    else:
+        spans = [[(i, moment)] for i, moment in enumerate(moments, 1)]
+    
+    started = time.monotonic()
+    units = []
+    for members in spans:
+        if decode_once:
+            units.append((members, crop_ratios))
+        else:
+            units.extend((members, [ratio]) for ratio in crop_ratios)
+        units.extend(([member], [ratio]) for member in members for ratio in smart_ratios)
+    tasks = [asyncio.create_task(render(*unit)) for unit in units]
+    
+    try:
+        results = await asyncio.gather(*tasks)
+    except Exception:
+        for task in [*tasks, thumbnail_task]:
+            task.cancel()
+        raise
+    
+    # Keep the caller's moment/aspect ratio order
+    order = {ratio: n for n, ratio in enumerate(aspect_ratios)}
+    clips = sorted(
+        (clip for group in results for clip in group),
+        key=lambda clip: (clip['clip_number'], order[clip['aspect_ratio']])
+    )
+    
+    elapsed = time.monotonic() - started
+    encode_total = sum(group[0]['render_time'] for group in results)
+    logger.info(
+        f"Generated {len(clips)} total clips in {elapsed:.1f}s "
+        f"(sum of render times {encode_total:.1f}s)"
+    )
     return clips
 
 
-def get_crop_filter(aspect_ratio: str) -> str:
+def plan_spans(moments: List[ViralMoment]) -> List[List[Tuple[int, ViralMoment]]]:
     """
-    Get FFmpeg crop filter for aspect ratio
+    Group moments whose time ranges overlap
     
-    Supports: 9:16 (TikTok/Reels), 16:9 (YouTube), 1:1 (Instagram), 4:5 (Instagram)
+    Returns:
+        Lists of (clip number, moment), one per merged span, each sorted by
+        start time; moments that overlap nothing form a span of their own
+    """
+    spans = []
+    span_end = None
+    for i, moment in sorted(enumerate(moments, 1), key=lambda item: item[1].start_time):
+        if span_end is not None and moment.start_time < span_end:
+            spans[-1].append((i, moment))
+            span_end = max(span_end, moment.end_time)
+        else:
+            spans.append([(i, moment)])
+            span_end = moment.end_time
+    
+    shared = [span for span in spans if len(span) > 1]
+    if shared:
+        total = sum(moment.end_time - moment.start_time for moment in moments)
+        unique = sum(
+            max(moment.end_time for _, moment in span) - span[0][1].start_time
+            for span in spans
+        )
+        logger.info(
+            f"{sum(len(span) for span in shared)} overlapping moments merged into "
+            f"{len(shared)} shared spans: {unique:.1f}s to encode instead of {total:.1f}s"
+        )
+    return spans
+
+
+def get_render_threads() -> int:
+    """
+    Encoder threads all renders of this process may use at once
+    
+    The cores available to the process, unless RENDER_WORKERS overrides
+    it with that many encodes of RENDER_THREADS_PER_ENCODE threads.
+    """
+    if settings.RENDER_WORKERS > 0:
+        return settings.RENDER_WORKERS * max(1, settings.RENDER_THREADS_PER_ENCODE)
+    
+    if hasattr(os, 'sched_getaffinity'):
+        return max(1, len(os.sched_getaffinity(0)))
+    return os.cpu_count() or 1
+
+
+class RenderSlots:
     """
-    filters = {
-        "9:16": "scale=1080:1920:force_original_aspect_ratio=increase,crop=1080:1920",
-        "16:9": "scale=1920:1080:force_original_aspect_ratio=increase,crop=1920:1080",
-        "1:1": "scale=1080:1080:force_original_aspect_ratio=increase,crop=1080:1080",
-        "4:5": "scale=1080:1350:force_original_aspect_ratio=increase,crop=1080:1350",
+    Encoder threads shared by every render in the process
+    
+    A render holds threads per encode x encodes it runs, so concurrent
+    jobs and background upgrades together stay within get_render_threads
+    instead of each sizing a pool to all cores. (The process semaphore in
+    app.utils.process counts processes, not threads.)
+    """
+    
+    def __init__(self):
+        self.used = 0
+        self.condition = asyncio.Condition()
+    
+    @property
+    def capacity(self) -> int:
+        return get_render_threads()
+    
+    @asynccontextmanager
+    async def hold(self, threads: int):
+        # A render wider than the whole budget runs alone
+        threads = max(1, min(threads, self.capacity))
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.used + threads <= self.capacity)
+            self.used += threads
+        try:
+            yield
+        finally:
+            async with self.condition:
+                self.used -= threads
+                self.condition.notify_all()
+
+
+render_slots = RenderSlots()
+
+
+def get_clip_paths(output_dir: Path, clip_number: int, ratio: str) -> dict:
+    """Output file paths for one (moment, aspect ratio) clip"""
+    stem = f"clip_{clip_number:02d}_{ratio.replace(':', 'x')}"
+    return {
+        'video_path': str(output_dir / f"{stem}.mp4"),
+        'thumbnail_path': str(output_dir / f"{stem}_thumb.jpg"),
+        'subtitle_path': str(output_dir / f"{stem}.srt"),
     }
+
+
+def get_output_size(aspect_ratio: str, profile: Optional[dict] = None) -> Tuple[int, int]:
+    """
+    Output width and height for an aspect ratio
+    
+    With RENDER_NO_UPSCALE the full-quality size is scaled down to the
+    region the crop takes from the source, so e.g. a 640x360 source gives
+    a 640x360 16:9 clip and a 202x360 9:16 one instead of upscaled pixels.
+    
+    Args:
+        aspect_ratio: One of OUTPUT_SIZES (anything else is treated as 9:16)
+        profile: Source profile from get_source_profile (full size if unknown)
+    """
+    width, height = OUTPUT_SIZES.get(aspect_ratio, OUTPUT_SIZES["9:16"])
+    source_width = (profile or {}).get('width') or 0
+    source_height = (profile or {}).get('height') or 0
+    if not settings.RENDER_NO_UPSCALE or not source_width or not source_height:
+        return width, height
+    
+    # Largest region of the target shape that fits in the source
+    crop_height = min(source_height, source_width * height / width)
+    scale = min(1.0, crop_height / height)
+    return max(2, int(width * scale) // 2 * 2), max(2, int(height * scale) // 2 * 2)
+
+
+def get_encode_args(
+    size: Optional[Tuple[int, int]] = None,
+    encoding: str = DEFAULT_ENCODING
+) -> List[str]:
+    """
+    Per-output encoder arguments shared by every clip render
+    
+    Preset, CRF, threads and audio bitrate come from the encoding profile.
+    CRF encoding is capped by the BITRATE_LADDER rung for the output's
+    short side (size defaults to the full 1080p rung), scaled by the
+    profile's bitrate_scale.
+    """
+    options = get_encoding(encoding)
+    short_side = min(size) if size else 1080
+    max_kbps = next(kbps for min_side, kbps in BITRATE_LADDER if short_side >= min_side)
+    max_kbps = int(max_kbps * options['bitrate_scale'])
+    return [
+        *get_video_codec_args(encoding),
+        '-maxrate', f'{max_kbps}k',
+        '-bufsize', f'{2 * max_kbps}k',
+        '-c:a', 'aac',
+        '-b:a', options['audio_bitrate'],
+        '-movflags', '+faststart',
+    ]
+
+
+def get_video_codec_args(encoding: str = DEFAULT_ENCODING) -> List[str]:
+    """x264 preset, CRF and threads of an encoding profile"""
+    options = get_encoding(encoding)
+    return [
+        '-c:v', 'libx264',
+        '-preset', options['preset'],
+        '-crf', str(options['crf']),
+        '-threads', str(encode_threads(encoding)),
+    ]
+
+
+async def render_clip(
+    video_path: str,
+    moment: ViralMoment,
+    clip_number: int,
+    ratio: str,
+    output_dir: Path,
+    total: int,
+    profile: Optional[dict] = None,
+    encoding: str = DEFAULT_ENCODING
+) -> dict:
+    """Encode one (moment, aspect ratio) clip plus its subtitle"""
+    i = clip_number
+    paths = get_clip_paths(output_dir, i, ratio)
+    size = get_output_size(ratio, profile)
+    
+    try:
+        started = time.monotonic()
+        
+        # Calculate crop/scale parameters
+        crop_filter = get_crop_filter(ratio, profile)
+        
+        # FFmpeg command to extract clip with crop
+        duration = moment.end_time - moment.start_time
+        
+        ffmpeg_cmd = [
+            'ffmpeg',
+            '-filter_threads', str(encode_threads(encoding)),
+            # Input seeking jumps to the nearest keyframe and decodes only
+            # from there, instead of decoding the source from the start
+            '-ss', str(moment.start_time),
+            '-t', str(duration),
+            *input_args(video_path),
+            '-vf', crop_filter,
+            *get_encode_args(size, encoding),
+            '-y',
+            paths['video_path']
+        ]
+        
+        logger.info(f"Creating clip {i}/{total} ({ratio}): {moment.start_time:.1f}s - {moment.end_time:.1f}s")
+        
+        # Run FFmpeg
+        await run_process(ffmpeg_cmd)
+        
+        await finish_clip(paths, moment, duration)
+        
+        render_time = time.monotonic() - started
+        logger.info(f"Clip created: {Path(paths['video_path']).name} in {render_time:.1f}s")
+        
+        return {
+            'clip_number': i,
+            'aspect_ratio': ratio,
+            **paths,
+            'moment': moment,
+            'render_time': round(render_time, 2)
+        }
+        
+    except subprocess.CalledProcessError as e:
+        logger.error(f"FFmpeg error for clip {i} ({ratio}): {e.stderr}")
+        raise Exception(f"Failed to create clip: {str(e)}")
+
+
+async def render_moment(
+    video_path: str,
+    moment: ViralMoment,
+    clip_number: int,
+    aspect_ratios: List[str],
+    output_dir: Path,
+    total: int,
+    profile: Optional[dict] = None,
+    encoding: str = DEFAULT_ENCODING
+) -> List[dict]:
+    """
+    Encode one moment to every aspect ratio from a single decode
     
-    return filters.get(aspect_ratio, filters["9:16"])
+    The source window is demuxed and decoded once, then a filter_complex
+    split feeds one crop/scale chain and encoder per ratio. Output files
+    are identical in name and format to render_clip.
+    """
+    i = clip_number
+    duration = moment.end_time - moment.start_time
+    all_paths = [get_clip_paths(output_dir, i, ratio) for ratio in aspect_ratios]
+    
+    try:
+        started = time.monotonic()
+        
+        filter_graph = build_split_filter(aspect_ratios, profile)
+        
+        ffmpeg_cmd = [
+            'ffmpeg',
+            '-filter_threads', str(encode_threads(encoding)),
+            '-filter_complex_threads', str(encode_threads(encoding)),
+            '-ss', str(moment.start_time),
+            '-t', str(duration),
+            *input_args(video_path),
+            '-filter_complex', filter_graph,
+        ]
+        for n, (ratio, paths) in enumerate(zip(aspect_ratios, all_paths)):
+            ffmpeg_cmd += [
+                '-map', f'[out{n}]',
+                '-map', '0:a?',
+                *get_encode_args(get_output_size(ratio, profile), encoding),
+                '-y',
+                paths['video_path']
+            ]
+        
+        logger.info(
+            f"Creating clip {i}/{total} ({', '.join(aspect_ratios)}): "
+            f"{moment.start_time:.1f}s - {moment.end_time:.1f}s"
+        )
+        
+        await run_process(ffmpeg_cmd)
+        
+        for paths in all_paths:
+            await finish_clip(paths, moment, duration)
+        
+        render_time = time.monotonic() - started
+        logger.info(f"Clip {i} created in {len(aspect_ratios)} aspect ratios in {render_time:.1f}s")
+        
+        return [
+            {
+                'clip_number': i,
+                'aspect_ratio': ratio,
+                **paths,
+                'moment': moment,
+                'render_time': round(render_time, 2)
+            }
+            for ratio, paths in zip(aspect_ratios, all_paths)
+        ]
+        
+    except subprocess.CalledProcessError as e:
+        logger.error(f"FFmpeg error for clip {i} ({', '.join(aspect_ratios)}): {e.stderr}")
+        raise Exception(f"Failed to create clip: {str(e)}")
+
+
+async def render_span(
+    video_path: str,
+    members: List[Tuple[int, ViralMoment]],
+    aspect_ratios: List[str],
+    output_dir: Path,
+    total: int,
+    profile: Optional[dict] = None,
+    encoding: str = DEFAULT_ENCODING
+) -> List[dict]:
+    """
+    Encode overlapping moments as one span and cut each clip from it
+    
+    The span covering every member is decoded once and encoded once per
+    aspect ratio, with keyframes forced at each moment's start and end.
+    Each clip is then cut out of the span by stream copy at the span's
+    actual keyframes, so seconds shared by several moments are only
+    encoded once. A clip whose edges have no keyframe in the span is
+    re-encoded on its own with render_clip. Output files are identical
+    in name and format to render_clip.
+    """
+    span_start = members[0][1].start_time
+    span_end = max(moment.end_time for _, moment in members)
+    boundaries = sorted({
+        round(t - span_start, 3)
+        for _, moment in members
+        for t in (moment.start_time, moment.end_time)
+    })
+    half_frame = 0.5 / ((profile or {}).get('fps') or 30)
+    numbers = [i for i, _ in members]
+    span_paths = [
+        str(output_dir / f"span_{numbers[0]:02d}_{ratio.replace(':', 'x')}.mp4")
+        for ratio in aspect_ratios
+    ]
+    
+    def keyframe_at(keyframes: List[float], t: float) -> Optional[float]:
+        """
+        Span keyframe forced for moment time t (the first frame at or
+        after it), None if the span has no keyframe there
+        """
+        offset = t - span_start
+        for k in keyframes:
+            if k - keyframes[0] >= offset - half_frame:
+                return k if k - keyframes[0] <= offset + 3 * half_frame else None
+        return None
+    
+    async def cut(span_path: str, keyframes: List[float], i: int, moment: ViralMoment, ratio: str) -> dict:
+        paths = get_clip_paths(output_dir, i, ratio)
+        duration = moment.end_time - moment.start_time
+        cut_start = keyframe_at(keyframes, moment.start_time)
+        # A clip that ends with the span is copied to its end
+        cut_end = keyframe_at(keyframes, moment.end_time) if moment.end_time < span_end else None
+        if cut_start is None or (cut_end is None and moment.end_time < span_end):
+            logger.warning(f"No keyframe at the edges of clip {i} ({ratio}) in its span, re-encoding it")
+            return await render_clip(video_path, moment, i, ratio, output_dir, total, profile, encoding)
+        # Copy seeks back to the keyframe at or before -ss; the margin only
+        # absorbs timestamp rounding
+        await run_process([
+            'ffmpeg',
+            '-seek_timestamp', '1',
+            '-ss', f'{cut_start + 0.001:.6f}',
+            '-i', span_path,
+            *(['-t', f'{cut_end - cut_start:.6f}'] if cut_end is not None else []),
+            '-map', '0',
+            '-c', 'copy',
+            '-avoid_negative_ts', 'make_zero',
+            '-movflags', '+faststart',
+            '-y',
+            paths['video_path']
+        ])
+        await finish_clip(paths, moment, duration)
+        return {
+            'clip_number': i,
+            'aspect_ratio': ratio,
+            **paths,
+            'moment': moment,
+        }
+    
+    try:
+        started = time.monotonic()
+        
+        ffmpeg_cmd = [
+            'ffmpeg',
+            '-filter_threads', str(encode_threads(encoding)),
+            '-filter_complex_threads', str(encode_threads(encoding)),
+            '-ss', str(span_start),
+            '-t', str(span_end - span_start),
+            *input_args(video_path),
+            '-filter_complex', build_split_filter(aspect_ratios, profile),
+        ]
+        for n, (ratio, span_path) in enumerate(zip(aspect_ratios, span_paths)):
+            ffmpeg_cmd += [
+                '-map', f'[out{n}]',
+                '-map', '0:a?',
+                *get_encode_args(get_output_size(ratio, profile), encoding),
+                '-force_key_frames', ','.join(f'{t:.3f}' for t in boundaries),
+                '-y',
+                span_path
+            ]
+        
+        logger.info(
+            f"Creating clips {', '.join(str(i) for i in numbers)}/{total} "
+            f"({', '.join(aspect_ratios)}) from shared span {span_start:.1f}s - {span_end:.1f}s"
+        )
+        
+        await run_process(ffmpeg_cmd)
+        
+        span_keyframes = await asyncio.gather(*(
+            get_keyframes(span_path, 0, span_end - span_start + 1) for span_path in span_paths
+        ))
+        
+        clips = await asyncio.gather(*(
+            cut(span_path, keyframes, i, moment, ratio)
+            for ratio, span_path, keyframes in zip(aspect_ratios, span_paths, span_keyframes)
+            for i, moment in members
+        ))
+        
+        for span_path in span_paths:
+            if os.path.exists(span_path):
+                os.remove(span_path)
+        
+        render_time = time.monotonic() - started
+        logger.info(
+            f"Clips {', '.join(str(i) for i in numbers)} created from a "
+            f"{span_end - span_start:.1f}s span in {render_time:.1f}s"
+        )
+        
+        return [{**clip, 'render_time': round(render_time, 2)} for clip in clips]
+        
+    except subprocess.CalledProcessError as e:
+        logger.error(f"FFmpeg error for span of clips {numbers} ({', '.join(aspect_ratios)}): {e.stderr}")
+        raise Exception(f"Failed to create clip: {str(e)}")
+
+
+def get_smart_render_ratios(profile: dict, aspect_ratios: List[str]) -> List[str]:
+    """
+    Aspect ratios that need no crop for this source
+    
+    Smart render stream-copies H.264, so the source must be H.264 that
+    x264 can match (see get_smart_encode_args) and its shape must already
+    match the requested ratio. Malformed ratios are skipped.
+    """
+    if profile.get('codec') != 'h264' or not profile.get('width') or not profile.get('height'):
+        return []
+    if get_smart_encode_args(profile) is None:
+        return []
+    
+    source_ratio = profile['width'] / profile['height']
+    matching = []
+    for ratio in aspect_ratios:
+        try:
+            w, h = (int(part) for part in ratio.split(':'))
+        except ValueError:
+            logger.warning(f"Ignoring malformed aspect ratio {ratio!r} for smart render")
+            continue
+        if w <= 0 or h <= 0:
+            continue
+        if abs(source_ratio - w / h) / (w / h) < 0.01:
+            matching.append(ratio)
+    return matching
+
+
+def get_smart_encode_args(profile: dict, encoding: str = DEFAULT_ENCODING) -> Optional[List[str]]:
+    """
+    x264 arguments for smart render edges that match the source stream
+    
+    The edges are spliced into the stream-copied body, so they must be
+    encoded with the source's H.264 profile, level and pixel format.
+    
+    Returns:
+        FFmpeg video codec arguments, or None if the source's parameters
+        are unknown or x264 cannot produce them
+    """
+    x264_profile = X264_PROFILES.get(profile.get('codec_profile') or '')
+    level = profile.get('level') or 0
+    pix_fmt = profile.get('pix_fmt')
+    if x264_profile is None or level <= 0 or pix_fmt not in ('yuv420p', 'yuvj420p'):
+        return None
+    return [
+        *get_video_codec_args(encoding),
+        '-profile:v', x264_profile,
+        '-level:v', f"{level / 10:.1f}",
+        '-pix_fmt', pix_fmt,
+    ]
+
+
+async def smart_render_clip(
+    video_path: str,
+    moment: ViralMoment,
+    clip_number: int,
+    ratio: str,
+    output_dir: Path,
+    total: int,
+    profile: Optional[dict] = None,
+    encoding: str = DEFAULT_ENCODING
+) -> dict:
+    """
+    Cut a clip by re-encoding only the partial GOPs at its edges
+    
+    The span between the first and last keyframe inside the moment is
+    stream-copied; only the head before the first keyframe and the tail
+    after the last one are encoded with the source's profile, level and
+    pixel format. Parts are written as MPEG-TS, so every part carries its
+    parameter sets in-band (Annex B), and joined with the concat protocol.
+    Audio is encoded for the whole clip. The clip keeps the source
+    resolution. Falls back to render_clip when the source's parameters
+    cannot be matched or the moment holds too few keyframes to be worth it.
+    """
+    i = clip_number
+    start, end = moment.start_time, moment.end_time
+    duration = end - start
+    encode_args = get_smart_encode_args(profile or {}, encoding)
+    keyframes = []
+    if encode_args is not None:
+        keyframes = await get_keyframes(video_path, start, end, (profile or {}).get('keyframes'))
+    
+    if len(keyframes) < 2 or keyframes[-1] - keyframes[0] < duration / 2:
+        return await render_clip(video_path, moment, i, ratio, output_dir, total, profile, encoding)
+    
+    paths = get_clip_paths(output_dir, i, ratio)
+    stem = Path(paths['video_path']).with_suffix('')
+    first_key, last_key = keyframes[0], keyframes[-1]
+    
+    # (name, start, duration, stream copy?)
+    parts = []
+    if first_key - start > 0.001:
+        parts.append(('head', start, first_key - start, False))
+    parts.append(('body', first_key, last_key - first_key, True))
+    if end - last_key > 0.001:
+        parts.append(('tail', last_key, end - last_key, False))
+    
+    try:
+        started = time.monotonic()
+        logger.info(f"Smart rendering clip {i}/{total} ({ratio}): {start:.1f}s - {end:.1f}s")
+        
+        part_files = []
+        for name, part_start, part_duration, copy in parts:
+            part_path = f"{stem}_{name}.ts"
+            if copy:
+                # Repeats SPS/PPS before every keyframe of the copied body
+                codec_args = ['-c:v', 'copy', '-bsf:v', 'h264_mp4toannexb']
+            else:
+                codec_args = encode_args
+            await run_process([
+                'ffmpeg',
+                '-ss', str(part_start),
+                '-t', str(part_duration),
+                *input_args(video_path),
+                '-map', '0:v:0',
+                '-an',
+                *codec_args,
+                # Parts continue each other's timestamps
+                '-output_ts_offset', str(part_start - start),
+                '-f', 'mpegts',
+                '-y',
+                part_path
+            ])
+            part_files.append(part_path)
+        
+        await run_process([
+            'ffmpeg',
+            '-i', f"concat:{'|'.join(part_files)}",
+            '-ss', str(start),
+            '-t', str(duration),
+            *input_args(video_path),
+            '-map', '0:v:0',
+            '-map', '1:a?',
+            '-c:v', 'copy',
+            '-c:a', 'aac',
+            '-b:a', get_encoding(encoding)['audio_bitrate'],
+            '-movflags', '+faststart',
+            '-y',
+            paths['video_path']
+        ])
+        
+        for part_path in part_files:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+        
+        await finish_clip(paths, moment, duration)
+        
+        render_time = time.monotonic() - started
+        logger.info(f"Clip created: {Path(paths['video_path']).name} in {render_time:.1f}s (smart render)")
+        
+        return {
+            'clip_number': i,
+            'aspect_ratio': ratio,
+            **paths,
+            'moment': moment,
+            'render_time': round(render_time, 2)
+        }
+        
+    except subprocess.CalledProcessError as e:
+        logger.error(f"FFmpeg error for smart render of clip {i} ({ratio}): {e.stderr}")
+        raise Exception(f"Failed to create clip: {str(e)}")
+
+
+def build_split_filter(aspect_ratios: List[str], profile: Optional[dict] = None) -> str:
+    """
+    Build a filter_complex graph that splits one decoded video stream
+    into a crop/scale chain per aspect ratio, labelled [out0], [out1], ...
+    """
+    count = len(aspect_ratios)
+    branches = ''.join(f'[v{n}]' for n in range(count))
+    chains = [f"[0:v]split={count}{branches}"]
+    for n, ratio in enumerate(aspect_ratios):
+        chains.append(f"[v{n}]{get_crop_filter(ratio, profile)}[out{n}]")
+    return ';'.join(chains)
+
+
+async def finish_clip(paths: dict, moment: ViralMoment, duration: float):
+    """Write the subtitle file for an encoded clip (thumbnails: see generate_clips)"""
+    # Generate subtitle file (SRT format)
+    create_subtitle_file(paths['subtitle_path'], moment.transcript, duration)
+
+
+async def write_source_thumbnails(
+    video_path: str,
+    moments: List[ViralMoment],
+    outputs: dict,
+    profile: Optional[dict] = None
+) -> bool:
+    """Single-pass sharpest-frame thumbnails; False if the pass failed"""
+    try:
+        await write_thumbnails(video_path, moments, outputs, profile)
+        return True
+    except Exception as e:
+        logger.warning(f"Source thumbnail pass failed, extracting per clip: {e}")
+        return False
+
+
+async def extract_clip_thumbnail(thumbnail_path: str, clip_path: str):
+    """Fallback: grab the frame at 00:00:01 of an encoded clip"""
+    thumbnail_cmd = [
+        'ffmpeg',
+        '-i', clip_path,
+        '-ss', '00:00:01',
+        '-vframes', '1',
+        '-vf', f'scale={settings.THUMBNAIL_WIDTH}:-1',
+        '-threads', str(settings.RENDER_THREADS_PER_ENCODE),
+        '-y',
+        thumbnail_path
+    ]
+    
+    await run_process(thumbnail_cmd)
+
+
+def get_crop_filter(aspect_ratio: str, profile: Optional[dict] = None) -> str:
+    """
+    Get FFmpeg crop filter for aspect ratio
+    
+    Supports: 9:16 (TikTok/Reels), 16:9 (YouTube), 1:1 (Instagram), 4:5 (Instagram)
+    The output size comes from get_output_size, so with a source profile
+    the source is never upscaled.
+    """
+    width, height = get_output_size(aspect_ratio, profile)
+    return f"scale={width}:{height}:force_original_aspect_ratio=increase,crop={width}:{height}"
 
 
 def create_subtitle_file(subtitle_path: str, text: str, duration: float):
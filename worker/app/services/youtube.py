@@ -1,31 +1,18 @@
+import asyncio
 import httpx
 import os
 import re
-import subprocess
 from pathlib import Path
+from typing import Optional
 from app.config import settings
+from app.services.cache import source_cache, youtube_key, direct_url_key
+from app.services.downloader import DOWNLOAD_HEADERS, download_file
+from app.services.invidious import invidious_pool
+from app.services.probe import PROFILE_FILE, get_source_profile, is_remote
+from app.services.audio import prepare_audio
+from app.services.scenes import SCENES_FILE, get_scene_index
 from app.utils.logger import logger
 
-# List of public Invidious instances - these proxy YouTube requests
-INVIDIOUS_INSTANCES = [
-    "https://inv.nadeko.net",
-    "https://yt.artemislena.eu", 
-    "https://invidious.nerdvpn.de",
-    "https://invidious.jing.rocks",
-    "https://iv.nboez.cc",
-    "https://invidious.einfachzocken.eu",
-    "https://inv.vern.cc",
-]
-
-# Browser-like headers
-DOWNLOAD_HEADERS = {
-    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/122.0.0.0 Safari/537.36",
-    "Accept": "*/*",
-    "Accept-Language": "en-US,en;q=0.9",
-    "Referer": "https://www.youtube.com/",
-}
-
-
 def extract_video_id(url: str) -> str:
     """Extract YouTube video ID from URL"""
     patterns = [
@@ -39,29 +26,43 @@ def extract_video_id(url: str) -> str:
     raise ValueError(f"Could not extract video ID from URL: {url}")
 
 
-async def download_with_invidious(video_id: str, video_path: str, audio_path: str) -> dict:
+def publish_audio(audio_ready: Optional[asyncio.Future], audio_path: str):
+    """Resolve audio_ready with audio_path once the audio file exists"""
+    if audio_ready is not None and not audio_ready.done() and os.path.exists(audio_path):
+        audio_ready.set_result(audio_path)
+
+
+async def download_with_invidious(
+    video_id: str,
+    video_path: str,
+    audio_stem: str,
+    audio_ready: Optional[asyncio.Future] = None,
+    partial: bool = False,
+    metrics: Optional[dict] = None
+) -> dict:
     """
     Download video using Invidious API (free, open-source YouTube proxy)
-    Tries multiple instances until one works
+    Tries instances from the health-scored pool until one works
+    
+    The separate audio stream is fetched before the video and published
+    through audio_ready, so transcription can start during the (much
+    larger) video download. With partial=True and a separate audio
+    stream, the video isn't downloaded at all: its stream URL is returned
+    as 'remote_video_url' for the clip stage to read ranges from.
+    
+    Audio prepared from the separate stream is recorded in metrics['audio'];
+    otherwise download_video extracts it from the video.
     """
-    last_error = None
+    metrics = {} if metrics is None else metrics
+    tried = []
     
     async with httpx.AsyncClient(timeout=120.0, headers=DOWNLOAD_HEADERS) as client:
-        for instance in INVIDIOUS_INSTANCES:
+        while True:
+            # Raced across the best instances; raises once none are left
+            instance, data = await invidious_pool.fetch_video_info(client, video_id, exclude=tried)
+            tried.append(instance)
             try:
-                logger.info(f"Trying Invidious instance: {instance}")
-                
-                # Get video info with local=true for direct stream URLs
-                response = await client.get(
-                    f"{instance}/api/v1/videos/{video_id}?local=true",
-                    follow_redirects=True
-                )
-                
-                if response.status_code != 200:
-                    logger.warning(f"{instance} returned {response.status_code}")
-                    continue
-                
-                data = response.json()
+                logger.info(f"Using Invidious instance: {instance}")
                 
                 # Get video metadata
                 title = data.get('title', 'Unknown')
@@ -103,68 +104,53 @@ async def download_with_invidious(video_id: str, video_path: str, audio_path: st
                     logger.warning(f"{instance} - no video URL found")
                     continue
                 
+                # Download audio first so transcription can start early
+                if audio_url and 'audio' not in metrics:
+                    logger.info(f"Downloading audio from: {audio_url[:100]}...")
+                    temp_audio = f"{audio_stem}.download"
+                    try:
+                        await download_file(client, audio_url, temp_audio)
+                        
+                        # Stream copy or speech re-encode (see prepare_audio)
+                        metrics['audio'] = await prepare_audio(temp_audio, audio_stem)
+                        
+                        publish_audio(audio_ready, metrics['audio']['path'])
+                        logger.info(f"Audio saved to: {metrics['audio']['path']}")
+                    except Exception as e:
+                        logger.warning(f"Audio download failed: {e}")
+                    finally:
+                        if os.path.exists(temp_audio):
+                            os.remove(temp_audio)
+                
+                if partial and 'audio' in metrics:
+                    logger.info(f"Partial fetch: clips will read from {video_url[:100]}...")
+                    return {
+                        'title': title,
+                        'duration': duration,
+                        'remote_video_url': video_url
+                    }
+                
                 # Download video
                 logger.info(f"Downloading video from: {video_url[:100]}...")
-                async with client.stream('GET', video_url, follow_redirects=True) as video_resp:
-                    if video_resp.status_code != 200:
-                        logger.warning(f"Video download failed: {video_resp.status_code}")
-                        continue
-                    
-                    with open(video_path, 'wb') as f:
-                        async for chunk in video_resp.aiter_bytes(chunk_size=16384):
-                            f.write(chunk)
+                await download_file(client, video_url, video_path)
                 
                 logger.info(f"Video downloaded to: {video_path}")
                 
-                # Download or extract audio
-                if audio_url:
-                    logger.info(f"Downloading audio from: {audio_url[:100]}...")
-                    async with client.stream('GET', audio_url, follow_redirects=True) as audio_resp:
-                        if audio_resp.status_code == 200:
-                            temp_audio = audio_path.replace('.mp3', '.m4a')
-                            with open(temp_audio, 'wb') as f:
-                                async for chunk in audio_resp.aiter_bytes(chunk_size=16384):
-                                    f.write(chunk)
-                            
-                            # Convert to MP3
-                            subprocess.run([
-                                'ffmpeg', '-i', temp_audio, '-vn', '-acodec', 'libmp3lame',
-                                '-q:a', '2', audio_path, '-y'
-                            ], capture_output=True)
-                            
-                            if os.path.exists(temp_audio):
-                                os.remove(temp_audio)
-                        else:
-                            # Extract from video
-                            logger.info("Extracting audio from video...")
-                            subprocess.run([
-                                'ffmpeg', '-i', video_path, '-vn', '-acodec', 'libmp3lame',
-                                '-q:a', '2', audio_path, '-y'
-                            ], capture_output=True)
-                else:
-                    # Extract audio from video
-                    logger.info("Extracting audio from video...")
-                    subprocess.run([
-                        'ffmpeg', '-i', video_path, '-vn', '-acodec', 'libmp3lame',
-                        '-q:a', '2', audio_path, '-y'
-                    ], capture_output=True)
-                
-                logger.info(f"Audio saved to: {audio_path}")
-                
                 return {
                     'title': title,
                     'duration': duration
                 }
                 
+            except ValueError:
+                # Video too long, no other instance will change that
+                raise
             except Exception as e:
                 logger.warning(f"{instance} failed: {str(e)}")
-                last_error = e
+                invidious_pool.record_failure(instance)
                 continue
-    
-    raise Exception(f"All Invidious instances failed. Last error: {last_error}")
 
 
-async def download_with_rapidapi(video_id: str, video_path: str, audio_path: str) -> dict:
+async def download_with_rapidapi(video_id: str, video_path: str) -> dict:
     """
     Fallback: Download using RapidAPI YTStream
     Note: This may fail with 403 due to IP restrictions
@@ -227,52 +213,111 @@ async def download_with_rapidapi(video_id: str, video_path: str, audio_path: str
         # Download with browser headers
         download_headers = {**DOWNLOAD_HEADERS, "Origin": "https://www.youtube.com"}
         async with httpx.AsyncClient(timeout=300.0, headers=download_headers) as download_client:
-            async with download_client.stream('GET', video_url, follow_redirects=True) as resp:
-                if resp.status_code != 200:
-                    raise Exception(f"Download failed: {resp.status_code}")
-                with open(video_path, 'wb') as f:
-                    async for chunk in resp.aiter_bytes(chunk_size=16384):
-                        f.write(chunk)
-        
-        # Extract audio
-        subprocess.run([
-            'ffmpeg', '-i', video_path, '-vn', '-acodec', 'libmp3lame',
-            '-q:a', '2', audio_path, '-y'
-        ], capture_output=True)
+            await download_file(download_client, video_url, video_path)
         
         return {'title': title, 'duration': duration}
 
 
-async def download_video(video_url: str, job_id: str) -> tuple[str, str]:
+async def get_direct_url_validator(video_url: str) -> str | None:
+    """ETag (or Last-Modified) of a direct URL, used to key the source cache"""
+    try:
+        async with httpx.AsyncClient(timeout=30.0, headers=DOWNLOAD_HEADERS) as client:
+            response = await client.head(video_url, follow_redirects=True)
+        if response.status_code != 200:
+            return None
+        return response.headers.get('etag') or response.headers.get('last-modified')
+    except httpx.HTTPError as e:
+        logger.warning(f"HEAD request failed for {video_url}: {e}")
+        return None
+
+
+async def download_video(
+    video_url: str,
+    job_id: str,
+    audio_ready: Optional[asyncio.Future] = None,
+    metrics: Optional[dict] = None
+) -> tuple[str, str]:
     """
     Download video from YouTube using Invidious (primary) or RapidAPI (fallback)
     Falls back to direct download for non-YouTube URLs
     
+    Sources already in the shared source cache are linked into the job
+    workspace instead of being downloaded again.
+    
+    audio_ready, if given, is resolved with the audio path as soon as the
+    audio is on disk - before the video when the source has a separate
+    audio stream - so callers can start transcribing early.
+    
+    With PARTIAL_SOURCE_FETCH, YouTube sources that have a separate audio
+    stream only download the audio; the returned video_path is then the
+    remote video URL, which FFmpeg reads with HTTP range requests for just
+    the clipped moments.
+    
+    The audio file's extension depends on how it was prepared (see
+    prepare_audio); its size and preparation time are recorded in
+    metrics['audio'] when a dict is passed. Local sources are also probed
+    (see get_source_profile) and scanned for shot cuts (see
+    get_scene_index); both results are cached with them.
+    
     Returns:
         tuple: (video_path, audio_path)
     """
     temp_dir = Path(settings.TEMP_DIR) / job_id
     temp_dir.mkdir(parents=True, exist_ok=True)
+    metrics = {} if metrics is None else metrics
     
     video_path = str(temp_dir / "video.mp4")
-    audio_path = str(temp_dir / "audio.mp3")
+    audio_stem = str(temp_dir / "audio")
     
     try:
+        is_youtube = 'youtube.com' in video_url or 'youtu.be' in video_url
+        
+        # Check the shared source cache first
+        cache_key = None
+        if settings.SOURCE_CACHE_ENABLED:
+            if is_youtube:
+                cache_key = youtube_key(extract_video_id(video_url))
+            else:
+                cache_key = direct_url_key(video_url, await get_direct_url_validator(video_url))
+        
+        if cache_key:
+            cached = source_cache.fetch(cache_key, str(temp_dir)) or {}
+            audio_path = next((path for name, path in cached.items() if name.startswith('audio.')), None)
+            if os.path.exists(video_path) and audio_path and os.path.exists(audio_path):
+                publish_audio(audio_ready, audio_path)
+                return video_path, audio_path
+        
+        # Cached files are linked read-only; never write through a stale link
+        for path in [video_path, *temp_dir.glob('audio.*')]:
+            if os.path.lexists(path):
+                os.remove(path)
+        
         # Check if it's a YouTube URL
-        if 'youtube.com' in video_url or 'youtu.be' in video_url:
+        if is_youtube:
             video_id = extract_video_id(video_url)
             logger.info(f"Detected YouTube video: {video_id}")
             
             # Try Invidious first (free, designed for servers)
             try:
-                metadata = await download_with_invidious(video_id, video_path, audio_path)
+                metadata = await download_with_invidious(
+                    video_id,
+                    video_path,
+                    audio_stem,
+                    audio_ready,
+                    partial=settings.PARTIAL_SOURCE_FETCH,
+                    metrics=metrics
+                )
                 logger.info(f"Downloaded via Invidious: {metadata['title']}")
+                if metadata.get('remote_video_url'):
+                    # Not cached: there is no local video to share
+                    video_path = metadata['remote_video_url']
+                    cache_key = None
             except Exception as inv_error:
                 logger.warning(f"Invidious failed: {inv_error}, trying RapidAPI...")
                 
                 # Fallback to RapidAPI
                 try:
-                    metadata = await download_with_rapidapi(video_id, video_path, audio_path)
+                    metadata = await download_with_rapidapi(video_id, video_path)
                     logger.info(f"Downloaded via RapidAPI: {metadata['title']}")
                 except Exception as rapid_error:
                     logger.error(f"Both download methods failed: Invidious: {inv_error}, RapidAPI: {rapid_error}")
@@ -282,26 +327,38 @@ async def download_video(video_url: str, job_id: str) -> tuple[str, str]:
             # Direct URL - use httpx to download
             logger.info(f"Downloading direct URL: {video_url}")
             async with httpx.AsyncClient(timeout=300.0, headers=DOWNLOAD_HEADERS) as client:
-                async with client.stream('GET', video_url, follow_redirects=True) as response:
-                    if response.status_code == 200:
-                        with open(video_path, 'wb') as f:
-                            async for chunk in response.aiter_bytes(chunk_size=16384):
-                                f.write(chunk)
-                        
-                        # Extract audio
-                        subprocess.run([
-                            'ffmpeg', '-i', video_path, '-vn', '-acodec', 'libmp3lame',
-                            '-q:a', '2', audio_path, '-y'
-                        ], capture_output=True)
-                    else:
-                        raise Exception(f"Failed to download: {response.status_code}")
+                await download_file(client, video_url, video_path)
         
         # Verify files exist
-        if not os.path.exists(video_path):
+        if not is_remote(video_path) and not os.path.exists(video_path):
             raise Exception("Video file was not created")
+        
+        if 'audio' not in metrics:
+            # Extract audio in the same pass that checks the video is intact
+            logger.info("Extracting audio from video...")
+            metrics['audio'] = await prepare_audio(video_path, audio_stem, validate_video=True)
+        
+        audio_path = metrics['audio']['path']
         if not os.path.exists(audio_path):
             raise Exception("Audio file was not created")
         
+        publish_audio(audio_ready, audio_path)
+        
+        cached_files = [video_path, audio_path]
+        if not is_remote(video_path):
+            # Probed once here (the audio is already out); cached with the source
+            try:
+                await get_source_profile(video_path)
+                cached_files.append(str(temp_dir / PROFILE_FILE))
+            except Exception as e:
+                logger.warning(f"Source probe failed: {e}")
+            
+            if await get_scene_index(video_path) is not None:
+                cached_files.append(str(temp_dir / SCENES_FILE))
+        
+        if cache_key:
+            source_cache.store(cache_key, cached_files)
+        
         return video_path, audio_path
         
     except Exception as e:
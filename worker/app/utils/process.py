@@ -0,0 +1,136 @@
+import asyncio
+import os
+import re
+import subprocess
+from collections import deque
+from typing import List, Optional
+from app.config import settings
+from app.utils.logger import logger
+
+
+class ProcessError(subprocess.CalledProcessError):
+    """Subprocess exited non-zero; stderr holds the tail of its output"""
+
+    def __str__(self) -> str:
+        return f"{super().__str__()}\n{self.stderr}"
+
+
+def _default_limit() -> int:
+    if settings.MAX_CONCURRENT_PROCESSES > 0:
+        return settings.MAX_CONCURRENT_PROCESSES
+    return os.cpu_count() or 1
+
+
+# Global cap on external processes (ffmpeg/ffprobe) across all jobs
+_process_semaphore = asyncio.Semaphore(_default_limit())
+
+# Bytes read from a pipe at a time; also caps one unterminated stderr line
+_READ_SIZE = 1 << 16
+
+
+async def run_process(
+    cmd: List[str],
+    timeout: Optional[float] = None,
+    check: bool = True,
+    capture_stdout: bool = False,
+    text: bool = True
+) -> subprocess.CompletedProcess:
+    """
+    Run an external command without blocking the event loop
+
+    Only the last PROCESS_STDERR_LINES lines of stderr are kept, so a
+    chatty FFmpeg run can't grow memory unbounded. Lines end at \r or \n,
+    since FFmpeg's progress output uses \r alone. On timeout, task
+    cancellation or any other error the process is killed before the
+    exception propagates.
+
+    Args:
+        cmd: Command and arguments
+        timeout: Seconds before the process is killed (default FFMPEG_TIMEOUT)
+        check: Raise ProcessError on a non-zero exit code
+        capture_stdout: Collect stdout instead of discarding it
+        text: Decode stdout as UTF-8 instead of returning bytes
+
+    Returns:
+        subprocess.CompletedProcess with returncode, stdout and stderr tail
+    """
+    if timeout is None:
+        timeout = settings.FFMPEG_TIMEOUT
+
+    async with _process_semaphore:
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE if capture_stdout else asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+        )
+
+        stderr_tail = deque(maxlen=settings.PROCESS_STDERR_LINES)
+        stdout_chunks = []
+
+        def keep_line(line: bytes):
+            line = line.decode('utf-8', errors='replace').rstrip()
+            if line:
+                stderr_tail.append(line)
+
+        async def read_stderr():
+            # Read in chunks: a line-based read hits the StreamReader limit
+            # on a long run of \r-terminated progress lines
+            partial = b''
+            while True:
+                chunk = await process.stderr.read(_READ_SIZE)
+                if not chunk:
+                    break
+                lines = re.split(rb'[\r\n]', partial + chunk)
+                partial = lines.pop()[-_READ_SIZE:]
+                for line in lines:
+                    keep_line(line)
+            keep_line(partial)
+
+        async def read_stdout():
+            if process.stdout is None:
+                return
+            while True:
+                chunk = await process.stdout.read(_READ_SIZE)
+                if not chunk:
+                    break
+                stdout_chunks.append(chunk)
+
+        communicate = asyncio.gather(read_stderr(), read_stdout(), process.wait())
+        # Mark the result retrieved if wait_for abandons it on timeout/cancel
+        communicate.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+        try:
+            await asyncio.wait_for(communicate, timeout=timeout)
+        except asyncio.TimeoutError:
+            await _kill(process)
+            logger.error(f"{cmd[0]} timed out after {timeout}s")
+            raise subprocess.TimeoutExpired(cmd, timeout, stderr='\n'.join(stderr_tail))
+        except BaseException:
+            # Cancelled, or a reader failed: never leave the child running
+            # against a pipe nobody drains
+            await _kill(process)
+            raise
+
+    stdout = b''.join(stdout_chunks)
+    stderr = '\n'.join(stderr_tail)
+
+    if check and process.returncode != 0:
+        raise ProcessError(process.returncode, cmd, output=stdout, stderr=stderr)
+
+    return subprocess.CompletedProcess(
+        cmd,
+        process.returncode,
+        stdout.decode('utf-8', errors='replace') if text else stdout,
+        stderr
+    )
+
+
+async def _kill(process: asyncio.subprocess.Process):
+    """Kill a running process and reap it"""
+    if process.returncode is None:
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+        await process.wait()
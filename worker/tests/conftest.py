@@ -0,0 +1,10 @@
+import os
+import sys
+from pathlib import Path
+
+# Settings without defaults; the tests never reach these services
+os.environ.setdefault("SUPABASE_URL", "http://localhost")
+os.environ.setdefault("GROQ_API_KEY", "test")
+os.environ.setdefault("GEMINI_API_KEY", "test")
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
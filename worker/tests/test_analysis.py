@@ -0,0 +1,63 @@
+import asyncio
+import json
+
+import pytest
+
+from app.config import settings
+from app.services.analysis import analyze_moments, to_viral_moment
+from app.services.llm import FakeProvider
+
+SEGMENTS_BY_ID = {n: {'id': n, 'start': n * 10.0, 'end': n * 10.0 + 10.0} for n in range(6)}
+
+
+def transcript(count: int = 6) -> dict:
+    segments = [
+        {'start': n * 10.0, 'end': n * 10.0 + 10.0, 'text': f'sentence {n}'}
+        for n in range(count)
+    ]
+    return {'text': ' '.join(s['text'] for s in segments), 'segments': segments}
+
+
+def test_compact_ids_resolve_to_segment_times():
+    moment = to_viral_moment({'start_id': 1, 'end_id': '3', 'viral_score': 8}, SEGMENTS_BY_ID)
+    assert (moment.start_time, moment.end_time) == (10.0, 40.0)
+    assert moment.viral_score == 8
+
+
+@pytest.mark.parametrize('item', [
+    {'start_id': 9, 'end_id': 2},
+    {'start_id': 'x', 'end_id': 2},
+    {'start_id': 1},
+    {'start_time': 5, 'end_time': 20},
+    {'start_id': 3, 'end_id': 2},
+])
+def test_compact_invalid_items_are_rejected(item):
+    with pytest.raises(ValueError):
+        to_viral_moment(item, SEGMENTS_BY_ID)
+
+
+def test_raw_times_without_segment_ids():
+    moment = to_viral_moment({'start_time': 5, 'end_time': 20.5})
+    assert (moment.start_time, moment.end_time) == (5.0, 20.5)
+
+
+def test_raw_times_are_capped_and_validated():
+    moment = to_viral_moment({'start_time': 0, 'end_time': 500})
+    assert moment.end_time == settings.MAX_CLIP_DURATION
+    with pytest.raises(ValueError):
+        to_viral_moment({'start_time': 30, 'end_time': 30})
+
+
+@pytest.mark.parametrize('encoding, answer', [
+    ('compact', {'start_id': 1, 'end_id': 3}),
+    ('json', {'start_time': 10.0, 'end_time': 40.0}),
+])
+def test_analyze_moments_in_each_encoding(monkeypatch, encoding, answer):
+    monkeypatch.setattr(settings, 'ANALYSIS_PROMPT_ENCODING', encoding)
+    monkeypatch.setattr(settings, 'PRESCORE_ENABLED', False)
+    response = json.dumps([{**answer, 'viral_score': 9, 'transcript': 'x'}])
+    providers = (FakeProvider([response]), FakeProvider([response], name='fallback'))
+
+    moments = asyncio.run(analyze_moments(transcript(), 1, providers=providers))
+
+    assert [(m.start_time, m.end_time) for m in moments] == [(10.0, 40.0)]
@@ -0,0 +1,62 @@
+import os
+
+from app.services.cache import LAST_USED_FILE, SourceCache, TranscriptCache
+
+
+def add_entry(cache: SourceCache, key: str, size: int):
+    entry = cache.root / key
+    entry.mkdir()
+    (entry / 'video.mp4').write_bytes(b'x' * size)
+    (entry / LAST_USED_FILE).touch()
+    return entry
+
+
+def half_removed_entry(cache: SourceCache, key: str):
+    """An entry another process is deleting: its files vanish under stat()"""
+    entry = add_entry(cache, key, 10)
+    os.symlink(entry / 'gone.m4a', entry / 'audio.m4a')
+    return entry
+
+
+def test_store_and_fetch(tmp_path):
+    cache = SourceCache(str(tmp_path / 'cache'), max_bytes=1 << 20)
+    source = tmp_path / 'video.mp4'
+    source.write_bytes(b'video')
+    (tmp_path / 'job').mkdir()
+
+    cache.store('yt-abc', [str(source)])
+    linked = cache.fetch('yt-abc', str(tmp_path / 'job'))
+
+    assert open(linked['video.mp4'], 'rb').read() == b'video'
+    assert cache.stats()['entries'] == 1
+
+
+def test_entries_removed_meanwhile_are_skipped(tmp_path):
+    cache = SourceCache(str(tmp_path / 'cache'), max_bytes=100)
+    half_removed_entry(cache, 'yt-gone')
+    add_entry(cache, 'yt-old', 80)
+    source = tmp_path / 'video.mp4'
+    source.write_bytes(b'y' * 50)
+
+    # Evicts yt-old to fit, and must not fail on yt-gone
+    cache.store('yt-new', [str(source)])
+
+    assert (cache.root / 'yt-new').exists()
+    assert not (cache.root / 'yt-old').exists()
+    stats = cache.stats()
+    assert stats['entries'] == 1
+    assert stats['size_bytes'] == 50
+
+
+def test_store_is_best_effort(tmp_path):
+    cache = SourceCache(str(tmp_path / 'cache'), max_bytes=1 << 20)
+    cache.store('yt-missing', [str(tmp_path / 'does-not-exist.mp4')])
+    assert not (cache.root / 'yt-missing').exists()
+
+
+def test_transcript_cache_round_trip(tmp_path):
+    cache = TranscriptCache(str(tmp_path / 'transcripts'), max_bytes=1 << 20)
+    cache.put('key', {'text': 'hello', 'segments': []})
+    assert cache.get('key') == {'text': 'hello', 'segments': []}
+    assert cache.get('other') is None
+    assert cache.stats()['entries'] == 1
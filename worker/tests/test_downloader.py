@@ -0,0 +1,84 @@
+import asyncio
+import os
+
+import httpx
+import pytest
+
+from app.config import settings
+from app.services.downloader import download_file
+
+BODY = bytes(range(256)) * 1000
+
+
+def server(unknown_total: bool = False, ranges: bool = True, truncate: int = 0):
+    """MockTransport handler serving BODY, optionally without ranges or total size"""
+    requests = []
+
+    def handle(request: httpx.Request) -> httpx.Response:
+        requests.append(request.headers.get('range'))
+        header = request.headers.get('range')
+        if not ranges or not header:
+            return httpx.Response(200, content=BODY)
+        start, end = (int(part) for part in header.split('=')[1].split('-'))
+        chunk = BODY[start:end + 1]
+        if truncate and start > 0:
+            chunk = chunk[:-truncate]
+        total = '*' if unknown_total else len(BODY)
+        return httpx.Response(206, content=chunk, headers={'Content-Range': f'bytes {start}-{end}/{total}'})
+
+    return handle, requests
+
+
+def download(handler, path: str) -> dict:
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await download_file(client, 'http://test/video.mp4', path)
+    return asyncio.run(run())
+
+
+@pytest.fixture(autouse=True)
+def small_segments(monkeypatch):
+    monkeypatch.setattr(settings, 'DOWNLOAD_SEGMENT_BYTES', 64 * 1024)
+    monkeypatch.setattr(settings, 'DOWNLOAD_MAX_RETRIES', 0)
+
+
+def test_ranged_download(tmp_path):
+    handler, requests = server()
+    path = str(tmp_path / 'video.mp4')
+
+    stats = download(handler, path)
+
+    assert open(path, 'rb').read() == BODY
+    assert stats['bytes'] == len(BODY)
+    assert len(requests) == 1 + 4
+    assert not os.path.exists(f"{path}.part")
+
+
+def test_server_without_ranges(tmp_path):
+    handler, requests = server(ranges=False)
+    path = str(tmp_path / 'video.mp4')
+
+    download(handler, path)
+
+    assert open(path, 'rb').read() == BODY
+    assert len(requests) == 1
+
+
+def test_range_probe_without_total_downloads_whole_file(tmp_path):
+    handler, requests = server(unknown_total=True)
+    path = str(tmp_path / 'video.mp4')
+
+    download(handler, path)
+
+    assert open(path, 'rb').read() == BODY
+    assert requests == ['bytes=0-0', None]
+
+
+def test_short_segments_fail_instead_of_leaving_holes(tmp_path):
+    # A server that closes segments early on every attempt
+    handler, _ = server(truncate=10)
+    path = str(tmp_path / 'video.mp4')
+
+    with pytest.raises(Exception):
+        download(handler, path)
+    assert not os.path.exists(path)
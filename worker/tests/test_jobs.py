@@ -0,0 +1,154 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import BackgroundTasks, HTTPException
+
+from app import main
+from app.config import settings
+from app.services.jobs import MemoryJobStore, SQLiteJobStore
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'memory':
+        return MemoryJobStore(ttl=3600)
+    return SQLiteJobStore(str(tmp_path / 'jobs.db'), ttl=3600)
+
+
+def create(store, job_id: str, status: str = 'pending', **fields):
+    store.create({
+        'id': job_id,
+        'status': status,
+        'progress': 0,
+        'project_id': 'project',
+        'user_id': 'user',
+        **fields
+    })
+
+
+def test_idle_seconds(store):
+    create(store, 'job')
+    assert 0 <= store.idle_seconds('job') < 5
+    assert store.idle_seconds('missing') is None
+
+
+def test_update_rejects_unknown_fields(store):
+    create(store, 'job')
+    with pytest.raises(ValueError, match='Unknown job fields: stauts'):
+        store.update('job', stauts='completed', progress=100)
+    assert store.get('job')['progress'] == 0
+
+
+def test_update_round_trips_json_fields(store):
+    create(store, 'job')
+    store.update('job', status='completed', result={'clips': [], 'total_clips': 0}, metrics={'download': 1.5})
+    job = store.get('job')
+    assert job['result'] == {'clips': [], 'total_clips': 0}
+    assert job['metrics'] == {'download': 1.5}
+
+
+def test_finished_at_cleared_when_job_restarts(store):
+    store.ttl = -60  # Every finished job counts as expired
+    create(store, 'failed')
+    create(store, 'resumed')
+    for job_id in ('failed', 'resumed'):
+        store.update(job_id, status='failed')
+    store.update('resumed', status='pending')
+
+    assert store.count_unfinished() == 1
+    assert store.purge_expired() == 1
+    assert store.get('failed') is None
+    assert store.get('resumed')['status'] == 'pending'
+
+
+@pytest.fixture
+def stalled_store(monkeypatch):
+    store = MemoryJobStore(ttl=3600)
+    monkeypatch.setattr(main, 'job_store', store)
+    request = {'video_url': 'https://youtube.com/watch?v=x', 'project_id': 'project', 'user_id': 'user'}
+    create(store, 'crashed', 'clipping', request=request)
+    create(store, 'running', 'clipping', request=request)
+    store.jobs['crashed']['updated_at'] = time.time() - settings.ENCODING_STALE_SECONDS - 1
+    return store
+
+
+def resume(job_id: str):
+    return asyncio.run(main.resume_job(job_id, BackgroundTasks(), api_key=settings.WORKER_API_KEY))
+
+
+def test_resume_accepts_stalled_unfinished_job(stalled_store):
+    assert resume('crashed').status == 'pending'
+    assert stalled_store.get('crashed')['status'] == 'pending'
+
+
+def test_resume_rejects_running_job(stalled_store):
+    with pytest.raises(HTTPException) as error:
+        resume('running')
+    assert error.value.status_code == 409
+
+
+class FakeManifest:
+    """JobManifest with every stage checkpointed except those in missing"""
+
+    clip = {
+        'clip_number': 1, 'start_time': 0.0, 'end_time': 30.0, 'duration': 30.0,
+        'transcript_snippet': 'hello', 'viral_score': 8.0, 'viral_reason': 'hook',
+        'keywords': [], 'aspect_ratio': '9:16', 'video_url': 'https://cdn/clip.mp4',
+        'thumbnail_url': 'https://cdn/clip.jpg', 'encoding': 'standard',
+    }
+    missing = ()
+
+    def __init__(self, job_id: str):
+        self.stages = {
+            'download': {'video_path': 'video.mp4', 'audio_path': 'audio.wav'},
+            'transcribe': {'text': 'hello', 'segments': []},
+            'analyze': [],
+            'upload': [self.clip],
+        }
+
+    def load(self, stage: str):
+        return None if stage in self.missing else self.stages.get(stage)
+
+    def complete(self, stage: str, outputs, **kwargs):
+        self.stages[stage] = outputs
+
+    def invalidate(self, stage: str):
+        pass
+
+
+@pytest.fixture
+def chosen(monkeypatch):
+    choices = []
+
+    def choose(priority=None, active=1):
+        choices.append(priority)
+        return 'standard'
+
+    async def clip_and_upload(job_id, video_path, moments, aspect_ratios, encoding, **kwargs):
+        return [], [main.ClipResult(**FakeManifest.clip)]
+
+    store = MemoryJobStore(ttl=3600)
+    create(store, 'job')
+    monkeypatch.setattr(main, 'job_store', store)
+    monkeypatch.setattr(main, 'JobManifest', FakeManifest)
+    monkeypatch.setattr(main, 'clip_and_upload', clip_and_upload)
+    monkeypatch.setattr(main.encoding_scheduler, 'choose', choose)
+    return choices
+
+
+def process(missing=()):
+    FakeManifest.missing = missing
+    request = main.ProcessRequest(video_url='https://youtube.com/watch?v=x', project_id='project', user_id='user')
+    asyncio.run(main.process_video_job('job', request, resume=True))
+    assert main.job_store.get('job')['status'] == 'completed'
+
+
+def test_resumed_upload_does_not_choose_encoding(chosen):
+    process()
+    assert chosen == []
+
+
+def test_rendering_chooses_encoding_once(chosen):
+    process(missing=('upload', 'clip'))
+    assert chosen == ['normal']
@@ -0,0 +1,43 @@
+import asyncio
+
+import numpy as np
+
+from app.config import settings
+from app.services.prescore import score_windows, shortlist, window_sums
+
+
+def segment(start: float, end: float, text: str) -> dict:
+    return {'start': start, 'end': end, 'text': text}
+
+
+def test_window_sums_match_direct_sums():
+    values = np.arange(10, dtype=np.float32)
+    assert window_sums(values, 4, 3).tolist() == [6.0, 18.0, 30.0]
+
+
+def test_score_windows_ranks_dense_hook_window_first(monkeypatch):
+    monkeypatch.setattr(settings, 'PRESCORE_WINDOW_SECONDS', 20)
+    monkeypatch.setattr(settings, 'PRESCORE_STRIDE_SECONDS', 10)
+    segments = [segment(t, t + 8, 'so we talked for a while') for t in range(0, 300, 20)]
+    segments.insert(6, segment(120, 138, 'Why is this the secret? The truth is shocking, never do this mistake! ' * 2))
+    windows = asyncio.run(score_windows({'segments': segments}, None))
+
+    assert windows[0]['start'] == 120 and windows[0]['end'] == 140
+    assert [w['score'] for w in windows] == sorted((w['score'] for w in windows), reverse=True)
+    assert all(w['start'] % 10 == 0 and w['end'] - w['start'] == 20 for w in windows)
+
+
+def test_score_windows_without_segments():
+    assert asyncio.run(score_windows({'segments': []}, None)) == []
+
+
+def test_shortlist_skips_overlapping_windows():
+    windows = [
+        {'start': 100, 'end': 145, 'score': 3.0},
+        {'start': 105, 'end': 150, 'score': 2.5},
+        {'start': 145, 'end': 190, 'score': 2.0},
+        {'start': 0, 'end': 45, 'score': 1.0},
+        {'start': 300, 'end': 345, 'score': 0.5},
+    ]
+    assert [w['start'] for w in shortlist(windows, 3)] == [100, 145, 0]
+    assert [w['start'] for w in shortlist(windows, 10)] == [100, 145, 0, 300]
@@ -0,0 +1,55 @@
+import asyncio
+import subprocess
+import sys
+
+import pytest
+
+from app.config import settings
+from app.utils.process import ProcessError, run_process
+
+
+def python(code: str) -> list:
+    return [sys.executable, "-c", code]
+
+
+def test_long_carriage_return_stderr_does_not_overflow():
+    # ~280 KiB of FFmpeg-style progress lines, none ending in \n
+    code = (
+        "import sys\n"
+        "for n in range(4000):\n"
+        "    sys.stderr.write(f'frame={n} fps=30 q=23.0 size=1024kB time=00:00:01.00 speed=1x\\r')\n"
+        "sys.stderr.write('done\\n')\n"
+    )
+    result = asyncio.run(run_process(python(code), timeout=30))
+
+    assert result.returncode == 0
+    assert result.stderr.splitlines()[-1] == "done"
+    assert result.stderr.splitlines()[-2].startswith("frame=3999 ")
+    assert len(result.stderr.splitlines()) == settings.PROCESS_STDERR_LINES
+
+
+def test_unterminated_stderr_line_is_capped():
+    code = "import sys; sys.stderr.write('x' * 300000)"
+    result = asyncio.run(run_process(python(code), timeout=30))
+
+    assert result.returncode == 0
+    assert 0 < len(result.stderr) <= 1 << 16
+
+
+def test_failure_keeps_stderr_tail():
+    code = "import sys; sys.stderr.write('bad input\\r'); sys.exit(3)"
+    with pytest.raises(ProcessError) as error:
+        asyncio.run(run_process(python(code), timeout=30))
+
+    assert error.value.returncode == 3
+    assert "bad input" in error.value.stderr
+
+
+def test_capture_stdout():
+    result = asyncio.run(run_process(python("print('hi')"), capture_stdout=True, timeout=30))
+    assert result.stdout == "hi\n"
+
+
+def test_timeout_kills_process():
+    with pytest.raises(subprocess.TimeoutExpired):
+        asyncio.run(run_process(python("import time; time.sleep(30)"), timeout=0.5))
@@ -0,0 +1,136 @@
+import asyncio
+
+import pytest
+
+from app.config import settings
+from app.models import ViralMoment
+from app.services import video
+from app.services.video import generate_clips, get_clip_paths, plan_spans
+
+
+def moment(start: float, end: float) -> ViralMoment:
+    return ViralMoment(
+        start_time=start, end_time=end, transcript='', viral_score=5, reason='',
+        keywords=[], hook_type='story', view_prediction=1000
+    )
+
+
+def test_plan_spans_groups_overlapping_moments():
+    moments = [moment(30, 70), moment(100, 120), moment(10, 45), moment(65, 80)]
+    spans = plan_spans(moments)
+    assert sorted([i for i, _ in span] for span in spans) == [[2], [3, 1, 4]]
+
+
+@pytest.fixture
+def fake_renders(monkeypatch, tmp_path):
+    """Replace FFmpeg renders with sleeps that record encoder threads in use"""
+    state = {'threads': 0, 'peak': 0}
+
+    async def render_clip(video_path, moment, i, ratio, output_dir, total, profile=None, encoding=None):
+        threads = video.encode_threads(encoding)
+        state['threads'] += threads
+        state['peak'] = max(state['peak'], state['threads'])
+        await asyncio.sleep(0.01)
+        state['threads'] -= threads
+        return {'clip_number': i, 'aspect_ratio': ratio, **get_clip_paths(output_dir, i, ratio),
+                'moment': moment, 'render_time': 0.01}
+
+    async def no_profile(*args):
+        raise RuntimeError('no ffprobe')
+
+    async def no_scenes(*args):
+        return None
+
+    async def thumbnails(*args):
+        return True
+
+    # asyncio primitives bind to the first loop that waits on them
+    monkeypatch.setattr(video, 'render_slots', video.RenderSlots())
+    monkeypatch.setattr(video, 'render_clip', render_clip)
+    monkeypatch.setattr(video, 'get_source_profile', no_profile)
+    monkeypatch.setattr(video, 'get_scene_index', no_scenes)
+    monkeypatch.setattr(video, 'write_source_thumbnails', thumbnails)
+    monkeypatch.setattr(settings, 'RENDER_DECODE_ONCE', False)
+    monkeypatch.setattr(settings, 'RENDER_WORKERS', 2)
+    monkeypatch.setattr(settings, 'RENDER_THREADS_PER_ENCODE', 2)
+    return state
+
+
+def test_concurrent_jobs_share_render_threads(fake_renders, tmp_path):
+    moments = [moment(n * 100, n * 100 + 30) for n in range(4)]
+
+    async def run():
+        jobs = []
+        for job in ('a', 'b', 'c'):
+            (tmp_path / job).mkdir()
+            jobs.append(generate_clips(
+                str(tmp_path / job / 'video.mp4'), moments, ['9:16', '1:1'], work_dir=str(tmp_path / job)
+            ))
+        return await asyncio.gather(*jobs)
+
+    results = asyncio.run(run())
+
+    assert [len(clips) for clips in results] == [8, 8, 8]
+    # RENDER_WORKERS=2 encodes of 2 threads, across all three jobs
+    assert fake_renders['peak'] == 4
+    assert video.render_slots.used == 0
+
+
+@pytest.fixture
+def fake_span(monkeypatch, tmp_path):
+    """render_span with FFmpeg, the keyframe probe and render_clip faked"""
+    state = {'keyframes': [], 'cuts': {}, 'reencoded': []}
+
+    async def run_process(cmd, **kwargs):
+        if '-seek_timestamp' in cmd:
+            start = float(cmd[cmd.index('-ss') + 1])
+            length = float(cmd[cmd.index('-t') + 1]) if '-t' in cmd else None
+            state['cuts'][cmd[-1].rsplit('/', 1)[1]] = (round(start, 2), length and round(length, 2))
+        open(cmd[-1], 'w').close()
+
+    async def get_keyframes(path, start, end, index=None):
+        return state['keyframes']
+
+    async def render_clip(video_path, moment, i, ratio, output_dir, total, profile=None, encoding=None):
+        state['reencoded'].append(i)
+        return {'clip_number': i, 'aspect_ratio': ratio, **get_clip_paths(output_dir, i, ratio),
+                'moment': moment, 'render_time': 0.0}
+
+    monkeypatch.setattr(video, 'run_process', run_process)
+    monkeypatch.setattr(video, 'get_keyframes', get_keyframes)
+    monkeypatch.setattr(video, 'render_clip', render_clip)
+    return state
+
+
+def render_span(tmp_path):
+    members = [(3, moment(10, 45)), (1, moment(30, 70)), (4, moment(65, 80))]
+    clips = asyncio.run(video.render_span(
+        str(tmp_path / 'video.mp4'), members, ['9:16'], tmp_path, 4, {'fps': 25.0}
+    ))
+    return sorted(clip['clip_number'] for clip in clips)
+
+
+def test_span_clips_are_cut_at_forced_keyframes(fake_span, tmp_path):
+    # Forced keyframes at span offsets 0, 20, 35, 55, 60 plus GOP keyframes,
+    # all shifted by the span's start time
+    fake_span['keyframes'] = [t + 0.04 for t in (0, 10, 20, 30, 35, 50, 55, 60)]
+
+    assert render_span(tmp_path) == [1, 3, 4]
+    assert fake_span['reencoded'] == []
+    assert fake_span['cuts'] == {
+        'clip_03_9x16.mp4': (0.04, 35.0),
+        'clip_01_9x16.mp4': (20.04, 40.0),
+        'clip_04_9x16.mp4': (55.04, None),
+    }
+
+
+def test_span_clips_without_keyframes_are_reencoded(fake_span, tmp_path):
+    # No keyframe forced at offset 20, where clip 1 starts
+    fake_span['keyframes'] = [t + 0.04 for t in (0, 10, 30, 35, 50, 55, 60)]
+    assert render_span(tmp_path) == [1, 3, 4]
+    assert fake_span['reencoded'] == [1]
+
+    fake_span['reencoded'].clear()
+    fake_span['keyframes'] = []
+    assert render_span(tmp_path) == [1, 3, 4]
+    assert sorted(fake_span['reencoded']) == [1, 3, 4]
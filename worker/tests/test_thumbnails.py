@@ -0,0 +1,54 @@
+import asyncio
+import shutil
+import subprocess
+
+import numpy as np
+import pytest
+
+from app.models import ViralMoment
+from app.services import thumbnails
+from app.services.thumbnails import candidate_times, pick_thumbnail_times, sample_frames
+
+pytestmark = pytest.mark.skipif(shutil.which('ffmpeg') is None, reason='FFmpeg not installed')
+
+
+@pytest.fixture(scope='module')
+def video(tmp_path_factory) -> str:
+    path = str(tmp_path_factory.mktemp('video') / 'source.mp4')
+    subprocess.run([
+        'ffmpeg', '-v', 'error', '-f', 'lavfi', '-i', 'testsrc2=size=320x180:rate=25',
+        '-t', '20', '-g', '50', '-pix_fmt', 'yuv420p', '-y', path
+    ], check=True)
+    return path
+
+
+def moment(start: float, end: float) -> ViralMoment:
+    return ViralMoment(
+        start_time=start, end_time=end, transcript='', viral_score=5, reason='',
+        keywords=[], hook_type='story', view_prediction=1000
+    )
+
+
+@pytest.mark.parametrize('times', [
+    [3.0],
+    candidate_times(moment(2, 14), 5),
+    [1, 2.5, 4, 6, 8, 10, 12, 14, 16, 18],
+])
+def test_sample_frames_returns_one_frame_per_time(video, times):
+    frames = asyncio.run(sample_frames(video, times, 64, 36))
+
+    assert frames.shape == (len(times), 36, 64)
+    # testsrc2 changes every frame, so no two samples are the same picture
+    assert len({frame.tobytes() for frame in frames}) == len(times)
+
+
+def test_pick_thumbnail_times_scores_every_candidate(video, monkeypatch):
+    # Make the last candidate of each moment the sharpest; the fallback
+    # (middle frame) would pick the third
+    monkeypatch.setattr(thumbnails, 'sharpness', lambda frames: np.tile(np.arange(5.0), len(frames) // 5))
+    moments = [moment(1, 9), moment(10, 19)]
+    profile = {'width': 320, 'height': 180}
+
+    times = asyncio.run(pick_thumbnail_times(video, moments, profile))
+
+    assert times == [candidate_times(m, 5)[-1] for m in moments]
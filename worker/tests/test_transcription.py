@@ -0,0 +1,37 @@
+from app.services.transcription import plan_chunks, stitch_chunks
+
+
+def segment(start: float, end: float, text: str) -> dict:
+    return {'start': start, 'end': end, 'text': text}
+
+
+def test_plan_chunks_cuts_at_latest_silence_midpoint():
+    silences = [(500, 502), (590, 594), (700, 702)]
+    # 592 beats 501; nothing within a quarter chunk before 1192, so cut hard
+    assert plan_chunks(1500, silences, 600) == [(0.0, 592.0), (592.0, 1192.0), (1192.0, 1500)]
+
+
+def test_plan_chunks_keeps_short_audio_whole():
+    assert plan_chunks(300, [(100, 102)], 600) == [(0.0, 300)]
+
+
+def test_stitch_chunks_keeps_seam_segments_once_by_midpoint():
+    cuts = [(0, 100), (100, 200)]
+    results = [
+        (0, {'segments': [segment(95, 99, 'a'), segment(99, 102, 'b')]}),
+        # Padded by 2 seconds, so it hears the end of 'a' and all of 'b' again
+        (98, {'segments': [segment(0, 1.5, 'a'), segment(1, 4, 'b'), segment(5, 8, 'c')]}),
+    ]
+    stitched = stitch_chunks(cuts, results)
+    assert stitched['segments'] == [segment(95, 99, 'a'), segment(99, 102, 'b'), segment(103, 106, 'c')]
+    assert stitched['text'] == 'a b c'
+
+
+def test_stitch_chunks_drops_text_repeated_across_seam():
+    cuts = [(0, 100), (100, 200)]
+    results = [
+        (0, {'segments': [segment(96, 99.8, 'Hello there')]}),
+        (98, {'segments': [segment(2.5, 5, 'hello there!'), segment(6, 9, 'next')]}),
+    ]
+    stitched = stitch_chunks(cuts, results)
+    assert [s['text'] for s in stitched['segments']] == ['Hello there', 'next']